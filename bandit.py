@@ -0,0 +1,87 @@
+import random
+import threading
+
+import metrics
+
+BANDIT_CHOICES_TOTAL = metrics.REGISTRY.counter('waribiz_bandit_choices_total', "Choix d'images et de variantes de thème (exploration/exploitation)")
+
+
+class ThompsonSelector:
+    """Choix d'images et de variantes de thème par échantillonnage de Thompson.
+
+    Pour chaque (page, type, option) on maintient deux agrégats : l'engagement
+    cumulé (réactions + commentaires + partages) et la portée cumulée. Chaque
+    option reçoit un tirage Beta(a + engagement, b + portée - engagement) et la
+    plus forte l'emporte. Les agrégats sont mis à jour par différence à chaque
+    rafraîchissement des statistiques : le coût d'un choix dépend du nombre
+    d'options, jamais de la taille de l'historique.
+
+    Un choix peut porter sur plusieurs pages (celles d'un utilisateur en
+    mode multi-pages) : leurs agrégats sont alors additionnés.
+
+    L'a priori Beta(prior_alpha, prior_beta) correspond à un taux d'engagement
+    attendu d'environ prior_alpha / prior_beta : une option jamais essayée
+    est explorée sans dominer durablement les options connues.
+    """
+
+    def __init__(self, prior_alpha=1.0, prior_beta=30.0, rng=None):
+        self.prior_alpha = prior_alpha
+        self.prior_beta = prior_beta
+        self.rng = rng or random.Random()
+        self._arms = {}  # (page_id, type) -> {option: [engagement, portée]}
+        self._lock = threading.Lock()
+
+    def observe(self, page_id, kind, option, engagement_delta, reach_delta):
+        """Ajoute une variation d'engagement et de portée à une option"""
+        if not option:
+            return
+        with self._lock:
+            totals = self._arms.setdefault((str(page_id), kind), {}).setdefault(option, [0, 0])
+            totals[0] += engagement_delta
+            totals[1] += reach_delta
+
+    def _merged(self, page_ids, kind):
+        # Appelé sous le verrou : agrégats additionnés des pages <page_ids> (une page ou une liste)
+        if isinstance(page_ids, (str, int)):
+            page_ids = [page_ids]
+        merged = {}
+        for page_id in dict.fromkeys(str(page_id) for page_id in page_ids):
+            for option, (engagement, reach) in self._arms.get((page_id, kind), {}).items():
+                totals = merged.setdefault(option, [0, 0])
+                totals[0] += engagement
+                totals[1] += reach
+        return merged
+
+    def choose(self, page_ids, kind, options):
+        """Tire une option parmi <options> selon l'engagement sur <page_ids> (None si la liste est vide)"""
+        if not options:
+            return None
+        if len(options) == 1:
+            return options[0]
+        with self._lock:
+            arms = self._merged(page_ids, kind)
+            best, best_draw, best_mean = None, -1.0, -1.0
+            top_mean = -1.0
+            for option in options:
+                engagement, reach = arms.get(option, (0, 0))
+                alpha = self.prior_alpha + max(engagement, 0)
+                beta = self.prior_beta + max(reach - engagement, 0)
+                draw = self.rng.betavariate(alpha, beta)
+                mean = alpha / (alpha + beta)
+                top_mean = max(top_mean, mean)
+                if draw > best_draw:
+                    best, best_draw, best_mean = option, draw, mean
+        BANDIT_CHOICES_TOTAL.inc(kind=kind, mode='exploit' if best_mean >= top_mean else 'explore')
+        return best
+
+    def stats(self, page_ids, kind):
+        """Agrégats (option, engagement, portée, taux moyen a posteriori) triés par taux décroissant"""
+        with self._lock:
+            arms = self._merged(page_ids, kind)
+        rows = []
+        for option, (engagement, reach) in arms.items():
+            alpha = self.prior_alpha + max(engagement, 0)
+            beta = self.prior_beta + max(reach - engagement, 0)
+            rows.append((option, engagement, reach, alpha / (alpha + beta)))
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows
@@ -0,0 +1,100 @@
+"""Benchmark des statistiques d'historique (/stats) sur un journal synthétique.
+
+Génère un messages.csv de --rows lignes (utilisateurs, dates, statuts et
+débuts de message variés), puis mesure séparément la lecture du journal en
+colonnes NumPy et le calcul des rapports.
+
+Usage : python benchmarks/analytics_bench.py --rows 10000000 --output bench_results.jsonl
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_bench import git_commit, current_rss_mb
+
+FIELDS = ['user_id', 'id_post', 'message', 'date_post', 'page_id', 'status', 'theme', 'image']
+OPENERS = ("🔥 Prêts à gagner gros ?", "💰 Gagnez gros sans débourser", "⚽ Reçois chaque jour", "🎯 Pronostics du jour")
+BODY = " Reçois des pronostics football gratuits avec notre bot Telegram ! Clique ici ➡️ https://t.me/Hcfa_bot"
+
+
+def generate_ledger(path, rows, users, seed):
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 1, 1)
+    with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(FIELDS)
+        for i in range(rows):
+            date_post = start + datetime.timedelta(seconds=i * 30)
+            writer.writerow([
+                str(100000000 + rng.randrange(users)), f"page_{i}", rng.choice(OPENERS) + BODY * rng.randint(1, 3),
+                date_post.strftime('%Y-%m-%d %H:%M:%S'), 'page', 'failed' if rng.random() < 0.03 else 'published',
+                'promo', 'OIP.jpeg'
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="fichier JSON Lines où ajouter le résultat")
+    args = parser.parse_args()
+
+    from history_analytics import LedgerAnalytics
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'messages.csv')
+        generate_ledger(path, args.rows, args.users, args.seed)
+        analytics = LedgerAnalytics(path)
+
+        started = time.perf_counter()
+        analytics.refresh()
+        analytics.columns()
+        load_seconds = time.perf_counter() - started
+
+        timings = {}
+        for name, report in (
+            ('posts_per_user_per_day', analytics.posts_per_user_per_day),
+            ('failure_rates', analytics.failure_rates),
+            ('length_distribution', analytics.length_distribution),
+            ('top_openers', analytics.top_openers),
+        ):
+            started = time.perf_counter()
+            report()
+            timings[name] = round(time.perf_counter() - started, 4)
+
+        results = {
+            'rows': len(analytics),
+            'ledger_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+            'load_seconds': round(load_seconds, 3),
+            'report_seconds': timings,
+            'reports_total_seconds': round(sum(timings.values()), 4),
+            'rss_mb': round(current_rss_mb(), 1)
+        }
+
+    record = {
+        'benchmark': 'analytics_bench',
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark de la compaction de messages.csv en archive colonne par colonne.
+
+Génère un journal synthétique de --rows lignes, mesure sa taille et le temps
+de lecture via l'API du journal, le compacte entièrement dans l'archive, puis
+mesure de nouveau : taille sur disque, lecture complète des lignes et
+chargement des statistiques (/stats) depuis l'archive.
+
+Usage : python benchmarks/archive_bench.py --rows 1000000 --output bench_results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_bench import git_commit
+from analytics_bench import FIELDS, generate_ledger
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--level', type=int, default=19, help="niveau de compression zstd")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="fichier JSON Lines où ajouter le résultat")
+    args = parser.parse_args()
+
+    from csv_store import CsvLedger
+    from ledger_archive import LedgerArchive
+    from history_analytics import LedgerAnalytics
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'messages.csv')
+        generate_ledger(path, args.rows, args.users, args.seed)
+        ledger = CsvLedger(path, FIELDS, archive=LedgerArchive(path, level=args.level))
+        csv_bytes = os.path.getsize(path)
+
+        csv_rows, csv_read_seconds = timed(ledger.rows)
+        _, csv_stats_seconds = timed(lambda: LedgerAnalytics(path).refresh())
+
+        report, compact_seconds = timed(lambda: ledger.archive.compact('9999-12-31 23:59:59'))
+        archive_bytes = ledger.archive.size_bytes()
+
+        archive_rows, archive_read_seconds = timed(ledger.rows)
+        _, archive_stats_seconds = timed(lambda: LedgerAnalytics(path, archive=ledger.archive).refresh())
+
+        results = {
+            'rows': len(csv_rows),
+            'rows_identical': archive_rows == csv_rows,
+            'csv_bytes': csv_bytes,
+            'archive_bytes': archive_bytes,
+            'disk_reduction': round(csv_bytes / max(archive_bytes, 1), 1),
+            'compact_seconds': round(compact_seconds, 3),
+            'read_rows_seconds': {'csv': round(csv_read_seconds, 3), 'archive': round(archive_read_seconds, 3)},
+            'read_rows_speedup': round(csv_read_seconds / max(archive_read_seconds, 1e-9), 2),
+            'stats_load_seconds': {'csv': round(csv_stats_seconds, 3), 'archive': round(archive_stats_seconds, 3)},
+            'stats_load_speedup': round(csv_stats_seconds / max(archive_stats_seconds, 1e-9), 2),
+            'ledger_bytes_after': report['ledger_bytes_after'] if report else None
+        }
+
+    record = {
+        'benchmark': 'archive_bench',
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+    if not results['rows_identical']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Test de charge de csv_store : écrivains concurrents (processus + threads).
+
+Chaque écrivain met à jour sa propre colonne d'une ligne partagée, crée ses
+propres lignes et ajoute des entrées au journal. À la fin, aucune mise à jour
+ne doit manquer.
+
+Usage : python benchmarks/csv_store_stress.py [--processes 4] [--threads 4] [--iterations 50]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from csv_store import CsvTable, CsvLedger
+
+
+def writer_fields(processes, threads):
+    """Une colonne par écrivain"""
+    return [f"w{p}_{t}" for p in range(processes) for t in range(threads)]
+
+
+def run_thread(table, ledger, writer, iterations):
+    """Boucle d'un écrivain : ligne partagée, lignes propres et journal"""
+    for i in range(1, iterations + 1):
+        table.upsert('shared', {writer: str(i)})
+        table.upsert(f"{writer}:{i}", {writer: 'own'})
+        ledger.append({'writer': writer, 'seq': str(i)})
+
+
+def run_process(directory, process_index, processes, threads, iterations):
+    """Lance les threads d'un processus écrivain"""
+    fields = ['key'] + writer_fields(processes, threads)
+    table = CsvTable(os.path.join(directory, 'table.csv'), fields, key='key')
+    ledger = CsvLedger(os.path.join(directory, 'ledger.csv'), ['writer', 'seq'])
+    workers = [
+        threading.Thread(target=run_thread, args=(table, ledger, f"w{process_index}_{t}", iterations))
+        for t in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def check(directory, processes, threads, iterations):
+    """Vérifie qu'aucune écriture n'a été perdue ; retourne la liste des erreurs"""
+    writers = writer_fields(processes, threads)
+    table = CsvTable(os.path.join(directory, 'table.csv'), ['key'] + writers, key='key')
+    ledger = CsvLedger(os.path.join(directory, 'ledger.csv'), ['writer', 'seq'])
+    rows = {row['key']: row for row in table.rows()}
+    errors = []
+
+    shared = rows.get('shared')
+    if shared is None:
+        errors.append("ligne partagée absente")
+    else:
+        for writer in writers:
+            if shared[writer] != str(iterations):
+                errors.append(f"ligne partagée: {writer}={shared[writer]!r}, attendu {iterations}")
+
+    expected_rows = 1 + len(writers) * iterations
+    if len(rows) != expected_rows:
+        errors.append(f"{len(rows)} lignes dans la table, attendu {expected_rows}")
+
+    entries = ledger.rows()
+    if len(entries) != len(writers) * iterations:
+        errors.append(f"{len(entries)} entrées dans le journal, attendu {len(writers) * iterations}")
+    seen = {(entry['writer'], entry['seq']) for entry in entries}
+    if len(seen) != len(entries):
+        errors.append("entrées dupliquées ou corrompues dans le journal")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        processes = [
+            multiprocessing.Process(target=run_process, args=(directory, p, args.processes, args.threads, args.iterations))
+            for p in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        failed = [p for p in processes if p.exitcode != 0]
+        errors = check(directory, args.processes, args.threads, args.iterations)
+        if failed:
+            errors.append(f"{len(failed)} processus écrivain(s) en échec")
+
+    writes = args.processes * args.threads * args.iterations * 3
+    print(f"{writes} écritures en {elapsed:.2f}s ({writes / elapsed:.0f}/s)")
+    if errors:
+        for error in errors:
+            print(f"ERREUR: {error}")
+        sys.exit(1)
+    print("OK: aucune mise à jour perdue")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Benchmark du partage de la file de fond de bot_v3 entre utilisateurs.
+
+Un utilisateur « lourd » (--heavy-pages pages) a --heavy-jobs publications
+automatiques en attente dès le départ ; pendant ce temps, --light
+utilisateurs d'une seule page publient chacun une fois, à raison de
+--light-rate par seconde. Compare la latence des utilisateurs légers et la
+part de la file prise par l'utilisateur lourd avec un simple tourniquet
+(une tâche par utilisateur et par tour, sans quota) et avec le partage
+pondéré (deficit round robin sur les pages visées, tâches simultanées
+limitées par utilisateur).
+
+Usage : python benchmarks/fairness_bench.py --heavy-pages 20 --heavy-jobs 40 --light 60 \\
+            --graph-latency 300 --openai-latency 500 --output bench_results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import datetime
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import StubServer, add_profile_arguments, profiles_from_args
+from load_bench import prepare_workdir, git_commit, percentiles
+
+HEAVY_USER_ID = '100000000'
+FIRST_LIGHT_USER_ID = 100000001
+
+
+async def run_mode(bot_v3, args, queue, light_ids):
+    from work_queue import BACKGROUND
+    bot_v3.WORK_QUEUE = queue
+    light_latencies = []
+    heavy_pages_published = [0]
+
+    async def heavy():
+        _, published, _ = await bot_v3.queued_publish(BACKGROUND, HEAVY_USER_ID)
+        heavy_pages_published[0] += published
+
+    async def light(user_id):
+        requested = time.perf_counter()
+        await bot_v3.queued_publish(BACKGROUND, user_id)
+        light_latencies.append(time.perf_counter() - requested)
+
+    started = time.perf_counter()
+    backlog = [asyncio.create_task(heavy()) for _ in range(args.heavy_jobs)]
+    arrivals = []
+    for user_id in light_ids:
+        await asyncio.sleep(1 / args.light_rate)
+        arrivals.append(asyncio.create_task(light(user_id)))
+    await asyncio.gather(*arrivals)
+    light_window = time.perf_counter() - started
+    # Part de la file prise par l'utilisateur lourd pendant que les légers publiaient
+    shares = {user_id: share for user_id, share, _, _, _ in queue.shares()}
+    await asyncio.gather(*backlog)
+    return {
+        'light_latency_seconds': percentiles(light_latencies),
+        'heavy_share_during_light': round(shares.get(HEAVY_USER_ID, 0.0), 3),
+        'light_window_seconds': round(light_window, 3),
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'heavy_pages_published': heavy_pages_published[0]
+    }
+
+
+async def run(args, stub_server):
+    import bot_v3
+    from fanout import FanoutPublisher
+    from work_queue import WorkQueue
+    logging.getLogger().setLevel(logging.ERROR)
+
+    bot_v3.initialize_csv_files()
+    # Quota large : le benchmark mesure le partage de la file, pas la limitation par page
+    bot_v3.FANOUT_PUBLISHER = FanoutPublisher(concurrency=args.heavy_pages, posts_per_hour=3600, burst=2 * args.heavy_jobs)
+    light_ids = [str(FIRST_LIGHT_USER_ID + i) for i in range(args.light)]
+    bot_v3.USER_CONFIGS[HEAVY_USER_ID] = {
+        'PAGE_ID': f"page-{HEAVY_USER_ID}", 'PAGE_NAME': "Page lourde", 'PAGE_ACCESS_TOKEN': 'stub-page-token',
+        'THEME': args.themes[0], 'INTERVAL_MINUTES': 30, 'AUTO_POST_ENABLED': True,
+        'PAGES': [{'PAGE_ID': f"heavy-{i}", 'PAGE_NAME': f"Page {i}", 'PAGE_ACCESS_TOKEN': 'stub-page-token'} for i in range(args.heavy_pages)]
+    }
+    for user_id in light_ids:
+        bot_v3.USER_CONFIGS[user_id] = {
+            'PAGE_ID': f"page-{user_id}", 'PAGE_NAME': f"Page {user_id}", 'PAGE_ACCESS_TOKEN': 'stub-page-token',
+            'THEME': random.choice(args.themes), 'INTERVAL_MINUTES': 60, 'AUTO_POST_ENABLED': True
+        }
+
+    # Tourniquet : un crédit par tour qui couvre toute tâche (une tâche chacun) et pas de quota de tâches simultanées
+    modes = (
+        ('round_robin', WorkQueue(args.concurrency, reserved=0, quantum=args.heavy_pages,
+                                  quotas=lambda user_id: (1.0, args.concurrency))),
+        ('fair', WorkQueue(args.concurrency, reserved=0, quantum=bot_v3.DEFAULT_CONFIG['WORK_QUANTUM'],
+                           quotas=bot_v3.work_quota)),
+    )
+    results = {label: await run_mode(bot_v3, args, queue, light_ids) for label, queue in modes}
+    results['light_p99_speedup'] = round(
+        results['round_robin']['light_latency_seconds']['p99'] / max(results['fair']['light_latency_seconds']['p99'], 1e-9), 2
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--heavy-pages', type=int, default=20, help="pages de l'utilisateur lourd")
+    parser.add_argument('--heavy-jobs', type=int, default=40, help="publications en attente de l'utilisateur lourd")
+    parser.add_argument('--light', type=int, default=60, help="utilisateurs légers (une page, une publication)")
+    parser.add_argument('--light-rate', type=float, default=10.0, help="arrivées de publications légères par seconde")
+    parser.add_argument('--concurrency', type=int, default=8, help="places de la file")
+    parser.add_argument('--themes', nargs='+', default=['promo du bot MATCH_PREDICTION_AI', 'pronostics du week-end', 'coupons du jour'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="fichier JSON Lines où ajouter le résultat")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    stub_server = StubServer(profiles=profiles_from_args(args)).start()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir, stub_server)
+        try:
+            results = asyncio.run(run(args, stub_server))
+        finally:
+            os.chdir(cwd)
+            stub_server.stop()
+
+    record = {
+        'benchmark': 'fairness_bench',
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark de la publication multi-pages de bot_v3 contre le bouchon Graph.
+
+Publie un même message (généré une seule fois) sur N pages synthétiques,
+d'abord avec la concurrence configurée puis en séquentiel (concurrence 1),
+et compare les durées. Vérifie aussi que le journal des messages contient
+une ligne par page.
+
+Usage : python benchmarks/fanout_bench.py --pages 100 --concurrency 10 \\
+            --graph-latency 300 --output bench_results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import datetime
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import StubServer, add_profile_arguments, profiles_from_args
+from load_bench import prepare_workdir, git_commit
+
+USER_ID = '100000000'
+
+
+async def run(args, stub_server):
+    import bot_v3
+    from fanout import FanoutPublisher
+    logging.getLogger().setLevel(logging.WARNING)
+
+    bot_v3.initialize_csv_files()
+    pages = [
+        {'PAGE_ID': f"page-{i}", 'PAGE_NAME': f"Page {i}", 'PAGE_ACCESS_TOKEN': f"stub-page-token-{i}"}
+        for i in range(args.pages)
+    ]
+    message = bot_v3.generate_ai_message(args.theme)
+    image = bot_v3.get_random_image()
+
+    results = {}
+    for label, concurrency in (('concurrent', args.concurrency), ('sequential', 1)):
+        # Quota large : le benchmark mesure la diffusion, pas la limitation par page
+        bot_v3.FANOUT_PUBLISHER = FanoutPublisher(concurrency=concurrency, posts_per_hour=3600, burst=args.pages)
+        before = stub_server.state.counts.get('graph:photos', 0)
+        started = time.perf_counter()
+        page_results = await bot_v3.publish_to_pages(USER_ID, message, image, pages)
+        elapsed = time.perf_counter() - started
+        statuses = {}
+        for result in page_results:
+            statuses[result.status] = statuses.get(result.status, 0) + 1
+        results[label] = {
+            'concurrency': concurrency,
+            'seconds': round(elapsed, 3),
+            'graph_calls': stub_server.state.counts.get('graph:photos', 0) - before,
+            'statuses': statuses
+        }
+
+    ledger_rows = [row for row in bot_v3.MESSAGES_LEDGER.rows() if row['user_id'] == USER_ID]
+    results['speedup'] = round(results['sequential']['seconds'] / max(results['concurrent']['seconds'], 1e-9), 2)
+    results['ledger_rows'] = len(ledger_rows)
+    results['ledger_complete'] = len(ledger_rows) == 2 * args.pages
+    results['openai_calls'] = stub_server.state.counts.get('openai:completions', 0)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=100, help="nombre de pages visées")
+    parser.add_argument('--concurrency', type=int, default=10, help="publications simultanées")
+    parser.add_argument('--theme', default='promo du bot MATCH_PREDICTION_AI')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="fichier JSON Lines où ajouter le résultat")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    stub_server = StubServer(profiles=profiles_from_args(args)).start()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir, stub_server)
+        try:
+            results = asyncio.run(run(args, stub_server))
+        finally:
+            os.chdir(cwd)
+            stub_server.stop()
+
+    record = {
+        'benchmark': 'fanout_bench',
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+    if not results['ledger_complete']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
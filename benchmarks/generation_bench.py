@@ -0,0 +1,97 @@
+"""Benchmark de la génération de messages OpenAI : réponse complète contre flux interrompu.
+
+Appelle --requests fois bot_v3.generate_ai_message contre le bouchon OpenAI,
+d'abord sans flux puis en flux. Le bouchon ajoute un commentaire après le
+lien du bot (comme un modèle qui ignore la consigne) : en flux, la lecture
+s'arrête dès que le lien est complet. Mesure le temps jusqu'au message
+publiable et les fragments réellement générés par le bouchon (≈ jetons de
+complétion facturés).
+
+Usage : python benchmarks/generation_bench.py --requests 50 --openai-latency 300 --openai-chunk-ms 15 \\
+            --output bench_results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import StubServer, add_profile_arguments, profiles_from_args
+from load_bench import prepare_workdir, git_commit, percentiles
+
+
+def run(args, stub_server):
+    import bot_v3
+    from message_validator import check_message
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Comparaison du flux seul : pas de requêtes de couverture
+    bot_v3.GENERATION_ROUTER.hedging = False
+    results = {}
+    for label, streaming in (('complete', False), ('streaming', True)):
+        for provider in bot_v3.GENERATION_ROUTER.providers:
+            provider.streaming = streaming
+        chunks_before = stub_server.state.counts.get('openai:completion_chunks', 0)
+        durations, valid = [], 0
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            message = bot_v3.generate_ai_message(args.theme)
+            durations.append(time.perf_counter() - started)
+            valid += bool(message) and not check_message(message)
+        results[label] = {
+            'seconds_to_message': percentiles(durations),
+            'valid_messages': valid,
+            'completion_chunks': stub_server.state.counts.get('openai:completion_chunks', 0) - chunks_before
+        }
+    results['completion_chunks_saved'] = round(
+        1 - results['streaming']['completion_chunks'] / max(results['complete']['completion_chunks'], 1), 3
+    )
+    results['p50_speedup'] = round(
+        results['complete']['seconds_to_message']['p50'] / max(results['streaming']['seconds_to_message']['p50'], 1e-9), 2
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=30)
+    parser.add_argument('--theme', default='promo du bot MATCH_PREDICTION_AI')
+    parser.add_argument('--output', help="fichier JSON Lines où ajouter le résultat")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    stub_server = StubServer(profiles=profiles_from_args(args)).start()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir, stub_server)
+        try:
+            results = run(args, stub_server)
+        finally:
+            os.chdir(cwd)
+            stub_server.stop()
+
+    record = {
+        'benchmark': 'generation_bench',
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+    if results['streaming']['valid_messages'] < args.requests:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
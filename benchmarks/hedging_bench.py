@@ -0,0 +1,94 @@
+"""Benchmark des requêtes de couverture (hedging) de la génération de messages.
+
+Le bouchon OpenAI a une latence de queue : une fraction --openai-tail-rate
+des requêtes attend --openai-tail-ms de plus. --requests générations sont
+lancées par --concurrency fils, sans puis avec couverture au p95. Mesure
+les percentiles de durée et l'amplification (requêtes OpenAI par message).
+
+Usage : python benchmarks/hedging_bench.py --requests 400 --concurrency 8 --openai-latency 100 \\
+            --openai-jitter 30 --openai-tail-rate 0.05 --openai-tail-ms 2000 --output bench_results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import StubServer, add_profile_arguments, profiles_from_args
+from load_bench import prepare_workdir, git_commit, percentiles
+
+
+def run(args, stub_server):
+    import bot_v3
+    from generation import build_router
+    logging.getLogger().setLevel(logging.WARNING)
+
+    def timed_generation(router):
+        started = time.perf_counter()
+        message, provider = router.generate(args.theme)
+        return time.perf_counter() - started, provider
+
+    results = {}
+    for label, hedging in (('single', False), ('hedged', True)):
+        config = dict(bot_v3.DEFAULT_CONFIG, GENERATION_HEDGING=hedging, GENERATION_PROVIDERS=['openai'])
+        router = build_router(config)
+        # Historique de latences pour fixer le seuil de couverture
+        for _ in range(router.min_samples):
+            router.generate(args.theme)
+        before = stub_server.state.counts.get('openai:completions', 0)
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            outcomes = list(pool.map(lambda _: timed_generation(router), range(args.requests)))
+        sent = stub_server.state.counts.get('openai:completions', 0) - before
+        results[label] = {
+            'seconds': percentiles([duration for duration, _ in outcomes]),
+            'generated': sum(1 for _, provider in outcomes if provider),
+            'openai_requests_per_message': round(sent / args.requests, 3),
+            'hedge_delay': router.hedge_delay('openai')
+        }
+    results['p99_speedup'] = round(results['single']['seconds']['p99'] / max(results['hedged']['seconds']['p99'], 1e-9), 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--theme', default='promo du bot MATCH_PREDICTION_AI')
+    parser.add_argument('--output', help="fichier JSON Lines où ajouter le résultat")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    stub_server = StubServer(profiles=profiles_from_args(args)).start()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir, stub_server)
+        try:
+            results = run(args, stub_server)
+        finally:
+            os.chdir(cwd)
+            stub_server.stop()
+
+    record = {
+        'benchmark': 'hedging_bench',
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
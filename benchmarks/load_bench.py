@@ -0,0 +1,205 @@
+"""Benchmark de charge de bout en bout de bot_v3 contre des bouchons locaux.
+
+Démarre les bouchons (Telegram, Graph, OpenAI), crée des milliers
+d'utilisateurs synthétiques avec l'auto-publication activée, fait tourner
+l'application Telegram réelle pendant une durée donnée et injecte des
+interactions (/start, bouton « Statut ») pour mesurer la latence des handlers.
+Les publications suivent le chemin de production : créneaux du calendrier
+dépilés par calendar_dispatch_job, retard mesuré par le LatenessMonitor,
+file de travail et journal d'idempotence.
+
+Les créneaux sont alignés sur la minute et bornés par MIN_GAP_MINUTES (30 par
+défaut) : le benchmark fixe l'écart minimal de chaque utilisateur à --interval
+et répartit les débuts de fenêtre sur l'intervalle, pour une charge régulière
+dès la première minute. Prévoir une --duration de plusieurs intervalles.
+
+Le résultat est une ligne JSON (publications/s, retard du planificateur,
+latence des handlers, mémoire) ajoutée à --output pour suivre les régressions.
+
+Usage : python benchmarks/load_bench.py --users 2000 --interval 1 --duration 180 \\
+            --openai-latency 500 --graph-latency 300 --output bench_results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import datetime
+import resource
+import tempfile
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import StubServer, add_profile_arguments, profiles_from_args
+
+FIRST_USER_ID = 100000000
+
+
+def percentiles(values):
+    """p50/p95/p99/max d'une liste de mesures (secondes)"""
+    if not values:
+        return {'count': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 6)
+
+    return {'count': len(ordered), 'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1], 6)}
+
+
+def current_rss_mb():
+    """Mémoire résidente actuelle (Linux), sinon pic de RSS"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_workdir(workdir, stub_server):
+    """Isole les CSV du benchmark et pointe bot_v3 vers les bouchons"""
+    os.symlink(os.path.join(REPO_ROOT, 'images'), os.path.join(workdir, 'images'))
+    os.chdir(workdir)
+    os.environ.update(stub_server.environment())
+    os.environ.update({
+        'OPENAI_API_KEY': 'bench-key',
+        'TELEGRAM_TOKEN': '1:bench',
+        'ADMIN_TELEGRAM_ID': '',
+        'METRICS_PORT': '0',
+    })
+
+
+def make_message_update(user_id, text):
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}] if text.startswith('/') else []
+    return {'message': {
+        'message_id': random.randint(1, 10 ** 9), 'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+        'text': text, 'entities': entities
+    }}
+
+
+def make_callback_update(user_id, data):
+    return {'callback_query': {
+        'id': str(random.randint(1, 10 ** 9)), 'chat_instance': str(user_id), 'data': data,
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+        'message': {'message_id': 1, 'date': int(time.time()), 'chat': {'id': user_id, 'type': 'private'}, 'text': 'menu'}
+    }}
+
+
+async def run(args, stub_server):
+    import bot_v3
+    logging.getLogger().setLevel(logging.WARNING)
+
+    bot_v3.initialize_csv_files()
+    bot_v3.PUBLISH_JOURNAL.load()
+    publisher_ids = [str(FIRST_USER_ID + i) for i in range(args.users)]
+    interactive_ids = [str(FIRST_USER_ID + args.users + i) for i in range(args.interactive_users)]
+    expiry = (datetime.date.today() + datetime.timedelta(days=60)).strftime('%Y-%m-%d')
+    for user_id in publisher_ids + interactive_ids:
+        bot_v3.USER_CONFIGS[user_id] = {
+            'PAGE_ID': f"page-{user_id}", 'PAGE_NAME': f"Page {user_id}", 'PAGE_ACCESS_TOKEN': 'stub-page-token',
+            'TOKEN_EXPIRY': expiry, 'THEME': random.choice(args.themes), 'INTERVAL_MINUTES': args.interval,
+            'AUTO_POST_ENABLED': user_id in publisher_ids, 'OPENAI_API_KEY': 'bench-key',
+            # Écart minimal = intervalle (sinon MIN_GAP_MINUTES espace les créneaux) ; débuts étalés sur l'intervalle
+            'MIN_GAP_MINUTES': args.interval, 'POST_WINDOWS': f"00:{random.randrange(min(args.interval, 60)):02d}-24:00"
+        }
+
+    # Créneaux du calendrier, dépilés par calendar_dispatch_job (tâche de build_application)
+    application = bot_v3.build_application(os.environ['TELEGRAM_TOKEN'])
+    for user_id in publisher_ids:
+        bot_v3.schedule_user_posts(user_id)
+
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+        bench_start = time.monotonic()
+        deadline = bench_start + args.duration
+        next_interaction = bench_start
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            if interactive_ids and args.interactive_rate > 0 and now >= next_interaction:
+                user_id = int(random.choice(interactive_ids))
+                if random.random() < 0.5:
+                    stub_server.state.inject_update(make_message_update(user_id, '/start'), user_id)
+                else:
+                    stub_server.state.inject_update(make_callback_update(user_id, 'status'), user_id)
+                next_interaction = now + 1 / args.interactive_rate
+            await asyncio.sleep(min(0.1, 1 / args.interactive_rate if args.interactive_rate else 0.1))
+        elapsed = time.monotonic() - bench_start
+        final_rss = current_rss_mb()
+        await application.updater.stop()
+        await bot_v3.OUTBOX.stop()
+        await application.stop()
+
+    counts = dict(stub_server.state.counts)
+    lateness = bot_v3.LATENESS_MONITOR.samples()
+    publishes = counts.get('graph:photos', 0)
+    return {
+        'publishes': publishes,
+        'publishes_per_second': round(publishes / elapsed, 3),
+        'publish_attempts': len(lateness),
+        'openai_calls': counts.get('openai:completions', 0),
+        'stub_errors': {k: v for k, v in counts.items() if k.endswith(':error')},
+        'telegram_messages_sent': counts.get('telegram:sendMessage', 0),
+        'scheduler_lateness_seconds': percentiles(lateness),
+        'handler_latency_seconds': percentiles(stub_server.state.handler_latencies),
+        'memory_mb': {'peak_rss': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                      'final_rss': round(final_rss, 1)},
+        'elapsed_seconds': round(elapsed, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000, help="utilisateurs avec auto-publication")
+    parser.add_argument('--interactive-users', type=int, default=50, help="utilisateurs qui cliquent dans le bot")
+    parser.add_argument('--interactive-rate', type=float, default=5.0, help="interactions injectées par seconde")
+    parser.add_argument('--interval', type=int, default=1, help="intervalle d'auto-publication (minutes)")
+    parser.add_argument('--duration', type=float, default=180.0, help="durée de la mesure (s)")
+    parser.add_argument('--themes', nargs='+', default=['promo du bot MATCH_PREDICTION_AI', 'pronostics du week-end', 'coupons du jour'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="fichier JSON Lines où ajouter le résultat")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    stub_server = StubServer(profiles=profiles_from_args(args)).start()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir, stub_server)
+        try:
+            results = asyncio.run(run(args, stub_server))
+        finally:
+            os.chdir(cwd)
+            stub_server.stop()
+
+    record = {
+        'benchmark': 'load_bench',
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
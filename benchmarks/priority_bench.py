@@ -0,0 +1,125 @@
+"""Benchmark de la file de travail de bot_v3 : « Publier maintenant » pendant une vague de publications automatiques.
+
+Lance d'un coup une vague de publications automatiques (voie de fond)
+pour --users utilisateurs, puis, pendant la vague, des demandes
+interactives à raison de --interactive-rate par seconde. Compare la
+latence de bout en bout des demandes interactives et la durée de la vague
+sans limite (comportement antérieur : tout part en même temps) et avec la
+file à deux voies (--concurrency places, dont --reserved réservées).
+
+Usage : python benchmarks/priority_bench.py --users 300 --interactive 30 \\
+            --graph-latency 300 --openai-latency 500 --output bench_results.jsonl
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import datetime
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import StubServer, add_profile_arguments, profiles_from_args
+from load_bench import prepare_workdir, git_commit, percentiles
+
+FIRST_USER_ID = 100000000
+
+
+async def run_mode(bot_v3, args, queue, background_ids, interactive_ids):
+    from work_queue import INTERACTIVE, BACKGROUND
+    bot_v3.WORK_QUEUE = queue
+    background_done = []
+    interactive_latencies = []
+    started = time.perf_counter()
+
+    async def background(user_id):
+        await bot_v3.queued_publish(BACKGROUND, user_id)
+        background_done.append(time.perf_counter() - started)
+
+    async def interactive(user_id):
+        requested = time.perf_counter()
+        await bot_v3.queued_publish(INTERACTIVE, user_id)
+        interactive_latencies.append(time.perf_counter() - requested)
+
+    wave = [asyncio.create_task(background(user_id)) for user_id in background_ids]
+    clicks = []
+    for user_id in interactive_ids:
+        await asyncio.sleep(1 / args.interactive_rate)
+        clicks.append(asyncio.create_task(interactive(user_id)))
+    await asyncio.gather(*wave, *clicks)
+    return {
+        'interactive_latency_seconds': percentiles(interactive_latencies),
+        'background_latency_seconds': percentiles(background_done),
+        'wave_seconds': round(max(background_done), 3)
+    }
+
+
+async def run(args, stub_server):
+    import bot_v3
+    from work_queue import WorkQueue
+    logging.getLogger().setLevel(logging.ERROR)
+
+    bot_v3.initialize_csv_files()
+    background_ids = [str(FIRST_USER_ID + i) for i in range(args.users)]
+    interactive_ids = [str(FIRST_USER_ID + args.users + i) for i in range(args.interactive)]
+    for user_id in background_ids + interactive_ids:
+        bot_v3.USER_CONFIGS[user_id] = {
+            'PAGE_ID': f"page-{user_id}", 'PAGE_NAME': f"Page {user_id}", 'PAGE_ACCESS_TOKEN': 'stub-page-token',
+            'THEME': random.choice(args.themes), 'INTERVAL_MINUTES': 60, 'AUTO_POST_ENABLED': True
+        }
+
+    results = {}
+    for label, queue in (('unbounded', WorkQueue(0)), ('lanes', WorkQueue(args.concurrency, reserved=args.reserved))):
+        results[label] = await run_mode(bot_v3, args, queue, background_ids, interactive_ids)
+    unbounded, lanes = results['unbounded']['interactive_latency_seconds'], results['lanes']['interactive_latency_seconds']
+    results['interactive_p99_speedup'] = round(unbounded['p99'] / max(lanes['p99'], 1e-9), 2)
+    results['graph_calls'] = stub_server.state.counts.get('graph:photos', 0)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300, help="publications automatiques de la vague")
+    parser.add_argument('--interactive', type=int, default=30, help="demandes « Publier maintenant » pendant la vague")
+    parser.add_argument('--interactive-rate', type=float, default=5.0, help="demandes interactives par seconde")
+    parser.add_argument('--concurrency', type=int, default=8, help="places de la file")
+    parser.add_argument('--reserved', type=int, default=2, help="places réservées à la voie interactive")
+    parser.add_argument('--themes', nargs='+', default=['promo du bot MATCH_PREDICTION_AI', 'pronostics du week-end', 'coupons du jour'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="fichier JSON Lines où ajouter le résultat")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    stub_server = StubServer(profiles=profiles_from_args(args)).start()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir, stub_server)
+        try:
+            results = asyncio.run(run(args, stub_server))
+        finally:
+            os.chdir(cwd)
+            stub_server.stop()
+
+    record = {
+        'benchmark': 'priority_bench',
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': results
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
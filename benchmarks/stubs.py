@@ -0,0 +1,400 @@
+"""Bouchons HTTP locaux pour les benchmarks : API Bot Telegram, API Graph et OpenAI.
+
+Un seul serveur répond aux trois services selon le préfixe du chemin :
+  /bot<token>/<méthode>          API Bot Telegram
+  /v22.0/...                     API Graph (photos, <page>/posts, oauth/access_token, me/accounts, batch)
+  /v1/chat/completions           OpenAI
+
+Chaque service a une latence (ms) et un taux d'erreur configurables ; OpenAI
+peut aussi avoir une latence de queue (une fraction des requêtes bien plus
+lente). Les réponses OpenAI sont générées à raison d'un fragment de quelques
+caractères toutes les --openai-chunk-ms ; en flux (stream=True), chaque
+fragment est envoyé en événement SSE dès qu'il est prêt.
+
+Usage autonome : python benchmarks/stubs.py --port 8089 --graph-latency 200 --openai-latency 800
+"""
+import json
+import time
+import random
+import argparse
+import threading
+import itertools
+from collections import deque
+from email.parser import BytesParser
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVICES = ('telegram', 'graph', 'openai')
+
+STUB_MESSAGE = (
+    "⚽ Reçois chaque jour des pronostics football gratuits avec notre bot Telegram ! "
+    "Des coupons avec une forte probabilité de réussite, sans rien payer. "
+    "Clique ici et active ton accès maintenant ➡️ https://t.me/Hcfa_bot"
+)
+
+# Commentaire ajouté après le lien, comme le font parfois les modèles malgré la consigne
+STUB_TRAILER = (
+    "\n\nCe message respecte toutes les consignes : emoji d'accroche, gratuité, appel à l'action "
+    "et lien du bot à la fin. N'hésite pas à me demander d'autres variantes !"
+)
+# Caractères par événement d'une réponse en flux (un jeton fait environ 4 caractères)
+STREAM_CHUNK_CHARS = 4
+
+# Réponse aux demandes de fragments (response_format json_object)
+STUB_FRAGMENTS = {
+    'openers': [
+        "⚽ Les pronos du jour sont là !", "🔥 Envie de gagner tes paris ?", "💰 Tes coupons du week-end t'attendent",
+        "🎯 Des pronostics qui visent juste", "⚽ Ne rate plus aucun bon match", "🔥 Le foot, mais en gagnant",
+        "💰 Fais fructifier ta passion du foot", "🎯 Ton coach pronostics est en ligne"
+    ],
+    'bodies': [
+        "Notre bot Telegram t'envoie chaque jour des coupons gratuits avec une forte probabilité de réussite.",
+        "Des analyses football gratuites, livrées directement sur Telegram, pour parier plus malin.",
+        "Reçois gratuitement nos meilleurs pronostics, sélectionnés match après match par notre IA.",
+        "C'est 100 % gratuit : des coupons fiables chaque matin dans ta conversation Telegram.",
+        "Rejoins des milliers de parieurs qui reçoivent nos pronostics gratuits tous les jours.",
+        "Pas d'abonnement, pas de frais : nos pronos foot sont gratuits et arrivent sur Telegram.",
+        "Championnats, coupes, grosses affiches : tout est analysé, et l'accès est gratuit.",
+        "Un bot simple, des coupons gratuits et une forte probabilité de réussite à chaque match."
+    ],
+    'ctas': ["Rejoins-nous", "Clique ici", "Active ton accès", "Lance le bot", "Inscris-toi vite", "Essaie maintenant"]
+}
+
+
+class ServiceProfile:
+    """Latence et taux d'erreur simulés pour un service"""
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, chunk_ms=0, tail_rate=0.0, tail_ms=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.chunk_ms = chunk_ms
+        # Latence de queue : une fraction <tail_rate> des requêtes attend <tail_ms> de plus
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+
+    def delay(self):
+        latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if self.tail_rate and random.random() < self.tail_rate:
+            latency += self.tail_ms
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+
+class StubState:
+    """État partagé des bouchons : compteurs, mises à jour Telegram en attente, latences mesurées"""
+
+    def __init__(self, profiles=None):
+        self.profiles = {name: ServiceProfile() for name in SERVICES}
+        self.profiles.update(profiles or {})
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.ids = itertools.count(1)
+        self.pending_updates = deque()
+        self.updates_available = threading.Condition(self.lock)
+        self.awaiting_reply = {}  # chat_id -> deque d'horodatages d'injection
+        self.handler_latencies = []
+        self.posts = {}  # page_id -> publications reçues (relues par <page>/posts)
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + amount
+
+    def next_id(self):
+        with self.lock:
+            return next(self.ids)
+
+    def inject_update(self, update, chat_id):
+        """Met à disposition une mise à jour pour getUpdates et attend une réponse du bot dans ce chat"""
+        with self.lock:
+            update['update_id'] = next(self.ids)
+            self.pending_updates.append(update)
+            self.awaiting_reply.setdefault(str(chat_id), deque()).append(time.perf_counter())
+            self.updates_available.notify_all()
+
+    def take_updates(self, timeout):
+        with self.lock:
+            if not self.pending_updates:
+                self.updates_available.wait(timeout)
+            updates = list(self.pending_updates)
+            self.pending_updates.clear()
+            return updates
+
+    def add_post(self, page_id, message):
+        post_id = f"{page_id}_{self.next_id()}"
+        with self.lock:
+            self.posts.setdefault(page_id, []).append({
+                'id': post_id,
+                'message': message,
+                'created_time': time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime())
+            })
+        return post_id
+
+    def page_posts(self, page_id):
+        with self.lock:
+            return list(reversed(self.posts.get(page_id, [])))
+
+    def record_reply(self, chat_id):
+        with self.lock:
+            waiting = self.awaiting_reply.get(str(chat_id))
+            if waiting:
+                self.handler_latencies.append(time.perf_counter() - waiting.popleft())
+
+
+def _multipart_fields(body, content_type):
+    """Champs texte d'un corps multipart/form-data (les fichiers sont ignorés)"""
+    message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body)
+    return {
+        part.get_param('name', header='content-disposition'): part.get_payload(decode=True).decode('utf-8')
+        for part in message.get_payload()
+        if not part.get_filename()
+    }
+
+
+def _parse_value(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _params(self):
+        parsed = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        content_type = self.headers.get('Content-Type', '')
+        if body and content_type.startswith('application/json'):
+            params.update(json.loads(body))
+        elif body and content_type.startswith('application/x-www-form-urlencoded'):
+            params.update({k: _parse_value(v[0]) for k, v in parse_qs(body.decode('utf-8')).items()})
+        elif body and content_type.startswith('multipart/form-data'):
+            params['_multipart_bytes'] = len(body)
+            params.update(_multipart_fields(body, content_type))
+        return parsed.path, params
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        path, params = self._params()
+        if path.startswith('/bot'):
+            service, handler = 'telegram', self._telegram
+        elif path.startswith('/v1/'):
+            service, handler = 'openai', self._openai
+        else:
+            service, handler = 'graph', self._graph
+        profile = self.state.profiles[service]
+        # getUpdates est un long-polling : pas de latence simulée
+        if not path.endswith('/getUpdates'):
+            profile.delay()
+            if profile.should_fail():
+                self.state.count(f"{service}:error")
+                self._send_json({'error': {'message': 'stub failure', 'code': 500}}, status=500)
+                return
+        handler(path, params)
+
+    def _telegram(self, path, params):
+        method = path.rsplit('/', 1)[-1]
+        self.state.count(f"telegram:{method}")
+        now = int(time.time())
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+                      'can_join_groups': False, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+        elif method == 'getUpdates':
+            timeout = min(float(params.get('timeout') or 0), 1.0)
+            result = self.state.take_updates(timeout)
+        elif method in ('sendMessage', 'editMessageText'):
+            chat_id = params.get('chat_id', 0)
+            self.state.record_reply(chat_id)
+            result = {'message_id': self.state.next_id(), 'date': now,
+                      'chat': {'id': int(chat_id), 'type': 'private'}, 'text': str(params.get('text', ''))}
+        else:
+            result = True
+        self._send_json({'ok': True, 'result': result})
+
+    def _graph(self, path, params):
+        if path.endswith('/photos'):
+            self.state.count('graph:photos')
+            post_id = self.state.add_post(path.split('/')[-2], params.get('message', ''))
+            self._send_json({'id': post_id.split('_')[-1], 'post_id': post_id})
+        elif path.endswith('/posts'):
+            self.state.count('graph:posts')
+            self._send_json({'data': self.state.page_posts(path.split('/')[-2])})
+        elif path.endswith('/oauth/access_token'):
+            self.state.count('graph:oauth')
+            self._send_json({'access_token': f"stub-token-{self.state.next_id()}", 'token_type': 'bearer', 'expires_in': 5184000})
+        elif path.endswith('/me/accounts'):
+            self.state.count('graph:accounts')
+            self._send_json({'data': [{'id': '1000', 'name': 'Page bench', 'access_token': 'stub-page-token'}]})
+        elif 'batch' in params:
+            # Appel groupé : une réponse par requête, statistiques aléatoires
+            self.state.count('graph:batch')
+            requests_batch = params['batch'] if isinstance(params['batch'], list) else json.loads(params['batch'])
+            self._send_json([
+                {'code': 200, 'body': json.dumps({
+                    'id': item['relative_url'].split('?')[0],
+                    'reactions': {'data': [], 'summary': {'total_count': random.randint(0, 200)}},
+                    'comments': {'data': [], 'summary': {'total_count': random.randint(0, 40)}},
+                    'shares': {'count': random.randint(0, 20)},
+                    'insights': {'data': [{'name': 'post_impressions_unique', 'values': [{'value': random.randint(100, 5000)}]}]}
+                })}
+                for item in requests_batch
+            ])
+        else:
+            self.state.count('graph:other')
+            self._send_json({'data': []})
+
+    def _openai(self, path, params):
+        self.state.count('openai:completions')
+        json_mode = (params.get('response_format') or {}).get('type') == 'json_object'
+        content = json.dumps(STUB_FRAGMENTS, ensure_ascii=False) if json_mode else STUB_MESSAGE + STUB_TRAILER
+        if params.get('stream'):
+            self._openai_stream(params, content)
+            return
+        # Sans flux, la réponse n'arrive qu'une fois entièrement générée
+        chunks = -(-len(content) // STREAM_CHUNK_CHARS)
+        self.state.count('openai:completion_chunks', chunks)
+        if self.state.profiles['openai'].chunk_ms:
+            time.sleep(chunks * self.state.profiles['openai'].chunk_ms / 1000)
+        self._send_json({
+            'id': f"chatcmpl-{self.state.next_id()}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': params.get('model', 'gpt-4o-mini'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 200, 'completion_tokens': 80, 'total_tokens': 280}
+        })
+
+
+    def _openai_stream(self, params, content):
+        """Réponse en flux (Server-Sent Events) ; le client peut fermer la connexion avant la fin"""
+        completion_id = f"chatcmpl-{self.state.next_id()}"
+        delay = self.state.profiles['openai'].chunk_ms / 1000
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        try:
+            for index, piece in enumerate(pieces + [None]):
+                event = {
+                    'id': completion_id,
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': params.get('model', 'gpt-4o-mini'),
+                    'choices': [{
+                        'index': 0,
+                        'delta': {'content': piece} if piece is not None else {},
+                        'finish_reason': None if piece is not None else 'stop'
+                    }]
+                }
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                if piece is not None:
+                    self.state.count('openai:completion_chunks')
+                    if delay:
+                        time.sleep(delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.state.count('openai:stream_aborted')
+
+
+class StubServer:
+    """Serveur des bouchons, exécuté dans un thread d'arrière-plan"""
+
+    def __init__(self, host='127.0.0.1', port=0, profiles=None):
+        self.state = StubState(profiles)
+        handler = type('BoundStubHandler', (StubHandler,), {'state': self.state})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self):
+        """Variables d'environnement pointant bot_v3 vers les bouchons"""
+        return {
+            'FACEBOOK_GRAPH_URL': f"{self.url}/v22.0",
+            'OPENAI_BASE_URL': f"{self.url}/v1",
+            'TELEGRAM_API_URL': f"{self.url}/bot",
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='stub-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_profile_arguments(parser):
+    """Options de latence et d'erreurs communes aux scripts de benchmark"""
+    for service in SERVICES:
+        parser.add_argument(f"--{service}-latency", type=float, default=0, help=f"latence {service} (ms)")
+        parser.add_argument(f"--{service}-jitter", type=float, default=0, help=f"gigue {service} (ms)")
+        parser.add_argument(f"--{service}-error-rate", type=float, default=0.0, help=f"taux d'erreur {service} (0-1)")
+    parser.add_argument('--openai-chunk-ms', type=float, default=0, help="délai entre deux fragments d'une réponse OpenAI en flux (ms)")
+    parser.add_argument('--openai-tail-rate', type=float, default=0.0, help="part des requêtes OpenAI anormalement lentes (0-1)")
+    parser.add_argument('--openai-tail-ms', type=float, default=0, help="latence supplémentaire de ces requêtes (ms)")
+
+
+def profiles_from_args(args):
+    return {
+        service: ServiceProfile(
+            getattr(args, f"{service}_latency"),
+            getattr(args, f"{service}_jitter"),
+            getattr(args, f"{service}_error_rate"),
+            args.openai_chunk_ms if service == 'openai' else 0,
+            args.openai_tail_rate if service == 'openai' else 0.0,
+            args.openai_tail_ms if service == 'openai' else 0
+        )
+        for service in SERVICES
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    server = StubServer(args.host, args.port, profiles_from_args(args))
+    for name, value in server.environment().items():
+        print(f"{name}={value}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
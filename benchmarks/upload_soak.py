@@ -0,0 +1,109 @@
+"""Test d'endurance de l'envoi d'images en flux (descripteurs et mémoire).
+
+Publie en boucle les images de images/ vers le bouchon Graph local avec
+plusieurs workers et échantillonne le nombre de descripteurs ouverts et la
+mémoire résidente. Un envoi qui fuit un descripteur fait croître fd_count.
+
+Usage : python benchmarks/upload_soak.py --duration 86400 --workers 8 --output soak.jsonl
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import threading
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+from streaming_upload import post_file
+from stubs import StubServer, add_profile_arguments, profiles_from_args
+from load_bench import current_rss_mb, git_commit
+
+
+def fd_count():
+    """Nombre de descripteurs ouverts par le processus (Linux)"""
+    return len(os.listdir('/proc/self/fd'))
+
+
+def worker(url, images, stop, counters, lock):
+    session = requests.Session()
+    while not stop.is_set():
+        image = random.choice(images)
+        try:
+            response, _, _ = post_file(url, {'message': 'soak', 'access_token': 'stub'}, 'source', image, session=session, timeout=30)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        with lock:
+            counters['uploads' if ok else 'errors'] += 1
+            counters['bytes'] += os.path.getsize(image) if ok else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=86400, help="durée totale (s), 24 h par défaut")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--sample-every', type=float, default=10, help="intervalle d'échantillonnage (s)")
+    parser.add_argument('--output', help="fichier JSON Lines où ajouter le résultat")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    images_dir = os.path.join(REPO_ROOT, 'images')
+    images = [os.path.join(images_dir, f) for f in os.listdir(images_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    server = StubServer(profiles=profiles_from_args(args)).start()
+    url = f"{server.url}/v22.0/1000/photos"
+    stop = threading.Event()
+    lock = threading.Lock()
+    counters = {'uploads': 0, 'errors': 0, 'bytes': 0}
+    threads = [threading.Thread(target=worker, args=(url, images, stop, counters, lock), daemon=True) for _ in range(args.workers)]
+
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    # Laisser les connexions keep-alive s'établir avant la mesure de référence
+    time.sleep(min(args.sample_every, args.duration))
+    samples = []
+    while True:
+        samples.append({'t': round(time.monotonic() - started, 1), 'fd_count': fd_count(), 'rss_mb': round(current_rss_mb(), 1)})
+        if time.monotonic() - started >= args.duration:
+            break
+        time.sleep(min(args.sample_every, max(0.0, args.duration - (time.monotonic() - started))))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    server.stop()
+    elapsed = time.monotonic() - started
+
+    fds = [s['fd_count'] for s in samples]
+    rss = [s['rss_mb'] for s in samples]
+    record = {
+        'benchmark': 'upload_soak',
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'parameters': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': {
+            'uploads': counters['uploads'],
+            'errors': counters['errors'],
+            'uploads_per_second': round(counters['uploads'] / elapsed, 2),
+            'megabytes_sent': round(counters['bytes'] / 2 ** 20, 1),
+            'fd_count': {'first': fds[0], 'last': fds[-1], 'min': min(fds), 'max': max(fds)},
+            'rss_mb': {'first': rss[0], 'last': rss[-1], 'max': max(rss)},
+            'fd_leak_suspected': fds[-1] > fds[0] + args.workers,
+            'elapsed_seconds': round(elapsed, 1)
+        }
+    }
+    line = json.dumps(record, ensure_ascii=False)
+    print(line)
+    if args.output:
+        with open(args.output, 'a', encoding='utf-8') as output:
+            output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
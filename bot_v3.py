@@ -1,26 +1,43 @@
+from __future__ import annotations
+
 import os
 import time
+# Début du démarrage, pour le profil de démarrage (/startup, --profile-startup)
+STARTED_AT = time.perf_counter()
 import random
-import csv
+import sys
 import datetime
-import requests
 import asyncio
 import logging
 import json
 from urllib.parse import urlencode
 from dotenv import load_dotenv
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import JobQueue
-from telegram.ext import (
-    Application, 
-    CommandHandler, 
-    CallbackQueryHandler, 
-    MessageHandler, 
-    filters, 
-    ContextTypes,
-    ConversationHandler
-)
+from csv_store import CsvTable, CsvLedger
+from message_cache import GenerationCache
+import metrics
+from scheduler_monitor import LatenessMonitor
+from telegram_outbox import TelegramOutbox
+from image_cache import ImageCache
+from fanout import FanoutPublisher
+from post_calendar import PostCalendar, PostingRules, RulesError
+from engagement import EngagementStore, fetch_engagement, MAX_BATCH_SIZE
+from bandit import ThompsonSelector
+from ledger_archive import LedgerArchive
+from message_templates import FragmentBank, FRAGMENTS_PROMPT, parse_fragments
+from generation import build_router, generate_valid_message
+from circuit_breaker import BreakerRegistry, CircuitOpenError
+from deadline import Deadline, DeadlineExceeded
+from publisher import GraphPublisher
+from publish_journal import PublishJournal, UNSETTLED, RECONCILE_TOTAL
+from startup_profile import StartupProfile
+from work_queue import WorkQueue, INTERACTIVE, BACKGROUND
+
+if TYPE_CHECKING:
+    # Annotations des handlers uniquement : telegram.ext est importé dans build_application
+    from telegram.ext import ContextTypes
 
 # Configuration du logging
 logging.basicConfig(
@@ -30,7 +47,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # États de conversation
-THEME, INTERVAL, WAITING_FOR_THEME, WAITING_FOR_INTERVAL = range(4)
+THEME, INTERVAL, WAITING_FOR_THEME, WAITING_FOR_INTERVAL, WAITING_FOR_SCHEDULE = range(5)
 
 # Charger les variables d'environnement
 load_dotenv()
@@ -42,116 +59,321 @@ DEFAULT_CONFIG = {
     'IMAGES_FOLDER': 'images',
     'MESSAGES_CSV': 'messages.csv',
     'USERS_CSV': 'users.csv',
+    'PAGES_CSV': 'pages.csv',
     'AUTO_POST_ENABLED': False,
     'FACEBOOK_APP_ID': os.getenv('FACEBOOK_APP_ID', ''),
     'FACEBOOK_APP_SECRET': os.getenv('FACEBOOK_APP_SECRET', ''),
     'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY', ''),
-    'ADMIN_TELEGRAM_ID': os.getenv('ADMIN_TELEGRAM_ID', '')
+    'OPENAI_BASE_URL': os.getenv('OPENAI_BASE_URL', ''),
+    'OPENAI_MODEL': os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
+    'LOCAL_LLM_BASE_URL': os.getenv('LOCAL_LLM_BASE_URL', ''),
+    'LOCAL_LLM_MODEL': os.getenv('LOCAL_LLM_MODEL', ''),
+    'LOCAL_LLM_API_KEY': os.getenv('LOCAL_LLM_API_KEY', ''),
+    'TELEGRAM_API_URL': os.getenv('TELEGRAM_API_URL', ''),
+    'ADMIN_TELEGRAM_ID': os.getenv('ADMIN_TELEGRAM_ID', ''),
+    'LANGUAGE': os.getenv('LANGUAGE', 'fr'),
+    'MESSAGE_CACHE_SIZE': int(os.getenv('MESSAGE_CACHE_SIZE', '256')),
+    'MESSAGE_CACHE_TTL_MINUTES': int(os.getenv('MESSAGE_CACHE_TTL_MINUTES', '360')),
+    'MESSAGE_REUSE_WINDOW_HOURS': int(os.getenv('MESSAGE_REUSE_WINDOW_HOURS', '168')),
+    'METRICS_PORT': int(os.getenv('METRICS_PORT', '0')),
+    'LATENESS_ALERT_SECONDS': int(os.getenv('LATENESS_ALERT_SECONDS', '60')),
+    'LATENESS_ALERT_COOLDOWN_MINUTES': int(os.getenv('LATENESS_ALERT_COOLDOWN_MINUTES', '60')),
+    'TELEGRAM_GLOBAL_RATE': float(os.getenv('TELEGRAM_GLOBAL_RATE', '25')),
+    'TELEGRAM_CHAT_RATE': float(os.getenv('TELEGRAM_CHAT_RATE', '1')),
+    'DIGEST_INTERVAL_MINUTES': int(os.getenv('DIGEST_INTERVAL_MINUTES', '0')),
+    'IMAGE_CACHE_MB': int(os.getenv('IMAGE_CACHE_MB', '64')),
+    'FANOUT_CONCURRENCY': int(os.getenv('FANOUT_CONCURRENCY', '10')),
+    'FANOUT_PAGE_POSTS_PER_HOUR': int(os.getenv('FANOUT_PAGE_POSTS_PER_HOUR', '30')),
+    'TIMEZONE': os.getenv('TIMEZONE', 'UTC'),
+    'MIN_GAP_MINUTES': int(os.getenv('MIN_GAP_MINUTES', '30')),
+    'CALENDAR_HORIZON_HOURS': min(72, max(24, int(os.getenv('CALENDAR_HORIZON_HOURS', '48')))),
+    'CALENDAR_TICK_SECONDS': int(os.getenv('CALENDAR_TICK_SECONDS', '5')),
+    'ENGAGEMENT_STORE': os.getenv('ENGAGEMENT_STORE', 'engagement.bin'),
+    'ENGAGEMENT_POLL_MINUTES': int(os.getenv('ENGAGEMENT_POLL_MINUTES', '30')),
+    'ENGAGEMENT_BATCH_SIZE': min(MAX_BATCH_SIZE, int(os.getenv('ENGAGEMENT_BATCH_SIZE', '50'))),
+    'ENGAGEMENT_SELECTION': os.getenv('ENGAGEMENT_SELECTION', 'true').lower() == 'true',
+    'LEDGER_ARCHIVE_DAYS': int(os.getenv('LEDGER_ARCHIVE_DAYS', '30')),
+    'TEMPLATE_ENGINE': os.getenv('TEMPLATE_ENGINE', 'true').lower() == 'true',
+    'FRAGMENTS_FILE': os.getenv('FRAGMENTS_FILE', 'fragments.json'),
+    'FRAGMENTS_PER_SLOT': int(os.getenv('FRAGMENTS_PER_SLOT', '8')),
+    'FRAGMENTS_MAX_AGE_HOURS': int(os.getenv('FRAGMENTS_MAX_AGE_HOURS', '168')),
+    'GENERATION_ATTEMPTS': max(1, int(os.getenv('GENERATION_ATTEMPTS', '2'))),
+    'GENERATION_STREAMING': os.getenv('GENERATION_STREAMING', 'true').lower() == 'true',
+    'GENERATION_PROVIDERS': [name.strip() for name in os.getenv('GENERATION_PROVIDERS', 'openai,local,templates').split(',') if name.strip()],
+    'GENERATION_HEDGING': os.getenv('GENERATION_HEDGING', 'true').lower() == 'true',
+    'GENERATION_TEMPLATE_FALLBACK': os.getenv('GENERATION_TEMPLATE_FALLBACK', 'true').lower() == 'true',
+    'GENERATION_BREAKER_FAILURES': int(os.getenv('GENERATION_BREAKER_FAILURES', '5')),
+    'GENERATION_BREAKER_RESET_SECONDS': int(os.getenv('GENERATION_BREAKER_RESET_SECONDS', '60')),
+    'GRAPH_BREAKER_FAILURES': int(os.getenv('GRAPH_BREAKER_FAILURES', '5')),
+    'GRAPH_BREAKER_RESET_SECONDS': int(os.getenv('GRAPH_BREAKER_RESET_SECONDS', '120')),
+    # Budget total d'une publication (génération + envoi) et délais de chaque appel sortant
+    'PUBLISH_BUDGET_SECONDS': float(os.getenv('PUBLISH_BUDGET_SECONDS', '120')),
+    'GENERATION_TIMEOUT_SECONDS': float(os.getenv('GENERATION_TIMEOUT_SECONDS', '45')),
+    'HTTP_CONNECT_TIMEOUT_SECONDS': float(os.getenv('HTTP_CONNECT_TIMEOUT_SECONDS', '5')),
+    'GRAPH_TIMEOUT_SECONDS': float(os.getenv('GRAPH_TIMEOUT_SECONDS', '30')),
+    'UPLOAD_TIMEOUT_SECONDS': float(os.getenv('UPLOAD_TIMEOUT_SECONDS', '60')),
+    # Journal d'idempotence : un créneau n'est publié qu'une fois, même après un délai dépassé ou un redémarrage
+    'PUBLISH_JOURNAL_FILE': os.getenv('PUBLISH_JOURNAL_FILE', 'publish_journal.csv'),
+    'PUBLISH_JOURNAL_DAYS': int(os.getenv('PUBLISH_JOURNAL_DAYS', '7')),
+    'PUBLISH_RETRY_SECONDS': int(os.getenv('PUBLISH_RETRY_SECONDS', '60')),
+    'PUBLISH_RECOVERY_HOURS': int(os.getenv('PUBLISH_RECOVERY_HOURS', '6')),
+    # Générations et publications simultanées (0 : sans limite), dont les places réservées à « Publier maintenant »
+    'WORK_CONCURRENCY': int(os.getenv('WORK_CONCURRENCY', '8')),
+    'WORK_INTERACTIVE_RESERVED': int(os.getenv('WORK_INTERACTIVE_RESERVED', '2')),
+    # Partage des places de fond entre utilisateurs : crédit par tour (en pages), poids et tâches simultanées par défaut
+    'WORK_QUANTUM': float(os.getenv('WORK_QUANTUM', '1')),
+    'WORK_DEFAULT_WEIGHT': float(os.getenv('WORK_DEFAULT_WEIGHT', '1')),
+    'WORK_MAX_RUNNING_PER_USER': int(os.getenv('WORK_MAX_RUNNING_PER_USER', '2')),
+    # Demi-vie des parts de fond affichées par /quota
+    'WORK_SHARE_HALF_LIFE_MINUTES': float(os.getenv('WORK_SHARE_HALF_LIFE_MINUTES', '60'))
 }
 
+# Version du prompt de génération : à incrémenter à chaque modification du prompt
+# pour invalider les messages mis en cache
+PROMPT_VERSION = 1
+
 # Liens pour l'authentification Facebook
 FACEBOOK_OAUTH_URL = "https://www.facebook.com/v22.0/dialog/oauth"
-FACEBOOK_GRAPH_URL = "https://graph.facebook.com/v22.0"
+FACEBOOK_GRAPH_URL = os.getenv('FACEBOOK_GRAPH_URL', "https://graph.facebook.com/v22.0")
 REDIRECT_URI = os.getenv('REDIRECT_URI', 'https://your-redirect-uri.com/facebook_callback')
 
 # Dictionnaire pour stocker les configurations spécifiques à chaque utilisateur
 USER_CONFIGS = {}
 
+USERS_FIELDS = ['telegram_id', 'page_id', 'page_name', 'long_lived_token', 'token_expiry', 'theme', 'interval_minutes', 'auto_post_enabled',
+                'post_windows', 'post_days', 'timezone', 'min_gap_minutes', 'queue_weight', 'queue_max_running']
+MESSAGES_FIELDS = ['user_id', 'id_post', 'message', 'date_post', 'page_id', 'status', 'theme', 'image']
+# Pages du mode multi-pages (une ligne par couple utilisateur/page)
+PAGES_FIELDS = ['key', 'telegram_id', 'page_id', 'page_name', 'page_access_token', 'enabled']
+
+# Correspondance entre les clés de configuration et les colonnes de users.csv
+USER_CONFIG_COLUMNS = {
+    'THEME': 'theme',
+    'INTERVAL_MINUTES': 'interval_minutes',
+    'AUTO_POST_ENABLED': 'auto_post_enabled',
+    'POST_WINDOWS': 'post_windows',
+    'POST_DAYS': 'post_days',
+    'TIMEZONE': 'timezone',
+    'MIN_GAP_MINUTES': 'min_gap_minutes',
+    'QUEUE_WEIGHT': 'queue_weight',
+    'QUEUE_MAX_RUNNING': 'queue_max_running'
+}
+
+# Persistance CSV (verrous inter-processus et remplacement atomique)
+USERS_TABLE = CsvTable(DEFAULT_CONFIG['USERS_CSV'], USERS_FIELDS, key='telegram_id')
+MESSAGES_LEDGER = CsvLedger(DEFAULT_CONFIG['MESSAGES_CSV'], MESSAGES_FIELDS, archive=LedgerArchive(DEFAULT_CONFIG['MESSAGES_CSV']))
+PAGES_TABLE = CsvTable(DEFAULT_CONFIG['PAGES_CSV'], PAGES_FIELDS, key='key')
+
+# Cache des messages générés, partagé entre les utilisateurs d'un même thème
+MESSAGE_CACHE = GenerationCache(
+    max_keys=DEFAULT_CONFIG['MESSAGE_CACHE_SIZE'],
+    ttl_seconds=DEFAULT_CONFIG['MESSAGE_CACHE_TTL_MINUTES'] * 60,
+    reuse_window_seconds=DEFAULT_CONFIG['MESSAGE_REUSE_WINDOW_HOURS'] * 3600
+)
+
+# Suivi du retard des publications automatiques (heure prévue vs heure effective)
+LATENESS_MONITOR = LatenessMonitor(
+    alert_threshold_seconds=DEFAULT_CONFIG['LATENESS_ALERT_SECONDS'],
+    alert_cooldown_seconds=DEFAULT_CONFIG['LATENESS_ALERT_COOLDOWN_MINUTES'] * 60
+)
+
+# File d'envoi des notifications Telegram (limites de débit, retry_after, résumés)
+OUTBOX = TelegramOutbox(
+    global_rate=DEFAULT_CONFIG['TELEGRAM_GLOBAL_RATE'],
+    per_chat_rate=DEFAULT_CONFIG['TELEGRAM_CHAT_RATE'],
+    digest_interval_seconds=DEFAULT_CONFIG['DIGEST_INTERVAL_MINUTES'] * 60
+)
+
+# Cache mémoire des images, borné en octets, partagé par toutes les publications
+IMAGE_CACHE = ImageCache(max_bytes=DEFAULT_CONFIG['IMAGE_CACHE_MB'] * 1024 * 1024)
+
+# Publication d'un même message sur plusieurs pages en parallèle
+FANOUT_PUBLISHER = FanoutPublisher(
+    concurrency=DEFAULT_CONFIG['FANOUT_CONCURRENCY'],
+    posts_per_hour=DEFAULT_CONFIG['FANOUT_PAGE_POSTS_PER_HOUR']
+)
+
+# Créneaux d'auto-publication précalculés (fenêtres horaires, jours, fuseau, écart minimal)
+CALENDAR = PostCalendar(horizon_hours=DEFAULT_CONFIG['CALENDAR_HORIZON_HOURS'])
+
+# Statistiques d'engagement des publications (réactions, commentaires, partages, portée)
+ENGAGEMENT_STORE = EngagementStore(DEFAULT_CONFIG['ENGAGEMENT_STORE'])
+
+# Choix des images et des variantes de thème selon l'engagement (échantillonnage de Thompson)
+SELECTOR = ThompsonSelector()
+
+def record_engagement(page_id, theme, image, engagement, reach):
+    """Répercute une variation d'engagement sur les agrégats du sélecteur"""
+    SELECTOR.observe(page_id, 'theme', theme, engagement, reach)
+    SELECTOR.observe(page_id, 'image', image, engagement, reach)
+
+ENGAGEMENT_STORE.listeners.append(record_engagement)
+
+# Statistiques de l'historique des publications (colonnes NumPy, lecture incrémentale) :
+# créées à la première demande, NumPy n'est importé qu'à ce moment
+HISTORY_ANALYTICS = None
+
+# Fragments générés par OpenAI et recombinés localement en messages
+FRAGMENT_BANK = FragmentBank(DEFAULT_CONFIG['FRAGMENTS_FILE'], max_age_seconds=DEFAULT_CONFIG['FRAGMENTS_MAX_AGE_HOURS'] * 3600)
+
+# Fournisseurs de génération (OpenAI, serveur local compatible, fragments hors ligne)
+GENERATION_ROUTER = build_router(DEFAULT_CONFIG, FRAGMENT_BANK)
+
+# Disjoncteurs de l'API Graph : « graph » pour la dépendance, « graph:page:<id> » par page
+GRAPH_BREAKERS = BreakerRegistry(
+    failure_threshold=DEFAULT_CONFIG['GRAPH_BREAKER_FAILURES'],
+    reset_timeout=DEFAULT_CONFIG['GRAPH_BREAKER_RESET_SECONDS']
+)
+
+# Accès à l'API Graph (lectures, publication de photos) à travers les disjoncteurs
+PUBLISHER = GraphPublisher(
+    FACEBOOK_GRAPH_URL,
+    image_cache=IMAGE_CACHE,
+    breakers=GRAPH_BREAKERS,
+    connect_timeout=DEFAULT_CONFIG['HTTP_CONNECT_TIMEOUT_SECONDS'],
+    graph_timeout=DEFAULT_CONFIG['GRAPH_TIMEOUT_SECONDS'],
+    upload_timeout=DEFAULT_CONFIG['UPLOAD_TIMEOUT_SECONDS']
+)
+
+# Intentions et résultats des publications programmées, par (utilisateur, créneau)
+PUBLISH_JOURNAL = PublishJournal(DEFAULT_CONFIG['PUBLISH_JOURNAL_FILE'])
+# Recherche d'une publication incertaine : depuis son dernier état, moins la durée maximale
+# d'un envoi et une marge pour l'écart entre les horloges de Facebook et du serveur
+RECONCILE_MARGIN = datetime.timedelta(seconds=DEFAULT_CONFIG['PUBLISH_BUDGET_SECONDS'], minutes=5)
+
+# Places de génération et de publication : « Publier maintenant » passe devant les publications automatiques
+def work_quota(user_id):
+    """Quota de l'utilisateur dans la voie de fond : (poids, tâches simultanées)"""
+    config = USER_CONFIGS.get(str(user_id), {})
+    return (config.get('QUEUE_WEIGHT', DEFAULT_CONFIG['WORK_DEFAULT_WEIGHT']),
+            config.get('QUEUE_MAX_RUNNING', DEFAULT_CONFIG['WORK_MAX_RUNNING_PER_USER']))
+
+WORK_QUEUE = WorkQueue(
+    DEFAULT_CONFIG['WORK_CONCURRENCY'],
+    reserved=DEFAULT_CONFIG['WORK_INTERACTIVE_RESERVED'],
+    quantum=DEFAULT_CONFIG['WORK_QUANTUM'],
+    quotas=work_quota,
+    share_half_life=DEFAULT_CONFIG['WORK_SHARE_HALF_LIFE_MINUTES'] * 60
+)
+
+# Phases du démarrage (imports, chargements, connexion Telegram)
+STARTUP = StartupProfile(STARTED_AT)
+
+def history_analytics():
+    """Statistiques de l'historique, créées au premier appel"""
+    global HISTORY_ANALYTICS
+    if HISTORY_ANALYTICS is None:
+        from history_analytics import LedgerAnalytics
+        HISTORY_ANALYTICS = LedgerAnalytics(DEFAULT_CONFIG['MESSAGES_CSV'], archive=MESSAGES_LEDGER.archive)
+    return HISTORY_ANALYTICS
+
+def end_conversation():
+    """ConversationHandler.END, sans importer telegram.ext au chargement du module"""
+    from telegram.ext import ConversationHandler
+    return ConversationHandler.END
+
 def initialize_csv_files():
     """Initialise les fichiers CSV s'ils n'existent pas"""
-    # Fichier des messages
-    if not os.path.exists(DEFAULT_CONFIG['MESSAGES_CSV']):
-        with open(DEFAULT_CONFIG['MESSAGES_CSV'], 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=['user_id', 'id_post', 'message', 'date_post'])
-            writer.writeheader()
-            logger.info(f"Fichier CSV '{DEFAULT_CONFIG['MESSAGES_CSV']}' créé.")
-    
-    # Fichier des utilisateurs
-    if not os.path.exists(DEFAULT_CONFIG['USERS_CSV']):
-        with open(DEFAULT_CONFIG['USERS_CSV'], 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=['telegram_id', 'page_id', 'page_name', 'long_lived_token', 'token_expiry', 'theme', 'interval_minutes', 'auto_post_enabled'])
-            writer.writeheader()
-            logger.info(f"Fichier CSV '{DEFAULT_CONFIG['USERS_CSV']}' créé.")
+    MESSAGES_LEDGER.ensure()
+    USERS_TABLE.ensure()
+    PAGES_TABLE.ensure()
+
+def user_config_from_row(row):
+    """Construit la configuration en mémoire d'un utilisateur à partir d'une ligne de users.csv"""
+    return {
+        'PAGE_ID': row['page_id'],
+        'PAGE_NAME': row['page_name'],
+        'PAGE_ACCESS_TOKEN': row['long_lived_token'],
+        'TOKEN_EXPIRY': row['token_expiry'],
+        'THEME': row['theme'] or DEFAULT_CONFIG['THEME'],
+        'INTERVAL_MINUTES': int(row['interval_minutes']) if row['interval_minutes'] else DEFAULT_CONFIG['INTERVAL_MINUTES'],
+        'AUTO_POST_ENABLED': row['auto_post_enabled'].lower() == 'true',
+        'POST_WINDOWS': row['post_windows'],
+        'POST_DAYS': row['post_days'],
+        'TIMEZONE': row['timezone'] or DEFAULT_CONFIG['TIMEZONE'],
+        'MIN_GAP_MINUTES': int(row['min_gap_minutes']) if row['min_gap_minutes'] else DEFAULT_CONFIG['MIN_GAP_MINUTES'],
+        'QUEUE_WEIGHT': float(row['queue_weight']) if row.get('queue_weight') else DEFAULT_CONFIG['WORK_DEFAULT_WEIGHT'],
+        'QUEUE_MAX_RUNNING': int(row['queue_max_running']) if row.get('queue_max_running') else DEFAULT_CONFIG['WORK_MAX_RUNNING_PER_USER'],
+        'OPENAI_API_KEY': DEFAULT_CONFIG['OPENAI_API_KEY'],
+        'PAGES': []
+    }
+
+def page_config_from_row(row):
+    """Construit la configuration d'une page du mode multi-pages"""
+    return {
+        'PAGE_ID': row['page_id'],
+        'PAGE_NAME': row['page_name'],
+        'PAGE_ACCESS_TOKEN': row['page_access_token']
+    }
 
 def load_users_data():
     """Charge les données des utilisateurs depuis le CSV"""
-    if not os.path.exists(DEFAULT_CONFIG['USERS_CSV']):
-        return
+    pages_by_user = {}
+    for row in PAGES_TABLE.rows():
+        if row['enabled'] == 'true':
+            pages_by_user.setdefault(row['telegram_id'], []).append(page_config_from_row(row))
     
-    with open(DEFAULT_CONFIG['USERS_CSV'], 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            user_id = row['telegram_id']
-            USER_CONFIGS[user_id] = {
-                'PAGE_ID': row['page_id'],
-                'PAGE_NAME': row['page_name'],
-                'PAGE_ACCESS_TOKEN': row['long_lived_token'],
-                'TOKEN_EXPIRY': row['token_expiry'],
-                'THEME': row['theme'] or DEFAULT_CONFIG['THEME'],
-                'INTERVAL_MINUTES': int(row['interval_minutes']) if row['interval_minutes'] else DEFAULT_CONFIG['INTERVAL_MINUTES'],
-                'AUTO_POST_ENABLED': row['auto_post_enabled'].lower() == 'true',
-                'OPENAI_API_KEY': DEFAULT_CONFIG['OPENAI_API_KEY']
-            }
-            logger.info(f"Données utilisateur chargées pour: {user_id}")
+    for row in USERS_TABLE.rows():
+        user_id = row['telegram_id']
+        USER_CONFIGS[user_id] = user_config_from_row(row)
+        USER_CONFIGS[user_id]['PAGES'] = pages_by_user.get(user_id, [])
+        logger.info(f"Données utilisateur chargées pour: {user_id}")
 
 def save_user_data(telegram_id, page_id, page_name, long_lived_token, token_expiry, theme=None, interval_minutes=None, auto_post_enabled=None):
     """Enregistre ou met à jour les données d'un utilisateur dans le CSV"""
-    user_exists = False
-    rows = []
-    
-    # Lire les données existantes
-    if os.path.exists(DEFAULT_CONFIG['USERS_CSV']):
-        with open(DEFAULT_CONFIG['USERS_CSV'], 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['telegram_id'] == str(telegram_id):
-                    # Mettre à jour les données existantes
-                    row['page_id'] = page_id
-                    row['page_name'] = page_name
-                    row['long_lived_token'] = long_lived_token
-                    row['token_expiry'] = token_expiry
-                    if theme is not None:
-                        row['theme'] = theme
-                    if interval_minutes is not None:
-                        row['interval_minutes'] = str(interval_minutes)
-                    if auto_post_enabled is not None:
-                        row['auto_post_enabled'] = str(auto_post_enabled).lower()
-                    user_exists = True
-                rows.append(row)
-    
-    # Ajouter un nouvel utilisateur si nécessaire
-    if not user_exists:
-        rows.append({
-            'telegram_id': str(telegram_id),
-            'page_id': page_id,
-            'page_name': page_name,
-            'long_lived_token': long_lived_token,
-            'token_expiry': token_expiry,
-            'theme': theme or DEFAULT_CONFIG['THEME'],
-            'interval_minutes': str(interval_minutes or DEFAULT_CONFIG['INTERVAL_MINUTES']),
-            'auto_post_enabled': str(auto_post_enabled or False).lower()
-        })
-    
-    # Écrire les données mises à jour
-    with open(DEFAULT_CONFIG['USERS_CSV'], 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=['telegram_id', 'page_id', 'page_name', 'long_lived_token', 'token_expiry', 'theme', 'interval_minutes', 'auto_post_enabled'])
-        writer.writeheader()
-        writer.writerows(rows)
-        
-    # Mettre à jour les données en mémoire
-    USER_CONFIGS[str(telegram_id)] = {
-        'PAGE_ID': page_id,
-        'PAGE_NAME': page_name,
-        'PAGE_ACCESS_TOKEN': long_lived_token,
-        'TOKEN_EXPIRY': token_expiry,
-        'THEME': theme or DEFAULT_CONFIG['THEME'],
-        'INTERVAL_MINUTES': int(interval_minutes or DEFAULT_CONFIG['INTERVAL_MINUTES']),
-        'AUTO_POST_ENABLED': bool(auto_post_enabled or False),
-        'OPENAI_API_KEY': DEFAULT_CONFIG['OPENAI_API_KEY']
+    changes = {
+        'page_id': page_id,
+        'page_name': page_name,
+        'long_lived_token': long_lived_token,
+        'token_expiry': token_expiry
     }
+    if theme is not None:
+        changes['theme'] = theme
+    if interval_minutes is not None:
+        changes['interval_minutes'] = str(interval_minutes)
+    if auto_post_enabled is not None:
+        changes['auto_post_enabled'] = str(auto_post_enabled).lower()
+    
+    # Fusionner avec la ligne existante (ou créer l'utilisateur avec les valeurs par défaut)
+    row = USERS_TABLE.upsert(telegram_id, changes, defaults={
+        'theme': DEFAULT_CONFIG['THEME'],
+        'interval_minutes': str(DEFAULT_CONFIG['INTERVAL_MINUTES']),
+        'auto_post_enabled': 'false'
+    })
+        
+    # Mettre à jour les données en mémoire (en conservant les pages du mode multi-pages)
+    pages = USER_CONFIGS.get(str(telegram_id), {}).get('PAGES', [])
+    USER_CONFIGS[str(telegram_id)] = user_config_from_row(row)
+    USER_CONFIGS[str(telegram_id)]['PAGES'] = pages
     
     logger.info(f"Données utilisateur enregistrées pour: {telegram_id}")
 
+def set_fanout_pages(telegram_id, pages):
+    """Définit les pages du mode multi-pages d'un utilisateur (liste vide : mode une seule page)"""
+    user_id = str(telegram_id)
+    selected = {page['PAGE_ID'] for page in pages}
+    items = [
+        (f"{user_id}:{page['PAGE_ID']}", {
+            'telegram_id': user_id,
+            'page_id': page['PAGE_ID'],
+            'page_name': page['PAGE_NAME'],
+            'page_access_token': page['PAGE_ACCESS_TOKEN'],
+            'enabled': 'true'
+        })
+        for page in pages
+    ]
+    # Désactiver les pages précédemment sélectionnées qui ne le sont plus
+    items += [
+        (row['key'], {'enabled': 'false'})
+        for row in PAGES_TABLE.rows()
+        if row['telegram_id'] == user_id and row['page_id'] not in selected and row['enabled'] == 'true'
+    ]
+    if items:
+        PAGES_TABLE.upsert_many(items)
+    if user_id in USER_CONFIGS:
+        USER_CONFIGS[user_id]['PAGES'] = list(pages)
+    logger.info(f"Mode multi-pages pour {user_id}: {len(pages)} page(s)")
+
 def update_user_config(telegram_id, key, value):
     """Met à jour une valeur spécifique dans la configuration d'un utilisateur"""
     user_id = str(telegram_id)
@@ -165,23 +387,9 @@ def update_user_config(telegram_id, key, value):
     USER_CONFIGS[user_id][key] = value
     
     # Mettre à jour le fichier CSV
-    rows = []
-    with open(DEFAULT_CONFIG['USERS_CSV'], 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['telegram_id'] == user_id:
-                if key == 'THEME':
-                    row['theme'] = value
-                elif key == 'INTERVAL_MINUTES':
-                    row['interval_minutes'] = str(value)
-                elif key == 'AUTO_POST_ENABLED':
-                    row['auto_post_enabled'] = str(value).lower()
-            rows.append(row)
-    
-    with open(DEFAULT_CONFIG['USERS_CSV'], 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=['telegram_id', 'page_id', 'page_name', 'long_lived_token', 'token_expiry', 'theme', 'interval_minutes', 'auto_post_enabled'])
-        writer.writeheader()
-        writer.writerows(rows)
+    column = USER_CONFIG_COLUMNS.get(key)
+    if column:
+        USERS_TABLE.update(user_id, {column: str(value).lower() if isinstance(value, bool) else str(value)})
     
     logger.info(f"Configuration mise à jour pour {user_id}: {key} = {value}")
     return True
@@ -206,7 +414,7 @@ def exchange_code_for_token(code):
     }
     
     try:
-        response = requests.get(f"{FACEBOOK_GRAPH_URL}/oauth/access_token", params=token_params)
+        response = PUBLISHER.get('oauth/access_token', token_params)
         response.raise_for_status()
         return response.json().get('access_token')
     except Exception as e:
@@ -226,7 +434,7 @@ def get_long_lived_token(short_lived_token):
     }
     
     try:
-        response = requests.get(f"{FACEBOOK_GRAPH_URL}/oauth/access_token", params=token_params)
+        response = PUBLISHER.get('oauth/access_token', token_params)
         response.raise_for_status()
         data = response.json()
         
@@ -245,185 +453,459 @@ def get_user_pages(access_token):
         return None
     
     try:
-        response = requests.get(
-            f"{FACEBOOK_GRAPH_URL}/me/accounts",
-            params={'access_token': access_token}
-        )
+        response = PUBLISHER.get('me/accounts', {'access_token': access_token})
         response.raise_for_status()
         return response.json().get('data', [])
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des pages: {e}")
         return None
 
-def save_post_to_csv(user_id, post_id, message, date_post):
+def save_post_to_csv(user_id, post_id, message, date_post, page_id='', status='published', theme='', image=''):
     """Enregistre un post dans le CSV des messages"""
-    with open(DEFAULT_CONFIG['MESSAGES_CSV'], 'a', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=['user_id', 'id_post', 'message', 'date_post'])
-        writer.writerow({
+    with metrics.LEDGER_WRITE.time():
+        MESSAGES_LEDGER.append({
             'user_id': user_id,
             'id_post': post_id,
             'message': message,
-            'date_post': date_post
+            'date_post': date_post,
+            'page_id': page_id,
+            'status': status,
+            'theme': theme,
+            'image': image
         })
-        logger.info(f"Post enregistré dans le CSV pour l'utilisateur {user_id}")
+    logger.info(f"Post enregistré dans le CSV pour l'utilisateur {user_id}")
 
 def get_random_image():
     """Récupère une image aléatoire du dossier ou utilise une URL par défaut"""
-    if os.path.exists(DEFAULT_CONFIG['IMAGES_FOLDER']):
-        images = [f for f in os.listdir(DEFAULT_CONFIG['IMAGES_FOLDER']) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    with metrics.IMAGE_SELECTION.time():
+        return IMAGE_CACHE.random_image(DEFAULT_CONFIG['IMAGES_FOLDER'])
+
+def image_label(image_path):
+    """Nom d'une image dans le journal et le sélecteur (nom de fichier, ou URL)"""
+    return image_path if image_path.startswith("http") else os.path.basename(image_path)
+
+def selection_page_ids(user_id):
+    """Pages dont l'engagement guide les choix : page principale et pages du mode multi-pages"""
+    return [USER_CONFIGS[str(user_id)]['PAGE_ID']] + user_page_ids(user_id)
+
+def choose_image(user_id):
+    """Choisit l'image selon l'engagement passé sur les pages de l'utilisateur (uniforme si désactivé)"""
+    if not DEFAULT_CONFIG['ENGAGEMENT_SELECTION']:
+        return get_random_image()
+    with metrics.IMAGE_SELECTION.time():
+        images = IMAGE_CACHE.list_images(DEFAULT_CONFIG['IMAGES_FOLDER'])
         if images:
-            return os.path.join(DEFAULT_CONFIG['IMAGES_FOLDER'], random.choice(images))
-    return 'https://images.unsplash.com/photo-1530631673369-bc20fdb32288?q=80&w=1760&auto=format&fit=crop'
+            by_label = {image_label(path): path for path in images}
+            return by_label[SELECTOR.choose(selection_page_ids(user_id), 'image', list(by_label))]
+    return get_random_image()
+
+def theme_variants(theme):
+    """Variantes d'un thème, séparées par « | » dans la configuration"""
+    return [variant.strip() for variant in theme.split('|') if variant.strip()] or [theme]
+
+def choose_theme(user_id):
+    """Choisit la variante de thème selon l'engagement passé sur les pages de l'utilisateur"""
+    config = USER_CONFIGS[str(user_id)]
+    variants = theme_variants(config['THEME'])
+    if not DEFAULT_CONFIG['ENGAGEMENT_SELECTION']:
+        return random.choice(variants)
+    return SELECTOR.choose(selection_page_ids(user_id), 'theme', variants)
 
 def generate_ai_message(theme):
-    """Génère un message via l'API OpenAI"""
-    if not DEFAULT_CONFIG['OPENAI_API_KEY']:
-        logger.error("Clé API OpenAI manquante.")
-        return None
+    """Génère un message valide : réparé localement si possible, régénéré seulement sinon"""
+    return generate_valid_message(GENERATION_ROUTER, theme, DEFAULT_CONFIG['GENERATION_ATTEMPTS'])
 
-    client = OpenAI(api_key=DEFAULT_CONFIG['OPENAI_API_KEY'])
+def refresh_fragments(theme):
+    """Renouvelle la banque de fragments d'un thème via un modèle ; retourne True si réussi"""
+    content = GENERATION_ROUTER.complete(
+        [
+            {
+                "role": "system",
+                "content": FRAGMENTS_PROMPT.format(count=DEFAULT_CONFIG['FRAGMENTS_PER_SLOT'], theme=theme)
+            }
+        ],
+        response_format={"type": "json_object"},
+        max_tokens=1500,
+        temperature=0.9
+    )
+    if content is None:
+        return False
 
+    fragments = parse_fragments(content)
+    if not fragments:
+        logger.error(f"Fragments inexploitables pour le thème: {theme}")
+        return False
+    FRAGMENT_BANK.set_fragments(theme, fragments)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Tu es un expert en copywriting et en marketing digital. Génère un message court, percutant et ultra engageant pour une publication Facebook qui promeut un bot Telegram de pronostics football. Le bot donne des coupons avec une forte probabilité de reuissite. "
-                        "Le message doit obligatoirement :"
-                        " - Commencer par un emoji ⚽, 🔥, 💰 ou 🎯"
-                        " - Préciser que c'est gratuit"
-                        "-éviter de commencer par le mot <<prêt>>"
-                        "- Utiliser un ton amical et engageant"
-                        "- Intégrer un appel à l'action clair et motivant : « Rejoins », « Clique ici », « Active ton accès », etc."
-                        f"- Terminer par le lien du bot ➡️ https://t.me/Hcfa_bot"
-                        "- Longueur idéale : entre 150 et 300 caractères"
-                        "- PAS d'explications ni de commentaires, juste le message à publier"
-                        f"- Thème spécifique à intégrer: {theme}"
-                        "Génère uniquement le message prêt à publier."
-                    )
-                }
-            ],
-            max_tokens=300,
-            temperature=0.7
-        )
-        message = response.choices[0].message.content.strip()
-        logger.info(f"Message généré: {message}")
+        FRAGMENT_BANK.save()
+    except OSError as e:
+        logger.error(f"Erreur lors de l'enregistrement des fragments: {e}")
+    logger.info(f"Fragments renouvelés pour le thème {theme}: " + ', '.join(f"{len(values)} {slot}" for slot, values in fragments.items()))
+    return True
+
+def compose_template_message(theme):
+    """Compose un message depuis la banque de fragments, renouvelée si nécessaire ; None si impossible"""
+    if FRAGMENT_BANK.needs_refresh(theme):
+        refresh_fragments(theme)
+    return FRAGMENT_BANK.compose(theme)
+
+def get_message_for_user(user_id, theme):
+    """Retourne un message pour l'utilisateur : composé depuis les fragments, depuis le cache, sinon via OpenAI"""
+    if DEFAULT_CONFIG['TEMPLATE_ENGINE']:
+        message = compose_template_message(theme)
+        if message:
+            logger.info(f"Message composé depuis les fragments pour l'utilisateur {user_id}")
+            return message
+
+    cache_key = (PROMPT_VERSION, theme.strip(), DEFAULT_CONFIG['LANGUAGE'])
+    message = MESSAGE_CACHE.get(cache_key, user_id)
+    if message:
+        metrics.MESSAGE_CACHE_TOTAL.inc(result='hit')
+        logger.info(f"Message servi depuis le cache pour l'utilisateur {user_id}")
         return message
-    except Exception as e:
-        logger.error(f"Erreur OpenAI: {e}")
-        return None
+    metrics.MESSAGE_CACHE_TOTAL.inc(result='miss')
+    
+    message = generate_ai_message(theme)
+    if message:
+        MESSAGE_CACHE.put(cache_key, message, user_id)
+    return message
+
+def publish_page(key, page_id, access_token, message, image_path):
+    """Publie sur une page ; retourne (post_id, erreur).
+
+    Avec la clé d'un créneau (<key>), l'intention est journalisée avant
+    l'appel Graph et le résultat après : une publication restée incertaine
+    (délai dépassé, arrêt du processus) est d'abord recherchée sur la page,
+    et n'est refaite que si Facebook ne l'a pas reçue.
+    """
+    if key is None:
+        return PUBLISHER.publish_photo(page_id, access_token, message, image_path)
+
+    entry = PUBLISH_JOURNAL.entry(key, page_id)
+    if entry is not None and entry.status in UNSETTLED:
+        # Une erreur de consultation est propagée : republier à l'aveugle risquerait un doublon
+        post_id = PUBLISHER.find_post(page_id, access_token, entry.message or message, entry.updated_at - RECONCILE_MARGIN)
+        if post_id:
+            RECONCILE_TOTAL.inc(result='found')
+            logger.warning(f"Publication incertaine retrouvée sur la page {page_id} ({key}): {post_id}")
+            PUBLISH_JOURNAL.confirm(key, page_id, post_id)
+            return post_id, None
+        RECONCILE_TOTAL.inc(result='absent')
+        logger.info(f"Publication incertaine absente de la page {page_id} ({key}): nouvelle tentative")
+
+    PUBLISH_JOURNAL.begin(key, page_id, message)
+    try:
+        post_id, error = PUBLISHER.publish_photo(page_id, access_token, message, image_path)
+    except CircuitOpenError:
+        # Disjoncteur ouvert : rien n'a été envoyé
+        PUBLISH_JOURNAL.fail(key, page_id)
+        raise
+    except Exception:
+        # Pas de réponse de Facebook : la publication a pu avoir lieu
+        PUBLISH_JOURNAL.mark_uncertain(key, page_id, message)
+        raise
+    if post_id:
+        PUBLISH_JOURNAL.confirm(key, page_id, post_id)
+    else:
+        PUBLISH_JOURNAL.fail(key, page_id)
+    return post_id, error
 
-def post_to_facebook(user_id, message, image_path):
-    """Publie un message avec une image sur Facebook"""
+def post_to_facebook(user_id, message, image_path, theme=None, key=None):
+    """Publie un message avec une image sur Facebook (<key> : clé d'idempotence du créneau)"""
     if str(user_id) not in USER_CONFIGS:
         logger.error(f"Configuration utilisateur non trouvée pour: {user_id}")
         return None, None
     
     user_config = USER_CONFIGS[str(user_id)]
-    
-    url = f"{FACEBOOK_GRAPH_URL}/{user_config['PAGE_ID']}/photos"
-    payload = {
-        'message': message,
-        'access_token': user_config['PAGE_ACCESS_TOKEN'],
-    }
+    date_post = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    theme = theme or user_config['THEME']
 
     try:
-        if image_path.startswith("http"):
-            payload['url'] = image_path
-            files = None
-        else:
-            files = {'source': open(image_path, 'rb')}
+        post_id, error = publish_page(key, user_config['PAGE_ID'], user_config['PAGE_ACCESS_TOKEN'], message, image_path)
+    except CircuitOpenError:
+        # Rien n'a été envoyé : la publication est reportée par l'appelant
+        raise
+    except DeadlineExceeded as e:
+        logger.error(f"Publication interrompue pour l'utilisateur {user_id}: {e}")
+        save_post_to_csv(user_id, '', message, date_post, page_id=user_config['PAGE_ID'], status='timeout', theme=theme, image=image_label(image_path))
+        raise
+    except Exception as e:
+        post_id, error = None, e
 
-        response = requests.post(url, data=payload, files=files)
+    if post_id:
+        logger.info(f"Publication réussie pour l'utilisateur {user_id}. ID: {post_id}")
+        save_post_to_csv(user_id, post_id, message, date_post, page_id=user_config['PAGE_ID'], theme=theme, image=image_label(image_path))
+        return post_id, message
+    logger.error(f"Échec de la publication pour l'utilisateur {user_id}: {error}")
+    save_post_to_csv(user_id, '', message, date_post, page_id=user_config['PAGE_ID'], status='failed', theme=theme, image=image_label(image_path))
+    return None, None
 
-        if response.status_code == 200:
-            post_id = response.json().get('id')
-            logger.info(f"Publication réussie pour l'utilisateur {user_id}. ID: {post_id}")
-            save_post_to_csv(user_id, post_id, message, datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            return post_id, message
-        else:
-            logger.error(f"Échec de la publication pour l'utilisateur {user_id}: {response.text}")
-            return None, None
-    except Exception as e:
-        logger.error(f"Erreur lors de la publication pour l'utilisateur {user_id}: {e}")
-        return None, None
+async def publish_to_pages(user_id, message, image_path, pages, theme=None, key=None):
+    """Publie le même message sur toutes les pages en parallèle et enregistre chaque résultat"""
+    def publish_one(page):
+        return publish_page(key, page['PAGE_ID'], page['PAGE_ACCESS_TOKEN'], message, image_path)
+    
+    results = await FANOUT_PUBLISHER.publish(pages, publish_one)
+    deferred = [result for result in results if result.status == 'deferred']
+    if deferred and len(deferred) == len(results):
+        raise CircuitOpenError('graph', PUBLISHER.retry_after(result.page_id for result in deferred))
+    # Les pages reportées n'ont rien reçu : rien à enregistrer pour elles
+    results = [result for result in results if result.status != 'deferred']
+    
+    date_post = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    theme = theme or USER_CONFIGS.get(str(user_id), {}).get('THEME', '')
+    with metrics.LEDGER_WRITE.time():
+        await asyncio.to_thread(MESSAGES_LEDGER.append_many, [
+            {
+                'user_id': user_id,
+                'id_post': result.post_id or '',
+                'message': message,
+                'date_post': date_post,
+                'page_id': result.page_id,
+                'status': result.status,
+                'theme': theme,
+                'image': image_label(image_path)
+            }
+            for result in results
+        ])
+    for result in results:
+        if result.status != 'published':
+            logger.error(f"Échec de la publication sur la page {result.page_name} ({result.page_id}) pour l'utilisateur {user_id}: {result.error}")
+    return results
+
+async def publish_for_user(user_id, message, image_path, theme=None, key=None):
+    """Publie sur la page de l'utilisateur, ou sur toutes ses pages en mode multi-pages.
+
+    Retourne (nombre de pages publiées, nombre de pages visées). Lève
+    CircuitOpenError si aucune page n'est joignable (disjoncteurs ouverts).
+    Avec la clé d'un créneau (<key>), les pages déjà publiées pour ce
+    créneau sont ignorées : une reprise ne complète que les autres.
+    """
+    pages = USER_CONFIGS[str(user_id)].get('PAGES')
+    if pages:
+        if key is not None:
+            pages = [page for page in pages if not PUBLISH_JOURNAL.published(key, page['PAGE_ID'])]
+        results = await publish_to_pages(user_id, message, image_path, pages, theme, key)
+        return sum(1 for result in results if result.status == 'published'), len(results)
+    # Envoi bloquant : dans un thread, qui hérite de l'échéance courante
+    post_id, _ = await asyncio.to_thread(post_to_facebook, user_id, message, image_path, theme, key)
+    return (1 if post_id else 0), 1
+
+def slot_published(user_id, key):
+    """Vrai si toutes les pages de l'utilisateur ont déjà reçu la publication du créneau"""
+    return all(PUBLISH_JOURNAL.published(key, page_id) for page_id in user_page_ids(user_id))
+
+def slot_unsettled(user_id, key):
+    """Vrai si une page du créneau est restée sans réponse de Facebook"""
+    return any(
+        entry is not None and entry.status in UNSETTLED
+        for entry in (PUBLISH_JOURNAL.entry(key, page_id) for page_id in user_page_ids(user_id))
+    )
+
+def publication_summary(published, total):
+    """Suffixe du message de confirmation en mode multi-pages"""
+    return f" sur {published}/{total} pages" if total > 1 else ""
+
+def digest_line(user_id, message, total):
+    """Ligne d'une publication dans le résumé des confirmations : page(s) et début du message"""
+    pages = f"{total} pages" if total > 1 else USER_CONFIGS[str(user_id)]['PAGE_NAME']
+    first_line = next((line.strip() for line in message.splitlines() if line.strip()), '')
+    return f"{pages} — {first_line}"
+
+def user_page_ids(user_id):
+    """Pages visées par les publications de l'utilisateur"""
+    config = USER_CONFIGS[str(user_id)]
+    return [page['PAGE_ID'] for page in config.get('PAGES') or []] or [config['PAGE_ID']]
+
+def unavailable_text(retry_after):
+    """Message à l'utilisateur quand une dépendance est coupée par son disjoncteur"""
+    minutes = max(1, round(retry_after / 60))
+    return f"⏳ Facebook ou OpenAI est momentanément indisponible. Réessayez dans {minutes} minute(s)."
+
+def dependency_retry_after(user_id):
+    """Secondes à attendre avant de pouvoir générer et publier pour l'utilisateur (0 si possible maintenant)"""
+    return max(PUBLISHER.retry_after(user_page_ids(user_id)), GENERATION_ROUTER.retry_after())
 
 async def check_expired_tokens(context):
     """Vérifie les tokens qui vont expirer et envoie des alertes"""
     today = datetime.datetime.now().date()
     
-    with open(DEFAULT_CONFIG['USERS_CSV'], 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if not row['token_expiry']:
-                continue
-                
-            expiry_date = datetime.datetime.strptime(row['token_expiry'], '%Y-%m-%d').date()
-            days_left = (expiry_date - today).days
+    for row in USERS_TABLE.rows():
+        if not row['token_expiry']:
+            continue
             
-            # Alerte si le token expire dans 2 jours ou moins
-            if 0 <= days_left <= 2:
-                telegram_id = row['telegram_id']
-                # Alerter l'administrateur
-                if DEFAULT_CONFIG['ADMIN_TELEGRAM_ID']:
-                    await context.bot.send_message(
-                        chat_id=DEFAULT_CONFIG['ADMIN_TELEGRAM_ID'],
-                        text=f"⚠️ ALERTE: Le token Facebook pour l'utilisateur {telegram_id} (page: {row['page_name']}) expire dans {days_left} jour(s)."
-                    )
-                
-                # Alerter l'utilisateur
-                auth_url = get_facebook_auth_url(telegram_id)
-                await context.bot.send_message(
-                    chat_id=telegram_id,
-                    text=f"⚠️ Votre accès à Facebook expire dans {days_left} jour(s). Veuillez vous reconnecter pour continuer à utiliser le service.",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("🔄 Reconnecter Facebook", url=auth_url)]
-                    ])
+        expiry_date = datetime.datetime.strptime(row['token_expiry'], '%Y-%m-%d').date()
+        days_left = (expiry_date - today).days
+        
+        # Alerte si le token expire dans 2 jours ou moins
+        if 0 <= days_left <= 2:
+            telegram_id = row['telegram_id']
+            # Alerter l'administrateur
+            if DEFAULT_CONFIG['ADMIN_TELEGRAM_ID']:
+                OUTBOX.send(
+                    context.bot,
+                    DEFAULT_CONFIG['ADMIN_TELEGRAM_ID'],
+                    f"⚠️ ALERTE: Le token Facebook pour l'utilisateur {telegram_id} (page: {row['page_name']}) expire dans {days_left} jour(s)."
                 )
-                
-                logger.info(f"Alerte d'expiration envoyée pour l'utilisateur {telegram_id}")
+            
+            # Alerter l'utilisateur
+            auth_url = get_facebook_auth_url(telegram_id)
+            OUTBOX.send(
+                context.bot,
+                telegram_id,
+                f"⚠️ Votre accès à Facebook expire dans {days_left} jour(s). Veuillez vous reconnecter pour continuer à utiliser le service.",
+                reply_markup=InlineKeyboardMarkup([
+                    [InlineKeyboardButton("🔄 Reconnecter Facebook", url=auth_url)]
+                ])
+            )
+            
+            logger.info(f"Alerte d'expiration envoyée pour l'utilisateur {telegram_id}")
 
-async def auto_post_job(context):
-    """Fonction de publication automatique périodique"""
-    user_id = context.job.data
-    
+def posting_rules(user_id):
+    """Règles de calendrier d'un utilisateur à partir de sa configuration"""
+    config = USER_CONFIGS[str(user_id)]
+    return PostingRules(
+        interval_minutes=config['INTERVAL_MINUTES'],
+        windows=config.get('POST_WINDOWS', ''),
+        days=config.get('POST_DAYS', ''),
+        timezone=config.get('TIMEZONE', DEFAULT_CONFIG['TIMEZONE']),
+        min_gap_minutes=config.get('MIN_GAP_MINUTES', DEFAULT_CONFIG['MIN_GAP_MINUTES'])
+    )
+
+def schedule_user_posts(user_id):
+    """Recalcule les créneaux de ce seul utilisateur ; retourne le prochain créneau ou None"""
+    try:
+        return CALENDAR.set_rules(user_id, posting_rules(user_id))
+    except RulesError as e:
+        logger.error(f"Règles de calendrier invalides pour {user_id}: {e}")
+        CALENDAR.remove_user(user_id)
+        return None
+
+def format_slot(user_id, slot):
+    """Créneau affiché dans le fuseau de l'utilisateur"""
+    if slot is None:
+        return "aucun créneau dans les prochaines heures"
+    try:
+        return posting_rules(user_id).localize(slot).strftime('%d/%m %H:%M')
+    except RulesError:
+        return slot.strftime('%d/%m %H:%M UTC')
+
+async def calendar_dispatch_job(context):
+    """Lance les publications des créneaux échus du calendrier"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for user_id, slot in CALENDAR.pop_due(now):
+        context.application.create_task(run_auto_post(context.bot, user_id, slot))
+
+def retry_slot(user_id, slot, retry_after, reason):
+    """Reprogramme le créneau après <retry_after> secondes ; retourne False s'il est abandonné"""
+    # Étaler les reprises pour ne pas solliciter la dépendance toutes en même temps
+    until = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=retry_after * random.uniform(1.0, 1.25) + 1)
+    if CALENDAR.defer(user_id, slot, until):
+        logger.warning(f"Publication automatique de {user_id} reportée à {format_slot(user_id, until)}: {reason}")
+        return True
+    logger.warning(f"Publication automatique de {user_id} abandonnée: {reason} jusqu'au créneau suivant")
+    return False
+
+def defer_auto_post(user_id, slot, retry_after):
+    """Reporte un créneau pendant une panne, sans notifier l'utilisateur"""
+    metrics.PUBLISH_TOTAL.inc(outcome='deferred')
+    if slot is None:
+        logger.warning(f"Publication automatique ignorée pour {user_id}: dépendance indisponible")
+        return
+    retry_slot(user_id, slot, retry_after, "dépendance indisponible")
+
+async def generate_and_publish(user_id, theme, key=None):
+    """Génère puis publie sous un seul budget (PUBLISH_BUDGET_SECONDS) ; retourne (message, publiées, visées).
+
+    Chaque étape reçoit le temps restant : les appels HTTP du thread de
+    travail le retrouvent par l'échéance courante, et l'étape est annulée
+    si elle le dépasse. Lève DeadlineExceeded quand le budget est épuisé.
+    Pour un créneau (<key>), le message déjà généré lors d'une tentative
+    précédente est réutilisé : une reprise publie le même texte.
+    """
+    deadline = Deadline(DEFAULT_CONFIG['PUBLISH_BUDGET_SECONDS'])
+    with deadline.activate():
+        message = PUBLISH_JOURNAL.message(key) if key is not None else None
+        if message is None:
+            message = await deadline.run('generation', asyncio.to_thread(get_message_for_user, user_id, theme))
+            if not message:
+                return None, 0, 0
+            if key is not None:
+                await asyncio.to_thread(PUBLISH_JOURNAL.record_message, key, message)
+        image = choose_image(user_id)
+        published, total = await deadline.run('upload', publish_for_user(user_id, message, image, theme, key))
+    return message, published, total
+
+async def queued_publish(lane, user_id, key=None, slot=None):
+    """Choisit la variante de thème, génère et publie dès qu'une place de la voie <lane> est libre.
+
+    Le budget de la publication ne court qu'à partir de l'attribution de la
+    place : l'attente dans la file ne le consomme pas. Le coût de la tâche,
+    pour le partage entre utilisateurs, est le nombre de pages visées. Pour
+    un créneau du calendrier (<slot>), le retard est mesuré à l'attribution
+    de la place, quand la publication commence vraiment : il comprend
+    l'attente dans la file et le pas de calendar_dispatch_job.
+    """
+    async with WORK_QUEUE.slot(lane, user_id, cost=len(user_page_ids(user_id))):
+        if slot is not None:
+            LATENESS_MONITOR.record(user_id, slot, datetime.datetime.now(datetime.timezone.utc))
+        theme = choose_theme(user_id)
+        return await generate_and_publish(user_id, theme, key)
+
+async def run_auto_post(bot, user_id, slot=None):
+    """Génère et publie le message d'une publication automatique (créneau <slot> du calendrier)"""
     try:
         # Vérifier si l'utilisateur existe
         if str(user_id) not in USER_CONFIGS:
             logger.error(f"Configuration utilisateur non trouvée pour auto-publication: {user_id}")
             return
-            
-        user_config = USER_CONFIGS[str(user_id)]
         
-        # Générer et publier
-        message = generate_ai_message(user_config['THEME'])
-        if message:
-            image = get_random_image()
-            post_id, content = post_to_facebook(user_id, message, image)
+        # Disjoncteur ouvert : reporter sans appeler OpenAI ni Facebook
+        retry_after = dependency_retry_after(user_id)
+        if retry_after > 0:
+            defer_auto_post(user_id, slot, retry_after)
+            return
+        
+        # Créneau déjà publié (reprise après un redémarrage ou un délai dépassé) : ne rien refaire
+        key = PUBLISH_JOURNAL.open(user_id, slot) if slot is not None else None
+        if key is not None and slot_published(user_id, key):
+            logger.info(f"Créneau {key} déjà publié: ignoré")
+            metrics.PUBLISH_TOTAL.inc(outcome='duplicate')
+            return
             
-            if post_id:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=f"✅ Publication automatique réussie:\n\n{content}"
+        # Générer et publier dans la voie de fond, chacun son tour
+        message, published, total = await queued_publish(BACKGROUND, user_id, key, slot)
+        if message:
+            if published:
+                metrics.PUBLISH_TOTAL.inc(outcome='published')
+                OUTBOX.send_confirmation(
+                    bot,
+                    user_id,
+                    f"✅ Publication automatique réussie{publication_summary(published, total)}:\n\n{message}",
+                    summary=digest_line(user_id, message, total)
                 )
             else:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text="❌ Échec de la publication automatique."
-                )
+                metrics.PUBLISH_TOTAL.inc(outcome='publish_failed')
+                OUTBOX.send(bot, user_id, "❌ Échec de la publication automatique.")
         else:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text="⚠️ Impossible de générer un message."
-            )
+            metrics.PUBLISH_TOTAL.inc(outcome='generation_failed')
+            OUTBOX.send(bot, user_id, "⚠️ Impossible de générer un message.")
+        # Pages sans réponse (délai dépassé en multi-pages) : vérifiées puis complétées à la reprise
+        if key is not None and slot_unsettled(user_id, key):
+            retry_slot(user_id, slot, DEFAULT_CONFIG['PUBLISH_RETRY_SECONDS'], "publication incertaine")
+    except CircuitOpenError as e:
+        defer_auto_post(user_id, slot, e.retry_after)
+    except DeadlineExceeded as e:
+        logger.error(f"Publication automatique de {user_id} interrompue: {e}")
+        metrics.PUBLISH_TOTAL.inc(outcome='timeout')
+        # Reprise du créneau : même message, pages incertaines vérifiées avant toute nouvelle publication
+        if slot is not None and retry_slot(user_id, slot, DEFAULT_CONFIG['PUBLISH_RETRY_SECONDS'], "délai dépassé"):
+            return
+        OUTBOX.send(bot, user_id, "⌛ Publication automatique interrompue : délai dépassé.")
     except Exception as e:
-        logger.error(f"Erreur dans auto_post_job: {e}")
-        await context.bot.send_message(
-            chat_id=user_id,
-            text=f"❌ Erreur lors de la publication automatique: {e}"
-        )
+        logger.error(f"Erreur dans la publication automatique: {e}")
+        metrics.PUBLISH_TOTAL.inc(outcome='error')
+        OUTBOX.send(bot, user_id, f"❌ Erreur lors de la publication automatique: {e}")
 
 # États pour le processus de connexion Facebook
 AUTH_WAITING_CODE, SELECT_PAGE = range(2)
@@ -495,7 +977,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"• Page Facebook: `{user_data.get('PAGE_NAME', 'Non définie')}`\n"
             f"• Thème actuel: `{user_data.get('THEME', DEFAULT_CONFIG['THEME'])}`\n"
             f"• Intervalle: `{user_data.get('INTERVAL_MINUTES', DEFAULT_CONFIG['INTERVAL_MINUTES'])} minutes`\n"
-            f"• Auto-publication: `{'Activée' if user_data.get('AUTO_POST_ENABLED', False) else 'Désactivée'}`\n\n"
+            f"• Créneaux: `{describe_rules(user_id)}`\n"
+            f"• Auto-publication: `{'Activée' if user_data.get('AUTO_POST_ENABLED', False) else 'Désactivée'}`\n"
+            f"• Prochaine publication: `{format_slot(user_id, next(iter(CALENDAR.upcoming(user_id, 1)), None)) if CALENDAR.has_user(user_id) else '-'}`\n\n"
             f"*Connexion Facebook:*\n"
             f"• Token expire le: `{token_expiry}`\n"
             f"• API OpenAI: `{'✅ Configuré' if DEFAULT_CONFIG['OPENAI_API_KEY'] else '❌ Non configuré'}`"
@@ -524,23 +1008,43 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await start(update, context)
             return
         
-        # Générer et publier
-        message = generate_ai_message(USER_CONFIGS[user_id]['THEME'])
+        # Disjoncteur ouvert : prévenir l'utilisateur sans appeler OpenAI ni Facebook
+        retry_after = dependency_retry_after(user_id)
+        if retry_after > 0:
+            metrics.PUBLISH_TOTAL.inc(outcome='deferred')
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=unavailable_text(retry_after))
+            await start(update, context)
+            return
+        
+        # Générer et publier dans la voie interactive, prioritaire sur les publications automatiques
+        try:
+            message, published, total = await queued_publish(INTERACTIVE, user_id)
+        except CircuitOpenError as e:
+            metrics.PUBLISH_TOTAL.inc(outcome='deferred')
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=unavailable_text(e.retry_after))
+            await start(update, context)
+            return
+        except DeadlineExceeded as e:
+            logger.error(f"Publication de {user_id} interrompue: {e}")
+            metrics.PUBLISH_TOTAL.inc(outcome='timeout')
+            await context.bot.send_message(chat_id=update.effective_chat.id, text="⌛ Publication interrompue : délai dépassé. Réessayez plus tard.")
+            await start(update, context)
+            return
         if message:
-            image = get_random_image()
-            post_id, content = post_to_facebook(user_id, message, image)
-            
-            if post_id:
+            if published:
+                metrics.PUBLISH_TOTAL.inc(outcome='published')
                 await context.bot.send_message(
                     chat_id=update.effective_chat.id,
-                    text=f"✅ Publication réussie:\n\n{content}"
+                    text=f"✅ Publication réussie{publication_summary(published, total)}:\n\n{message}"
                 )
             else:
+                metrics.PUBLISH_TOTAL.inc(outcome='publish_failed')
                 await context.bot.send_message(
                     chat_id=update.effective_chat.id,
                     text="❌ Échec de la publication."
                 )
         else:
+            metrics.PUBLISH_TOTAL.inc(outcome='generation_failed')
             await context.bot.send_message(
                 chat_id=update.effective_chat.id,
                 text="⚠️ Impossible de générer un message."
@@ -559,52 +1063,26 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await start(update, context)
             return
         
-        # Vérifier si le job_queue est disponible
-        if context.job_queue is None:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="❌ Erreur: JobQueue n'est pas disponible. Veuillez installer le module job-queue."
-            )
-            await start(update, context)
-            return
-        
-        # Arrêter d'abord tout job existant pour cet utilisateur
-        for job in context.job_queue.get_jobs_by_name(f"auto_post_{user_id}"):
-            job.schedule_removal()
-        
-        # Démarrer le nouveau job
-        context.job_queue.run_repeating(
-            auto_post_job,
-            interval=USER_CONFIGS[user_id]['INTERVAL_MINUTES'] * 60,
-            first=10,  # Premier post après 10 secondes
-            data=update.effective_chat.id,
-            name=f"auto_post_{user_id}"
-        )
+        # Calculer les créneaux de l'utilisateur
+        next_slot = schedule_user_posts(user_id)
         
         # Mettre à jour la configuration
         update_user_config(user_id, 'AUTO_POST_ENABLED', True)
         
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
-            text=f"✅ Auto-publication activée!\nFréquence: toutes les {USER_CONFIGS[user_id]['INTERVAL_MINUTES']} minutes\nThème: {USER_CONFIGS[user_id]['THEME']}"
+            text=(
+                f"✅ Auto-publication activée!\nCréneaux: {describe_rules(user_id)}\n"
+                f"Prochaine publication: {format_slot(user_id, next_slot)}\nThème: {USER_CONFIGS[user_id]['THEME']}"
+            )
         )
         
         # Revenir au menu principal
         await start(update, context)
     
     elif query.data == "stop_auto":
-        # Vérifier si le job_queue est disponible
-        if context.job_queue is None:
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="❌ Erreur: JobQueue n'est pas disponible."
-            )
-            await start(update, context)
-            return
-        
-        # Arrêter les jobs existants pour cet utilisateur
-        for job in context.job_queue.get_jobs_by_name(f"auto_post_{user_id}"):
-            job.schedule_removal()
+        # Retirer les créneaux de l'utilisateur
+        CALENDAR.remove_user(user_id)
         
         # Mettre à jour la configuration
         update_user_config(user_id, 'AUTO_POST_ENABLED', False)
@@ -623,6 +1101,9 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 InlineKeyboardButton("🏷️ Changer le thème", callback_data="change_theme"),
                 InlineKeyboardButton("⏱️ Modifier l'intervalle", callback_data="change_interval")
             ],
+            [
+                InlineKeyboardButton("🕒 Créneaux de publication", callback_data="change_schedule")
+            ],
             [
                 InlineKeyboardButton("🔑 Reconnecter Facebook", 
                                     url=get_facebook_auth_url(user_id))
@@ -642,7 +1123,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Lancer la conversation pour changer le thème
         context.user_data['prev_message_id'] = query.message.message_id
         await query.edit_message_text(
-            text="🏷️ *Changer le thème de publications*\n\nVeuillez entrer le nouveau thème pour vos publications:",
+            text="🏷️ *Changer le thème de publications*\n\nVeuillez entrer le nouveau thème pour vos publications.\nPour tester plusieurs variantes, séparez-les par `|` : les plus performantes seront choisies plus souvent.",
             parse_mode='Markdown',
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton("↩️ Annuler", callback_data="back_to_menu")]
@@ -662,6 +1143,24 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_FOR_INTERVAL
     
+    elif query.data == "change_schedule":
+        # Lancer la conversation pour changer les créneaux
+        context.user_data['prev_message_id'] = query.message.message_id
+        await query.edit_message_text(
+            text=(
+                "🕒 *Créneaux de publication*\n\n"
+                f"Actuellement: `{describe_rules(user_id)}`\n\n"
+                "Entrez les fenêtres horaires, puis éventuellement les jours et le fuseau horaire, par exemple:\n"
+                "`08:00-11:00,18:00-21:00 lun-ven Africa/Abidjan`\n\n"
+                "Envoyez `tout` pour publier à toute heure, tous les jours."
+            ),
+            parse_mode='Markdown',
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("↩️ Annuler", callback_data="back_to_menu")]
+            ])
+        )
+        return WAITING_FOR_SCHEDULE
+    
     elif query.data == "back_to_menu":
         await start(update, context)
 
@@ -683,7 +1182,7 @@ async def handle_theme_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Revenir au menu principal
     await start(update, context)
-    return ConversationHandler.END
+    return end_conversation()
 
 async def handle_interval_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Gère l'entrée du nouvel intervalle"""
@@ -701,24 +1200,15 @@ async def handle_interval_input(update: Update, context: ContextTypes.DEFAULT_TY
         # Mettre à jour la configuration
         update_user_config(user_id, 'INTERVAL_MINUTES', new_interval)
         
-        # Mettre à jour le job en cours si l'auto-publication est activée
-        if USER_CONFIGS[user_id]['AUTO_POST_ENABLED'] and context.job_queue:
-            for job in context.job_queue.get_jobs_by_name(f"auto_post_{user_id}"):
-                job.schedule_removal()
-            
-            context.job_queue.run_repeating(
-                auto_post_job,
-                interval=new_interval * 60,
-                first=10,
-                data=update.effective_chat.id,
-                name=f"auto_post_{user_id}"
-            )
+        # Recalculer les créneaux de cet utilisateur si l'auto-publication est activée
+        if USER_CONFIGS[user_id]['AUTO_POST_ENABLED']:
+            schedule_user_posts(user_id)
         
         await update.message.reply_text(f"✅ Intervalle mis à jour avec succès: *{new_interval} minutes*", parse_mode='Markdown')
         
         # Revenir au menu principal
         await start(update, context)
-        return ConversationHandler.END
+        return end_conversation()
     
     except ValueError:
         await update.message.reply_text(
@@ -726,11 +1216,51 @@ async def handle_interval_input(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return WAITING_FOR_INTERVAL
 
+def describe_rules(user_id):
+    """Description lisible des créneaux d'un utilisateur"""
+    try:
+        return posting_rules(user_id).describe()
+    except RulesError as e:
+        return f"invalide ({e})"
+
+async def handle_schedule_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Gère l'entrée des nouveaux créneaux (fenêtres [jours] [fuseau])"""
+    user_id = str(update.effective_user.id)
+    parts = update.message.text.strip().split()
+    
+    if parts and parts[0].lower() == 'tout':
+        windows, days, timezone = '', '', USER_CONFIGS[user_id].get('TIMEZONE', DEFAULT_CONFIG['TIMEZONE'])
+    else:
+        windows = parts[0] if parts else ''
+        days = parts[1] if len(parts) > 1 else ''
+        timezone = parts[2] if len(parts) > 2 else USER_CONFIGS[user_id].get('TIMEZONE', DEFAULT_CONFIG['TIMEZONE'])
+    
+    # Valider les règles avant de les enregistrer
+    try:
+        PostingRules(USER_CONFIGS[user_id]['INTERVAL_MINUTES'], windows, days, timezone)
+    except RulesError as e:
+        await update.message.reply_text(f"⚠️ {e}. Veuillez réessayer.")
+        return WAITING_FOR_SCHEDULE
+    
+    update_user_config(user_id, 'POST_WINDOWS', windows)
+    update_user_config(user_id, 'POST_DAYS', days)
+    update_user_config(user_id, 'TIMEZONE', timezone)
+    
+    # Recalculer uniquement les créneaux de cet utilisateur
+    reply = f"✅ Créneaux mis à jour: *{describe_rules(user_id)}*"
+    if USER_CONFIGS[user_id]['AUTO_POST_ENABLED']:
+        reply += f"\nProchaine publication: {format_slot(user_id, schedule_user_posts(user_id))}"
+    await update.message.reply_text(reply, parse_mode='Markdown')
+    
+    # Revenir au menu principal
+    await start(update, context)
+    return end_conversation()
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Annule et termine la conversation."""
     await update.message.reply_text("❌ Opération annulée.")
     await start(update, context)
-    return ConversationHandler.END
+    return end_conversation()
 
 async def facebook_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Gestionnaire pour le webhook de callback Facebook"""
@@ -805,26 +1335,21 @@ async def facebook_callback_handler(update: Update, context: ContextTypes.DEFAUL
         else:
             # Créer des boutons pour chaque page
             keyboard = []
+            # Les jetons de page ne tiennent pas dans callback_data (64 octets max) :
+            # les données complètes restent dans context.user_data
+            context.user_data['page_options'] = {}
             for page in pages:
-                callback_data = f"select_page:{page['id']}:{page['name']}:{long_lived_token}:{expiry_date}"
-                # Limiter la longueur du callback_data
-                if len(callback_data) > 64:  # Limite Telegram pour callback_data
-                    # Simplifier pour rester dans les limites
-                    callback_data = f"select_page:{page['id']}"
-                    # Stocker les données complètes dans context.user_data
-                    if 'page_options' not in context.user_data:
-                        context.user_data['page_options'] = {}
-                    context.user_data['page_options'][page['id']] = {
-                        'name': page['name'],
-                        'token': long_lived_token,
-                        'expiry': expiry_date
-                    }
-                
-                keyboard.append([InlineKeyboardButton(page['name'], callback_data=callback_data)])
+                context.user_data['page_options'][page['id']] = {
+                    'name': page['name'],
+                    'token': page['access_token'],
+                    'expiry': expiry_date
+                }
+                keyboard.append([InlineKeyboardButton(page['name'], callback_data=f"select_page:{page['id']}")])
+            keyboard.append([InlineKeyboardButton("📢 Toutes les pages", callback_data="select_page:all")])
             
             await context.bot.send_message(
                 chat_id=telegram_id,
-                text="🔍 Veuillez sélectionner la page Facebook à utiliser:",
+                text="🔍 Veuillez sélectionner la page Facebook à utiliser, ou toutes vos pages pour publier sur chacune d'elles:",
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
     else:
@@ -842,6 +1367,27 @@ async def select_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
         parts = callback_data.split(":")
         page_id = parts[1]
         
+        if page_id == 'all':
+            page_options = context.user_data.get('page_options')
+            if not page_options:
+                await query.edit_message_text("❌ Erreur: données de page non trouvées. Veuillez réessayer l'authentification.")
+                return
+            pages = [
+                {'PAGE_ID': option_id, 'PAGE_NAME': option['name'], 'PAGE_ACCESS_TOKEN': option['token']}
+                for option_id, option in page_options.items()
+            ]
+            # La première page reste la page principale (vérification du jeton, mode une seule page)
+            first = next(iter(page_options.values()))
+            save_user_data(user_id, pages[0]['PAGE_ID'], pages[0]['PAGE_NAME'], first['token'], first['expiry'])
+            set_fanout_pages(user_id, pages)
+            
+            await query.edit_message_text(
+                text=f"✅ Publication sur *{len(pages)} pages* activée.\n\nVotre configuration est prête!",
+                parse_mode='Markdown'
+            )
+            await start(update, context)
+            return
+        
         if len(parts) >= 5:
             # Toutes les données sont dans le callback
             page_name = parts[2]
@@ -858,8 +1404,9 @@ async def select_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
                 await query.edit_message_text("❌ Erreur: données de page non trouvées. Veuillez réessayer l'authentification.")
                 return
         
-        # Enregistrer les données de l'utilisateur
+        # Enregistrer les données de l'utilisateur (une seule page : mode multi-pages désactivé)
         save_user_data(user_id, page_id, page_name, long_lived_token, expiry_date)
+        set_fanout_pages(user_id, [])
         
         await query.edit_message_text(
             text=f"✅ Page sélectionnée: *{page_name}*\n\nVotre configuration est prête!",
@@ -869,20 +1416,261 @@ async def select_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Revenir au menu principal
         await start(update, context)
 
+def page_access_token(user_id, page_id):
+    """Jeton d'accès d'une page de l'utilisateur (page principale ou mode multi-pages), ou None"""
+    config = USER_CONFIGS.get(str(user_id))
+    if not config:
+        return None
+    if config['PAGE_ID'] == page_id or not page_id:
+        return config['PAGE_ACCESS_TOKEN']
+    for page in config.get('PAGES', []):
+        if page['PAGE_ID'] == page_id:
+            return page['PAGE_ACCESS_TOKEN']
+    return None
+
+def collect_engagement(now=None):
+    """Importe les nouvelles publications du journal puis rafraîchit les statistiques échues.
+
+    Les appels sont groupés par jeton de page (jusqu'à 50 publications par
+    appel). Retourne le nombre de publications mises à jour.
+    """
+    now = int(now or time.time())
+    
+    # Import incrémental des publications réussies : seule la fin du CSV, depuis la position déjà lue
+    rows, offset, inode = MESSAGES_LEDGER.tail(ENGAGEMENT_STORE.ledger_offset, ENGAGEMENT_STORE.ledger_inode)
+    for row in rows:
+        if row['id_post'] and row.get('status', 'published') in ('', 'published'):
+            try:
+                published_at = time.mktime(time.strptime(row['date_post'], '%Y-%m-%d %H:%M:%S'))
+            except ValueError:
+                continue
+            ENGAGEMENT_STORE.add_post(
+                row['id_post'], row.get('user_id', ''), row.get('page_id', ''), row.get('theme', ''), published_at, row.get('image', '')
+            )
+    ENGAGEMENT_STORE.ledger_offset, ENGAGEMENT_STORE.ledger_inode = offset, inode
+    
+    # Regrouper les publications échues par jeton
+    batches = {}
+    for post_id, user_id, page_id in ENGAGEMENT_STORE.due(now):
+        token = page_access_token(user_id, page_id)
+        if token:
+            batches.setdefault(token, []).append(post_id)
+        else:
+            ENGAGEMENT_STORE.postpone(post_id, now)
+    
+    updated = 0
+    batch_size = DEFAULT_CONFIG['ENGAGEMENT_BATCH_SIZE']
+    for token, post_ids in batches.items():
+        for start_index in range(0, len(post_ids), batch_size):
+            chunk = post_ids[start_index:start_index + batch_size]
+            results = fetch_engagement(FACEBOOK_GRAPH_URL, token, chunk, timeout=(DEFAULT_CONFIG['HTTP_CONNECT_TIMEOUT_SECONDS'], DEFAULT_CONFIG['GRAPH_TIMEOUT_SECONDS']))
+            for post_id in chunk:
+                if post_id in results:
+                    ENGAGEMENT_STORE.update(post_id, *results[post_id], now=now)
+                    updated += 1
+                else:
+                    ENGAGEMENT_STORE.postpone(post_id, now)
+    
+    ENGAGEMENT_STORE.save()
+    logger.info(f"Engagement mis à jour pour {updated} publication(s) ({len(ENGAGEMENT_STORE)} suivies)")
+    return updated
+
+async def engagement_collect_job(context: ContextTypes.DEFAULT_TYPE):
+    """Collecte périodique des statistiques d'engagement (hors de la boucle asyncio)"""
+    try:
+        await asyncio.to_thread(collect_engagement)
+    except Exception as e:
+        logger.error(f"Erreur lors de la collecte de l'engagement: {e}")
+
+def is_admin(user_id):
+    """Indique si l'utilisateur Telegram est l'administrateur du bot"""
+    return bool(DEFAULT_CONFIG['ADMIN_TELEGRAM_ID']) and str(user_id) == str(DEFAULT_CONFIG['ADMIN_TELEGRAM_ID'])
+
+def breakers_summary():
+    """Disjoncteurs Graph ouverts ou en essai, pour /metrics"""
+    breakers = GRAPH_BREAKERS.not_closed()
+    if not breakers:
+        return "Disjoncteurs Graph: tous fermés"
+    return "Disjoncteurs Graph: " + ', '.join(f"{name} ({state}, essai dans {wait:.0f}s)" for name, state, wait in breakers[:20])
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Commande /metrics : résumé des mesures de publication (administrateur uniquement)"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Commande réservée à l'administrateur.")
+        return
+    
+    cache_stats = MESSAGE_CACHE.stats()
+    bank_stats = FRAGMENT_BANK.stats()
+    text = (
+        "📈 Métriques de publication\n\n"
+        f"{metrics.REGISTRY.render_summary()}\n\n"
+        f"Cache de messages: {cache_stats['hits']} hits / {cache_stats['misses']} miss "
+        f"({cache_stats['hit_rate']:.0%}), {cache_stats['messages']} messages\n"
+        f"Fragments: {bank_stats['themes']} thème(s), {bank_stats['composed']} messages composés "
+        f"pour {bank_stats['calls']} appel(s) OpenAI ({bank_stats['messages_per_call']:.1f} par appel)\n"
+        + breakers_summary() +
+        "\nGénération: " + ', '.join(
+            f"{name} ({state}" + (f", couverture à {delay:.1f}s)" if delay is not None else ")")
+            for name, state, delay in GENERATION_ROUTER.describe()
+        )
+    )
+    # Limite Telegram : 4096 caractères par message
+    for start_index in range(0, len(text), 4000):
+        await update.message.reply_text(text[start_index:start_index + 4000])
+
+async def lateness_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Commande /lateness : utilisateurs dont les publications partent le plus en retard (administrateur uniquement)"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Commande réservée à l'administrateur.")
+        return
+    
+    await update.message.reply_text(LATENESS_MONITOR.render_report())
+
+async def quota_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Commande /quota : parts de la file de fond par utilisateur, ou /quota <telegram_id> <poids> [tâches] (administrateur uniquement)"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Commande réservée à l'administrateur.")
+        return
+    
+    if context.args:
+        try:
+            user_id, weight = context.args[0], float(context.args[1])
+            max_running = int(context.args[2]) if len(context.args) > 2 else None
+        except (IndexError, ValueError):
+            await update.message.reply_text("Usage : /quota <telegram_id> <poids> [tâches simultanées]")
+            return
+        if weight <= 0 or (max_running is not None and max_running < 1):
+            await update.message.reply_text("❌ Le poids doit être positif et le nombre de tâches au moins 1.")
+            return
+        if not update_user_config(user_id, 'QUEUE_WEIGHT', weight):
+            await update.message.reply_text(f"❌ Utilisateur inconnu: {user_id}")
+            return
+        if max_running is not None:
+            update_user_config(user_id, 'QUEUE_MAX_RUNNING', max_running)
+        weight, max_running = work_quota(user_id)
+        await update.message.reply_text(f"✅ Quota de {user_id}: poids {weight:g}, {max_running} tâche(s) simultanée(s)")
+        return
+    
+    shares = WORK_QUEUE.shares()
+    lines = [
+        "⚖️ File de travail\n",
+        f"Interactif: {WORK_QUEUE.running(INTERACTIVE)} en cours, {WORK_QUEUE.waiting(INTERACTIVE)} en attente",
+        f"Fond: {WORK_QUEUE.running(BACKGROUND)} en cours, {WORK_QUEUE.waiting(BACKGROUND)} en attente\n"
+    ]
+    if not shares:
+        lines.append("Aucune publication de fond récente.")
+    for user_id, share, weight, running, waiting in shares[:15]:
+        lines.append(f"• {user_id}: {share:.1%} (poids {weight:g}), {running} en cours, {waiting} en attente")
+    await update.message.reply_text('\n'.join(lines))
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Commande /stats : rapport sur l'historique des publications (administrateur uniquement)"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Commande réservée à l'administrateur.")
+        return
+    
+    # Lecture du journal et calculs hors de la boucle asyncio
+    text = await asyncio.to_thread(history_analytics().render_report)
+    # Limite Telegram : 4096 caractères par message
+    for start_index in range(0, len(text), 4000):
+        await update.message.reply_text(text[start_index:start_index + 4000])
+
+async def engagement_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Commande /engagement : thèmes les plus performants sur 30 jours (administrateur uniquement)"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Commande réservée à l'administrateur.")
+        return
+    
+    started = time.perf_counter()
+    ranking = ENGAGEMENT_STORE.top_themes(days=30, limit=10)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if not ranking:
+        await update.message.reply_text("Aucune statistique d'engagement pour le moment.")
+        return
+    lines = ["🏆 Thèmes par engagement moyen (30 jours)\n"]
+    for item in ranking:
+        lines.append(
+            f"• {item['theme']}: {item['engagement_per_post']:.1f}/publication "
+            f"({item['posts']} publications, portée {item['reach']})"
+        )
+    lines.append(f"\n{len(ENGAGEMENT_STORE)} publications suivies, calcul en {elapsed_ms:.1f} ms")
+    await update.message.reply_text('\n'.join(lines))
+
+async def lateness_alert_job(context: ContextTypes.DEFAULT_TYPE):
+    """Alerte l'administrateur quand le retard p99 des publications dépasse le seuil"""
+    alert = LATENESS_MONITOR.alert_message()
+    if alert and DEFAULT_CONFIG['ADMIN_TELEGRAM_ID']:
+        OUTBOX.send(context.bot, DEFAULT_CONFIG['ADMIN_TELEGRAM_ID'], alert)
+
+def compact_ledger():
+    """Archive les publications de plus de LEDGER_ARCHIVE_DAYS jours ; retourne le rapport ou None"""
+    before = datetime.datetime.now() - datetime.timedelta(days=DEFAULT_CONFIG['LEDGER_ARCHIVE_DAYS'])
+    return MESSAGES_LEDGER.archive.compact(before.strftime('%Y-%m-%d %H:%M:%S'))
+
+async def compact_ledger_job(context: ContextTypes.DEFAULT_TYPE):
+    """Compaction quotidienne du journal des messages (hors de la boucle asyncio)"""
+    try:
+        report = await asyncio.to_thread(compact_ledger)
+    except Exception as e:
+        logger.error(f"Erreur lors de la compaction du journal: {e}")
+        return
+    if report and DEFAULT_CONFIG['ADMIN_TELEGRAM_ID']:
+        OUTBOX.send(
+            context.bot,
+            DEFAULT_CONFIG['ADMIN_TELEGRAM_ID'],
+            f"🗜️ Journal compacté: {report['rows']} publications archivées, "
+            f"{report['csv_bytes'] / 1024:.0f} Ko -> {report['segment_bytes'] / 1024:.0f} Ko (x{report['ratio']:.1f})"
+        )
+
+async def recover_publications_job(context: ContextTypes.DEFAULT_TYPE):
+    """Au démarrage : reprend les créneaux récents dont une publication est restée incertaine (arrêt en cours d'envoi)"""
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=DEFAULT_CONFIG['PUBLISH_RECOVERY_HOURS'])
+    for key, user_id, slot in PUBLISH_JOURNAL.unsettled(since):
+        if user_id not in USER_CONFIGS:
+            continue
+        logger.warning(f"Reprise du créneau {key}: publication incertaine")
+        context.application.create_task(run_auto_post(context.bot, user_id, slot))
+
+def compact_journal():
+    """Oublie les créneaux de plus de PUBLISH_JOURNAL_DAYS jours ; retourne le nombre de lignes conservées"""
+    before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=DEFAULT_CONFIG['PUBLISH_JOURNAL_DAYS'])
+    return PUBLISH_JOURNAL.compact(before)
+
+async def compact_journal_job(context: ContextTypes.DEFAULT_TYPE):
+    """Compaction quotidienne du journal d'idempotence (hors de la boucle asyncio)"""
+    try:
+        rows = await asyncio.to_thread(compact_journal)
+    except Exception as e:
+        logger.error(f"Erreur lors de la compaction du journal des publications: {e}")
+        return
+    logger.info(f"Journal des publications compacté: {rows} ligne(s) conservée(s)")
+
 async def daily_token_check(context: ContextTypes.DEFAULT_TYPE):
     """Vérification quotidienne des tokens qui expirent bientôt"""
     await check_expired_tokens(context)
 
-def main():
-    """Point d'entrée principal du programme"""
-    # Initialiser les fichiers CSV
-    initialize_csv_files()
-    
-    # Charger les données des utilisateurs
-    load_users_data()
-    
-    # Créer l'application
-    application = Application.builder().token(os.getenv('TELEGRAM_TOKEN')).build()
+async def shutdown_outbox(application):
+    """Envoie les résumés en attente avant l'arrêt"""
+    await OUTBOX.stop()
+
+async def startup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Commande /startup : durée des imports et des phases du démarrage (administrateur uniquement)"""
+    if not is_admin(update.effective_user.id):
+        await update.message.reply_text("❌ Commande réservée à l'administrateur.")
+        return
+    await update.message.reply_text(STARTUP.report())
+
+def build_application(token, post_init=None):
+    """Crée l'application Telegram avec ses handlers et les tâches programmées"""
+    # Import différé : telegram.ext (et l'ordonnanceur de la JobQueue) n'est chargé qu'ici
+    from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ConversationHandler
+    builder = Application.builder().token(token).post_shutdown(shutdown_outbox)
+    if post_init is not None:
+        builder = builder.post_init(post_init)
+    if DEFAULT_CONFIG['TELEGRAM_API_URL']:
+        # API Bot alternative (serveur local, bouchons de benchmark)
+        builder = builder.base_url(DEFAULT_CONFIG['TELEGRAM_API_URL'])
+    application = builder.build()
     
     # Ajouter les handlers de conversation
     conv_handler = ConversationHandler(
@@ -893,6 +1681,7 @@ def main():
         states={
             WAITING_FOR_THEME: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_theme_input)],
             WAITING_FOR_INTERVAL: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_interval_input)],
+            WAITING_FOR_SCHEDULE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_schedule_input)],
         },
         fallbacks=[CommandHandler('cancel', cancel)]
     )
@@ -901,6 +1690,12 @@ def main():
     
     # Ajouter d'autres handlers
     application.add_handler(CommandHandler('start', start))
+    application.add_handler(CommandHandler('metrics', metrics_command))
+    application.add_handler(CommandHandler('lateness', lateness_command))
+    application.add_handler(CommandHandler('engagement', engagement_command))
+    application.add_handler(CommandHandler('stats', stats_command))
+    application.add_handler(CommandHandler('startup', startup_command))
+    application.add_handler(CommandHandler('quota', quota_command))
     application.add_handler(CallbackQueryHandler(select_page_handler, pattern="^select_page:"))
     application.add_handler(CallbackQueryHandler(button_handler))
     
@@ -915,21 +1710,123 @@ def main():
             time=datetime.time(hour=9, minute=0, second=0),  # Vérification quotidienne à 9h00
             days=tuple(range(7))  # Tous les jours de la semaine
         )
-    
-    # Restaurer les tâches programmées pour les utilisateurs qui avaient activé l'auto-publication
-    for user_id, config in USER_CONFIGS.items():
-        if config.get('AUTO_POST_ENABLED', False):
+        
+        # Surveillance du retard des publications automatiques
+        job_queue.run_repeating(lateness_alert_job, interval=300, first=300, name="lateness_alert")
+        
+        # Dépilement des créneaux échus du calendrier
+        job_queue.run_repeating(
+            calendar_dispatch_job,
+            interval=DEFAULT_CONFIG['CALENDAR_TICK_SECONDS'],
+            first=DEFAULT_CONFIG['CALENDAR_TICK_SECONDS'],
+            name="calendar_dispatch"
+        )
+        
+        # Archivage quotidien des anciennes publications du journal
+        if DEFAULT_CONFIG['LEDGER_ARCHIVE_DAYS']:
+            job_queue.run_daily(compact_ledger_job, time=datetime.time(hour=3, minute=30), name="compact_ledger")
+        job_queue.run_daily(compact_journal_job, time=datetime.time(hour=3, minute=45), name="compact_journal")
+        
+        # Reprise des publications restées incertaines avant le redémarrage (après les chargements)
+        job_queue.run_once(recover_publications_job, when=DEFAULT_CONFIG['CALENDAR_TICK_SECONDS'], name="recover_publications")
+        
+        # Collecte des statistiques d'engagement des publications récentes
+        if DEFAULT_CONFIG['ENGAGEMENT_POLL_MINUTES']:
             job_queue.run_repeating(
-                auto_post_job,
-                interval=config['INTERVAL_MINUTES'] * 60,
-                first=60,  # Premier post après 1 minute au démarrage
-                data=user_id,
-                name=f"auto_post_{user_id}"
+                engagement_collect_job,
+                interval=DEFAULT_CONFIG['ENGAGEMENT_POLL_MINUTES'] * 60,
+                first=120,
+                name="engagement_collect"
             )
-            logger.info(f"Tâche programmée restaurée pour l'utilisateur {user_id}")
+    
+    return application
+
+def restore_schedules():
+    """Restaure les créneaux des utilisateurs qui avaient activé l'auto-publication"""
+    for user_id, config in list(USER_CONFIGS.items()):
+        if config.get('AUTO_POST_ENABLED', False):
+            schedule_user_posts(user_id)
+            logger.info(f"Créneaux restaurés pour l'utilisateur {user_id}")
+
+def load_users_and_schedules():
+    """CSV, utilisateurs puis créneaux (chaque étape dépend de la précédente)"""
+    with STARTUP.phase('csv'):
+        initialize_csv_files()
+    with STARTUP.phase('users'):
+        load_users_data()
+    with STARTUP.phase('schedules'):
+        restore_schedules()
+
+def load_engagement():
+    with STARTUP.phase('engagement'):
+        ENGAGEMENT_STORE.load()
+
+def load_journal():
+    with STARTUP.phase('journal'):
+        PUBLISH_JOURNAL.load()
+
+def load_fragments():
+    with STARTUP.phase('fragments'):
+        try:
+            FRAGMENT_BANK.load()
+        except (OSError, ValueError) as e:
+            logger.error(f"Erreur lors du chargement des fragments: {e}")
+
+def start_loading():
+    """Lance les chargements du démarrage en parallèle ; retourne leurs futures"""
+    executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='startup')
+    futures = [executor.submit(load) for load in (load_users_and_schedules, load_engagement, load_journal, load_fragments)]
+    executor.shutdown(wait=False)
+    return futures
+
+def profile_startup():
+    """Mesure le démarrage sans se connecter à Telegram, puis le coût des imports différés ; retourne le rapport"""
+    for future in start_loading():
+        future.result()
+    with STARTUP.phase('application'):
+        build_application(os.getenv('TELEGRAM_TOKEN') or '0:profile')
+    STARTUP.ready()
+    # Coût payé à la première utilisation (génération, /stats, premier appel HTTP)
+    for module in ('openai', 'numpy', 'requests'):
+        with STARTUP.phase(f"import {module} (différé)"):
+            __import__(module)
+    return STARTUP.report()
+
+def main():
+    """Point d'entrée principal du programme.
+
+    Les chargements (CSV, utilisateurs et créneaux, engagement, journal des
+    publications, fragments) tournent dans des threads pendant l'import de
+    telegram.ext, la construction de l'application et la connexion à
+    Telegram ; les mises à jour ne sont traitées qu'une fois tout chargé
+    (post_init).
+    """
+    if '--profile-startup' in sys.argv:
+        print(profile_startup())
+        return
+    
+    loading = start_loading()
+    
+    # Exposer les métriques au format Prometheus si un port est configuré
+    if DEFAULT_CONFIG['METRICS_PORT']:
+        metrics.start_metrics_server(DEFAULT_CONFIG['METRICS_PORT'])
+    
+    async def finish_startup(application):
+        # Connexion à Telegram (getMe) faite : attendre la fin des chargements
+        STARTUP.record('telegram', connecting_at, time.perf_counter() - connecting_at)
+        await asyncio.gather(*(asyncio.wrap_future(future) for future in loading))
+        STARTUP.ready()
+    
+    # Créer l'application
+    with STARTUP.phase('application'):
+        application = build_application(os.getenv('TELEGRAM_TOKEN'), post_init=finish_startup)
+    connecting_at = time.perf_counter()
     
     # Démarrer le bot
     application.run_polling()
 
+# Fin des imports et des objets du module
+STARTUP.record('import', STARTED_AT, time.perf_counter() - STARTED_AT)
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
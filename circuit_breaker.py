@@ -0,0 +1,144 @@
+import time
+import logging
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BREAKER_TRANSITIONS_TOTAL = metrics.REGISTRY.counter('waribiz_circuit_transitions_total', "Changements d'état des disjoncteurs par dépendance")
+BREAKER_REJECTED_TOTAL = metrics.REGISTRY.counter('waribiz_circuit_rejected_total', "Appels refusés par un disjoncteur ouvert")
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Appel refusé : le disjoncteur de la dépendance est ouvert"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Disjoncteur {name} ouvert (nouvel essai dans {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Disjoncteur d'une dépendance externe.
+
+    Fermé : les appels passent ; <failure_threshold> échecs consécutifs
+    l'ouvrent. Ouvert : les appels sont refusés pendant <reset_timeout>
+    secondes. Demi-ouvert : <half_open_calls> appels d'essai passent ; un
+    succès referme le disjoncteur, un échec le rouvre.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60, half_open_calls=1, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        if state != self.state:
+            logger.warning(f"Disjoncteur {self.name}: {self.state} -> {state}")
+            BREAKER_TRANSITIONS_TOTAL.inc(breaker=self.name, state=state)
+            self.state = state
+
+    def retry_after(self):
+        """Secondes avant le prochain appel d'essai (0 si les appels passent)"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - self.clock())
+
+    def available(self):
+        """Vrai si un appel pourrait passer maintenant (sans réserver d'appel d'essai)"""
+        with self._lock:
+            if self.state == OPEN:
+                return self.clock() - self._opened_at >= self.reset_timeout
+            return self.state == CLOSED or self._probes < self.half_open_calls
+
+    def allow(self):
+        """Réserve un appel ; False si le disjoncteur le refuse"""
+        with self._lock:
+            if self.state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+                self._probes = 0
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+        BREAKER_REJECTED_TOTAL.inc(breaker=self.name)
+        return False
+
+    def check(self):
+        """Comme allow(), mais lève CircuitOpenError si l'appel est refusé"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def release(self):
+        """Rend un appel d'essai réservé par allow() mais finalement pas effectué"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+                self._transition(OPEN)
+
+    def call(self, function, *args, **kwargs):
+        """Appelle <function> à travers le disjoncteur ; toute exception compte comme un échec"""
+        self.check()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+class BreakerRegistry:
+    """Disjoncteurs créés à la demande, par nom (ex. « graph », « graph:page:<id> »)"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=60, half_open_calls=1, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(
+                    name, self.failure_threshold, self.reset_timeout, self.half_open_calls, self.clock
+                )
+            return breaker
+
+    def retry_after(self, name):
+        """Secondes avant qu'un appel puisse passer (0 si le disjoncteur n'existe pas ou est fermé)"""
+        with self._lock:
+            breaker = self._breakers.get(name)
+        return breaker.retry_after() if breaker is not None else 0.0
+
+    def not_closed(self):
+        """Disjoncteurs ouverts ou demi-ouverts : [(nom, état, secondes avant essai)]"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [(breaker.name, breaker.state, breaker.retry_after()) for breaker in breakers if breaker.state != CLOSED]
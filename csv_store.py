@@ -0,0 +1,290 @@
+import os
+import csv
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Verrous intra-processus : un verrou par fichier, en complément du verrou consultatif
+_THREAD_LOCKS = {}
+_THREAD_LOCKS_GUARD = threading.Lock()
+
+
+def _thread_lock(path):
+    """Retourne le verrou de threads associé à un fichier"""
+    with _THREAD_LOCKS_GUARD:
+        lock = _THREAD_LOCKS.get(path)
+        if lock is None:
+            lock = _THREAD_LOCKS[path] = threading.RLock()
+        return lock
+
+
+@contextmanager
+def file_lock(path):
+    """Verrou exclusif sur <path>.lock, partagé entre threads et processus"""
+    path = os.path.abspath(path)
+    with _thread_lock(path):
+        with open(path + '.lock', 'a+b') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _fsync_directory(directory):
+    """Force l'écriture de l'entrée de répertoire après un renommage (POSIX uniquement)"""
+    if fcntl is None:
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_rows(path, fieldnames, rows):
+    """Écrit un CSV complet dans un fichier temporaire, fsync, puis renommage atomique"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+        os.replace(tmp_path, path)
+        _fsync_directory(directory)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_bytes(path, chunks):
+    """Écrit des blocs d'octets dans un fichier temporaire, fsync, puis renommage atomique"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(tmp_path, path)
+        _fsync_directory(directory)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_rows(path):
+    """Lit toutes les lignes d'un CSV (liste vide si le fichier n'existe pas)"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', newline='', encoding='utf-8') as csvfile:
+        return list(csv.DictReader(csvfile))
+
+
+def read_header(path):
+    """Retourne l'en-tête d'un CSV existant (liste vide si le fichier est vide)"""
+    with open(path, 'r', newline='', encoding='utf-8') as csvfile:
+        return next(csv.reader(csvfile), [])
+
+
+def merge_fieldnames(header, fieldnames):
+    """En-tête existant suivi des colonnes de <fieldnames> qui n'y figurent pas"""
+    return list(header) + [name for name in fieldnames if name not in header]
+
+
+def _ensure_header(path, fieldnames):
+    # Appelé sous file_lock(path) : retourne (en-tête du fichier, fichier (ré)écrit ?)
+    if not os.path.exists(path):
+        atomic_write_rows(path, fieldnames, [])
+        logger.info(f"Fichier CSV '{path}' créé.")
+        return list(fieldnames), True
+    header = read_header(path)
+    merged = merge_fieldnames(header, fieldnames)
+    if merged == header:
+        return header, False
+    atomic_write_rows(path, merged, read_rows(path))
+    logger.info(f"En-tête du fichier CSV '{path}' migré: {header} -> {merged}")
+    return merged, True
+
+
+def ensure_csv(path, fieldnames):
+    """Crée le CSV s'il n'existe pas, ou ajoute à son en-tête les colonnes de <fieldnames> qui manquent.
+
+    La migration ne fait qu'ajouter des colonnes (vides pour les lignes
+    existantes) : les colonnes inconnues de l'appelant sont conservées avec
+    leurs valeurs, l'en-tête n'est jamais réduit. Retourne True si le
+    fichier a été (ré)écrit.
+    """
+    with file_lock(path):
+        return _ensure_header(path, fieldnames)[1]
+
+
+class CsvTable:
+    """Table CSV indexée par une clé, mise à jour par fusion champ par champ.
+
+    Chaque écriture relit le fichier sous verrou et n'applique que les champs
+    modifiés : deux écrivains concurrents sur la même ligne ne s'écrasent pas.
+    Le fichier est réécrit avec son propre en-tête : les colonnes ajoutées par
+    un autre programme sont conservées.
+    """
+
+    def __init__(self, path, fieldnames, key):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.key = key
+
+    def ensure(self):
+        """Crée le fichier avec son en-tête s'il n'existe pas (ou migre l'en-tête)"""
+        return ensure_csv(self.path, self.fieldnames)
+
+    def rows(self):
+        """Retourne toutes les lignes de la table"""
+        return read_rows(self.path)
+
+    def get(self, key):
+        """Retourne la ligne correspondant à la clé, ou None"""
+        for row in self.rows():
+            if row[self.key] == str(key):
+                return row
+        return None
+
+    def upsert(self, key, changes, defaults=None):
+        """Fusionne <changes> dans la ligne <key> (créée à partir de <defaults> si absente)"""
+        return self.upsert_many([(key, changes)], defaults)[0]
+
+    def upsert_many(self, items, defaults=None):
+        """Fusionne plusieurs (clé, changements) en une seule réécriture du fichier"""
+        with file_lock(self.path):
+            fieldnames, _ = _ensure_header(self.path, self.fieldnames)
+            rows = read_rows(self.path)
+            index = {row[self.key]: row for row in rows}
+            merged_rows = []
+            for key, changes in items:
+                key = str(key)
+                row = index.get(key)
+                if row is None:
+                    row = {name: '' for name in fieldnames}
+                    row.update(defaults or {})
+                    row[self.key] = key
+                    rows.append(row)
+                    index[key] = row
+                row.update(changes)
+                merged_rows.append(dict(row))
+            atomic_write_rows(self.path, fieldnames, rows)
+        return merged_rows
+
+    def update(self, key, changes):
+        """Met à jour une ligne existante ; retourne None si la clé est inconnue"""
+        key = str(key)
+        with file_lock(self.path):
+            fieldnames, _ = _ensure_header(self.path, self.fieldnames)
+            rows = read_rows(self.path)
+            for row in rows:
+                if row[self.key] == key:
+                    row.update(changes)
+                    atomic_write_rows(self.path, fieldnames, rows)
+                    return dict(row)
+        return None
+
+
+class CsvLedger:
+    """Journal CSV en ajout seul (une ligne par publication).
+
+    Si une <archive> est fournie (voir ledger_archive), les anciennes lignes
+    qui y ont été compactées sont relues avant celles du CSV.
+    """
+
+    def __init__(self, path, fieldnames, archive=None):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.archive = archive
+
+    def ensure(self):
+        """Crée le journal avec son en-tête s'il n'existe pas (ou migre l'en-tête)"""
+        if self.archive is not None:
+            with file_lock(self.path):
+                self.archive.recover()
+        return ensure_csv(self.path, self.fieldnames)
+
+    def append(self, row):
+        """Ajoute une ligne de façon durable (verrou, écriture, fsync)"""
+        self.append_many([row])
+
+    def append_many(self, rows):
+        """Ajoute plusieurs lignes sous un seul verrou et un seul fsync"""
+        with file_lock(self.path):
+            # Colonnes dans l'ordre de l'en-tête du fichier, qui peut en compter d'autres
+            fieldnames, _ = _ensure_header(self.path, self.fieldnames)
+            with open(self.path, 'a', newline='', encoding='utf-8') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writerows(rows)
+                csvfile.flush()
+                os.fsync(csvfile.fileno())
+
+    def rows(self):
+        """Retourne toutes les lignes du journal (archive comprise)"""
+        if self.archive is None:
+            return read_rows(self.path)
+        with file_lock(self.path):
+            return self.archive.rows(self.fieldnames) + read_rows(self.path)
+
+    def tail(self, offset=0, inode=None):
+        """Lignes complètes écrites dans le CSV après la position <offset> (octets) du fichier <inode>.
+
+        Retourne (lignes, position, inode) ; les valeurs retournées servent au
+        prochain appel. Un fichier remplacé (compaction, migration d'en-tête)
+        ou raccourci est relu depuis son en-tête ; l'archive n'est jamais relue.
+        """
+        with file_lock(self.path):
+            if not os.path.exists(self.path):
+                return [], 0, None
+            stat = os.stat(self.path)
+            if stat.st_ino != inode or stat.st_size < offset:
+                offset = 0
+            if stat.st_size == offset:
+                return [], offset, stat.st_ino
+            rows = []
+            with open(self.path, 'rb') as csvfile:
+                header = csvfile.readline()
+                fieldnames = next(csv.reader([header.decode('utf-8')]), [])
+                offset = max(offset, len(header))
+                csvfile.seek(offset)
+                position = [offset]
+
+                def complete_lines():
+                    # Une dernière ligne sans fin de ligne (écriture en cours) n'est pas lue
+                    for line in iter(csvfile.readline, b''):
+                        if not line.endswith(b'\n'):
+                            return
+                        position[0] += len(line)
+                        yield line.decode('utf-8')
+
+                for row in csv.reader(complete_lines()):
+                    # Fin de l'enregistrement (un message peut tenir sur plusieurs lignes)
+                    offset = position[0]
+                    if len(row) == len(fieldnames):
+                        rows.append(dict(zip(fieldnames, row)))
+            return rows, offset, stat.st_ino
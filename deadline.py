@@ -0,0 +1,114 @@
+import time
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STAGE_TIMEOUTS_TOTAL = metrics.REGISTRY.counter('waribiz_stage_timeouts_total', "Étapes interrompues par un délai dépassé, par étape")
+
+# Délai par défaut d'un appel HTTP sortant hors échéance : (connexion, lecture)
+DEFAULT_HTTP_TIMEOUT = (5, 30)
+# En dessous, un appel n'a aucune chance d'aboutir : inutile de le lancer
+MIN_CALL_SECONDS = 0.5
+# Marge laissée aux délais des clients HTTP avant l'annulation asyncio (filet de sécurité)
+CANCEL_GRACE_SECONDS = 2.0
+
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Le budget de temps d'une opération est épuisé"""
+
+    def __init__(self, stage):
+        super().__init__(f"Délai dépassé pendant l'étape « {stage} »")
+        self.stage = stage
+
+
+class Deadline:
+    """Échéance d'une opération (publication, collecte), partagée par ses sous-appels.
+
+    Chaque sous-appel reçoit le temps restant, éventuellement plafonné :
+    génération, envoi à Facebook et notification se partagent un seul budget.
+    L'échéance courante est portée par une variable de contexte, héritée par
+    les tâches asyncio et par asyncio.to_thread : le code synchrone appelé
+    dans un thread retrouve ainsi son délai avec http_timeout().
+    """
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - self.clock())
+
+    def timeout(self, stage, cap=None):
+        """Délai à accorder à l'étape <stage> ; lève DeadlineExceeded s'il ne reste presque plus rien"""
+        remaining = self.remaining()
+        if remaining < MIN_CALL_SECONDS:
+            STAGE_TIMEOUTS_TOTAL.inc(stage=stage)
+            raise DeadlineExceeded(stage)
+        return min(remaining, cap) if cap else remaining
+
+    async def run(self, stage, awaitable):
+        """Attend <awaitable> dans la limite du temps restant ; l'annule et lève DeadlineExceeded sinon.
+
+        Les appels HTTP de l'étape ont déjà un délai borné par l'échéance :
+        l'annulation n'intervient qu'après CANCEL_GRACE_SECONDS de plus, pour
+        le code resté bloqué malgré tout.
+        """
+        try:
+            timeout = self.timeout(stage)
+        except DeadlineExceeded:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await asyncio.wait_for(awaitable, timeout + CANCEL_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            STAGE_TIMEOUTS_TOTAL.inc(stage=stage)
+            logger.warning(f"Étape « {stage} » interrompue après {timeout:.1f}s")
+            raise DeadlineExceeded(stage) from None
+
+    @contextmanager
+    def activate(self):
+        """Fait de cette échéance l'échéance courante (variable de contexte)"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+
+def current_deadline():
+    return _current.get()
+
+
+def http_timeout(stage, default=DEFAULT_HTTP_TIMEOUT):
+    """Délai d'un appel HTTP : celui par défaut, réduit au temps restant de l'échéance courante.
+
+    Retourne un couple (connexion, lecture) pour requests ; lève
+    DeadlineExceeded si l'échéance courante est (presque) atteinte.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    remaining = deadline.timeout(stage)
+    connect, read = default if isinstance(default, tuple) else (default, default)
+    return (min(connect, remaining), min(read, remaining))
+
+
+def call_timeout(stage, default=60.0):
+    """Délai unique (secondes) d'un appel, réduit au temps restant de l'échéance courante"""
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    return deadline.timeout(stage, default)
+
+
+def count_timeout(stage):
+    """Compte un délai dépassé détecté par un client (requests, OpenAI) plutôt que par l'échéance"""
+    STAGE_TIMEOUTS_TOTAL.inc(stage=stage)
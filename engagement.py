@@ -0,0 +1,348 @@
+import os
+import sys
+import json
+import time
+import array
+import bisect
+import logging
+import tempfile
+import threading
+
+import metrics
+from deadline import count_timeout
+
+logger = logging.getLogger(__name__)
+
+ENGAGEMENT_FETCH_TOTAL = metrics.REGISTRY.counter('waribiz_engagement_fetch_total', "Statistiques de publications récupérées via l'API Graph (par résultat)")
+ENGAGEMENT_BATCH_SECONDS = metrics.REGISTRY.histogram('waribiz_engagement_batch_seconds', "Durée d'un appel groupé (batch) de l'API Graph")
+
+# Champs demandés pour chaque publication (compteurs seuls, sans les listes détaillées)
+ENGAGEMENT_FIELDS = (
+    'reactions.summary(total_count).limit(0),comments.summary(total_count).limit(0),'
+    'shares,insights.metric(post_impressions_unique)'
+)
+
+# Fréquence de rafraîchissement selon l'âge de la publication : (âge max, intervalle) en secondes.
+# Au-delà du dernier palier, les statistiques ne sont plus rafraîchies.
+REFRESH_SCHEDULE = (
+    (24 * 3600, 3600),
+    (7 * 24 * 3600, 6 * 3600),
+    (30 * 24 * 3600, 24 * 3600),
+)
+
+# Limite de l'API Graph pour un appel groupé
+MAX_BATCH_SIZE = 50
+
+_MAGIC = b'WBENG1\n'
+_STRING_COLUMNS = ('post_id', 'user_id', 'page_id')
+_NUMERIC_COLUMNS = ('theme', 'image', 'published_at', 'fetched_at', 'next_fetch_at', 'reactions', 'comments', 'shares', 'reach')
+
+
+def refresh_interval(age_seconds, schedule=REFRESH_SCHEDULE):
+    """Intervalle avant le prochain rafraîchissement, ou None si la publication est trop ancienne"""
+    for max_age, interval in schedule:
+        if age_seconds < max_age:
+            return interval
+    return None
+
+
+class EngagementStore:
+    """Statistiques d'engagement des publications, stockées par colonnes.
+
+    Chaque colonne numérique est un array('q') contigu, les thèmes sont
+    encodés par dictionnaire et chaque publication est mise à jour sur place
+    (index post_id -> ligne). Les lignes sont dans l'ordre de publication :
+    le début d'une période se trouve par recherche dichotomique.
+
+    Des agrégats par jour et par thème (publications, engagement, portée)
+    sont maintenus à chaque mise à jour : « meilleurs thèmes sur 30 jours »
+    ne parcourt que 30 jours x thèmes cases, quel que soit l'historique.
+
+    Les <listeners> reçoivent chaque variation d'engagement et de portée
+    (page_id, thème, image, engagement, portée), chargement compris.
+    La collecte écrit depuis un thread pendant que /engagement lit depuis
+    la boucle asyncio : les accès passent par un verrou.
+    """
+
+    def __init__(self, path, schedule=REFRESH_SCHEDULE):
+        self.path = path
+        self.schedule = schedule
+        # Position (octets) et inode du CSV des messages déjà importés (CsvLedger.tail)
+        self.ledger_offset = 0
+        self.ledger_inode = None
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.themes = []
+        self._theme_codes = {}
+        self.images = []
+        self._image_codes = {}
+        self.columns = {name: [] for name in _STRING_COLUMNS}
+        self.columns.update({name: array.array('q') for name in _NUMERIC_COLUMNS})
+        self._index = {}
+        self._daily = {}  # jour (depuis l'époque) -> {code de thème: [publications, engagement, portée]}
+
+    def __len__(self):
+        return len(self.columns['post_id'])
+
+    # --- Persistance ---
+
+    def load(self):
+        """Charge le fichier (s'il existe) ; retourne le nombre de publications"""
+        with self._lock:
+            return self._load()
+
+    def _load(self):
+        self._reset()
+        self.ledger_offset, self.ledger_inode = 0, None
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'rb') as store_file:
+            if store_file.readline() != _MAGIC:
+                logger.error(f"Format de fichier d'engagement inconnu: {self.path}")
+                return 0
+            header = json.loads(store_file.readline())
+            # Sans inode (fichier plus ancien, position en lignes), le CSV est relu une fois : les doublons sont ignorés
+            if 'ledger_inode' in header:
+                self.ledger_offset, self.ledger_inode = header['ledger_offset'], header['ledger_inode']
+            self.themes = header['themes']
+            self._theme_codes = {theme: code for code, theme in enumerate(self.themes)}
+            self.images = header.get('images', [''])
+            self._image_codes = {image: code for code, image in enumerate(self.images)}
+            for name in _STRING_COLUMNS:
+                self.columns[name] = header['strings'][name]
+            # Colonnes dans l'ordre du fichier ; une colonne absente (fichier plus ancien) vaut 0
+            for name in header.get('columns', _NUMERIC_COLUMNS):
+                column = array.array('q')
+                column.frombytes(store_file.read(header['rows'] * column.itemsize))
+                if header['byteorder'] != sys.byteorder:
+                    column.byteswap()
+                self.columns[name] = column
+            for name in _NUMERIC_COLUMNS:
+                if len(self.columns[name]) != header['rows']:
+                    self.columns[name] = array.array('q', bytes(8 * header['rows']))
+        self._index = {post_id: row for row, post_id in enumerate(self.columns['post_id'])}
+        columns = self.columns
+        for row in range(len(self)):
+            self._aggregate(row, 1, columns['reactions'][row] + columns['comments'][row] + columns['shares'][row], columns['reach'][row])
+        return len(self)
+
+    def save(self):
+        """Écrit le fichier de façon atomique (fichier temporaire puis renommage)"""
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        header = {
+            'rows': len(self),
+            'byteorder': sys.byteorder,
+            'ledger_offset': self.ledger_offset,
+            'ledger_inode': self.ledger_inode,
+            'themes': self.themes,
+            'images': self.images,
+            'columns': list(_NUMERIC_COLUMNS),
+            'strings': {name: self.columns[name] for name in _STRING_COLUMNS}
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(self.path) + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as store_file:
+                store_file.write(_MAGIC)
+                store_file.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+                for name in _NUMERIC_COLUMNS:
+                    self.columns[name].tofile(store_file)
+                store_file.flush()
+                os.fsync(store_file.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # --- Mises à jour ---
+
+    @staticmethod
+    def _code(value, values, codes):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def _aggregate(self, row, posts, engagement, reach):
+        day = self.columns['published_at'][row] // 86400
+        totals = self._daily.setdefault(day, {}).setdefault(self.columns['theme'][row], [0, 0, 0])
+        totals[0] += posts
+        totals[1] += engagement
+        totals[2] += reach
+        if (engagement or reach) and self.listeners:
+            page_id = self.columns['page_id'][row]
+            theme = self.themes[self.columns['theme'][row]]
+            image = self.images[self.columns['image'][row]]
+            for listener in self.listeners:
+                listener(page_id, theme, image, engagement, reach)
+
+    def add_post(self, post_id, user_id, page_id, theme, published_at, image=''):
+        """Ajoute une publication à suivre (ignorée si déjà connue) ; retourne True si ajoutée"""
+        with self._lock:
+            return self._add_post(post_id, user_id, page_id, theme, published_at, image)
+
+    def _add_post(self, post_id, user_id, page_id, theme, published_at, image):
+        if not post_id or post_id in self._index:
+            return False
+        self._index[post_id] = len(self)
+        self.columns['post_id'].append(post_id)
+        self.columns['user_id'].append(str(user_id))
+        self.columns['page_id'].append(str(page_id))
+        self.columns['theme'].append(self._code(theme or '', self.themes, self._theme_codes))
+        self.columns['image'].append(self._code(image or '', self.images, self._image_codes))
+        self.columns['published_at'].append(int(published_at))
+        self.columns['fetched_at'].append(0)
+        self.columns['next_fetch_at'].append(int(published_at))
+        for name in ('reactions', 'comments', 'shares', 'reach'):
+            self.columns[name].append(0)
+        self._aggregate(len(self) - 1, 1, 0, 0)
+        return True
+
+    def update(self, post_id, reactions, comments, shares, reach, now=None):
+        """Met à jour les compteurs d'une publication et planifie son prochain rafraîchissement"""
+        with self._lock:
+            return self._update(post_id, reactions, comments, shares, reach, now)
+
+    def _update(self, post_id, reactions, comments, shares, reach, now):
+        row = self._index.get(post_id)
+        if row is None:
+            return False
+        now = int(now or time.time())
+        columns = self.columns
+        previous_engagement = columns['reactions'][row] + columns['comments'][row] + columns['shares'][row]
+        self._aggregate(row, 0, reactions + comments + shares - previous_engagement, reach - columns['reach'][row])
+        self.columns['reactions'][row] = reactions
+        self.columns['comments'][row] = comments
+        self.columns['shares'][row] = shares
+        self.columns['reach'][row] = reach
+        self.columns['fetched_at'][row] = now
+        self._postpone(post_id, now)
+        return True
+
+    def postpone(self, post_id, now=None):
+        """Reporte le prochain rafraîchissement selon l'âge de la publication (0 : plus suivie)"""
+        with self._lock:
+            self._postpone(post_id, now)
+
+    def _postpone(self, post_id, now):
+        row = self._index[post_id]
+        now = int(now or time.time())
+        interval = refresh_interval(now - self.columns['published_at'][row], self.schedule)
+        self.columns['next_fetch_at'][row] = now + interval if interval else 0
+
+    def due(self, now=None, limit=None):
+        """Publications à rafraîchir : liste de (post_id, user_id, page_id)"""
+        with self._lock:
+            return self._due(now, limit)
+
+    def _due(self, now, limit):
+        now = int(now or time.time())
+        next_fetch_at = self.columns['next_fetch_at']
+        # Les publications de plus de 30 jours ne sont plus suivies : ne parcourir que la fin
+        start = self._first_row_since(now - self.schedule[-1][0])
+        due = []
+        for row in range(start, len(self)):
+            if 0 < next_fetch_at[row] <= now:
+                due.append((self.columns['post_id'][row], self.columns['user_id'][row], self.columns['page_id'][row]))
+                if limit and len(due) >= limit:
+                    break
+        return due
+
+    # --- Requêtes ---
+
+    def _first_row_since(self, timestamp):
+        return bisect.bisect_left(self.columns['published_at'], timestamp)
+
+    def top_themes(self, days=30, limit=5, now=None):
+        """Thèmes triés par engagement moyen par publication sur les <days> derniers jours (UTC).
+
+        Retourne une liste de dicts (theme, posts, engagement, reach, engagement_per_post),
+        l'engagement étant la somme réactions + commentaires + partages.
+        """
+        today = int(now or time.time()) // 86400
+        with self._lock:
+            themes = list(self.themes)
+            posts_by_theme = [0] * len(themes)
+            engagement_by_theme = [0] * len(themes)
+            reach_by_theme = [0] * len(themes)
+            for day in range(today - days + 1, today + 1):
+                for code, (posts, engagement, reach) in self._daily.get(day, {}).items():
+                    posts_by_theme[code] += posts
+                    engagement_by_theme[code] += engagement
+                    reach_by_theme[code] += reach
+
+        ranking = [
+            {
+                'theme': themes[code] or '(inconnu)',
+                'posts': posts,
+                'engagement': engagement_by_theme[code],
+                'reach': reach_by_theme[code],
+                'engagement_per_post': engagement_by_theme[code] / posts
+            }
+            for code, posts in enumerate(posts_by_theme) if posts
+        ]
+        ranking.sort(key=lambda item: (item['engagement_per_post'], item['engagement']), reverse=True)
+        return ranking[:limit]
+
+
+def _summary_count(payload, field):
+    return int(((payload.get(field) or {}).get('summary') or {}).get('total_count') or 0)
+
+
+def parse_engagement(payload):
+    """Extrait (réactions, commentaires, partages, portée) d'une réponse Graph"""
+    reach = 0
+    for insight in (payload.get('insights') or {}).get('data', []):
+        if insight.get('name') == 'post_impressions_unique' and insight.get('values'):
+            reach = int(insight['values'][0].get('value') or 0)
+    return (
+        _summary_count(payload, 'reactions'),
+        _summary_count(payload, 'comments'),
+        int((payload.get('shares') or {}).get('count') or 0),
+        reach
+    )
+
+
+def fetch_engagement(graph_url, access_token, post_ids, session=None, timeout=30):
+    """Récupère les statistiques de plusieurs publications en un seul appel groupé.
+
+    Retourne {post_id: (réactions, commentaires, partages, portée)} pour les
+    publications obtenues ; les erreurs individuelles sont journalisées.
+    """
+    import requests
+    batch = [{'method': 'GET', 'relative_url': f"{post_id}?fields={ENGAGEMENT_FIELDS}"} for post_id in post_ids]
+    try:
+        with ENGAGEMENT_BATCH_SECONDS.time():
+            response = (session or requests).post(
+                graph_url,
+                data={'access_token': access_token, 'batch': json.dumps(batch), 'include_headers': 'false'},
+                timeout=timeout
+            )
+    except requests.RequestException as e:
+        if isinstance(e, requests.Timeout):
+            count_timeout('engagement')
+        logger.error(f"Erreur réseau lors de la récupération de l'engagement: {e}")
+        ENGAGEMENT_FETCH_TOTAL.inc(len(post_ids), result='error')
+        return {}
+    if response.status_code != 200:
+        logger.error(f"Erreur lors de la récupération de l'engagement: {response.text}")
+        ENGAGEMENT_FETCH_TOTAL.inc(len(post_ids), result='error')
+        return {}
+
+    results = {}
+    for post_id, item in zip(post_ids, response.json()):
+        if item and item.get('code') == 200:
+            results[post_id] = parse_engagement(json.loads(item['body']))
+            ENGAGEMENT_FETCH_TOTAL.inc(result='ok')
+        else:
+            logger.warning(f"Statistiques indisponibles pour la publication {post_id}: {item and item.get('body')}")
+            ENGAGEMENT_FETCH_TOTAL.inc(result='error')
+    return results
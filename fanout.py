@@ -0,0 +1,85 @@
+import time
+import asyncio
+import logging
+
+import metrics
+from rate_limit import TokenBucket
+from circuit_breaker import CircuitOpenError
+from deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+FANOUT_SECONDS = metrics.REGISTRY.histogram('waribiz_fanout_seconds', "Durée d'une publication multi-pages complète")
+FANOUT_PAGES_TOTAL = metrics.REGISTRY.counter('waribiz_fanout_pages_total', "Pages des publications multi-pages, par résultat")
+
+
+class PageResult:
+    """Résultat de la publication sur une page"""
+
+    __slots__ = ('page_id', 'page_name', 'post_id', 'status', 'error')
+
+    def __init__(self, page_id, page_name, post_id=None, status='failed', error=None):
+        self.page_id = page_id
+        self.page_name = page_name
+        self.post_id = post_id
+        self.status = status
+        self.error = error
+
+
+class FanoutPublisher:
+    """Publie un même message sur plusieurs pages en parallèle.
+
+    La concurrence globale est bornée par un sémaphore ; chaque page a son
+    propre seau à jetons. Une page qui a épuisé son quota est ignorée
+    (statut 'rate_limited') plutôt que de bloquer toute la diffusion ; une
+    page dont le disjoncteur est ouvert est reportée (statut 'deferred').
+    """
+
+    def __init__(self, concurrency=10, posts_per_hour=30, burst=2):
+        self.concurrency = concurrency
+        self.posts_per_hour = posts_per_hour
+        self.burst = burst
+        self._buckets = {}
+
+    def _bucket(self, page_id):
+        bucket = self._buckets.get(page_id)
+        if bucket is None:
+            bucket = self._buckets[page_id] = TokenBucket(self.posts_per_hour / 3600, self.burst)
+        return bucket
+
+    async def publish(self, pages, publish_one):
+        """Appelle publish_one(page) -> (post_id, erreur) pour chaque page, dans des threads.
+
+        <pages> : liste de dicts avec au moins 'PAGE_ID' et 'PAGE_NAME'.
+        Retourne la liste des PageResult dans l'ordre des pages.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(page):
+            result = PageResult(page['PAGE_ID'], page.get('PAGE_NAME', ''))
+            if not self._bucket(page['PAGE_ID']).try_take():
+                result.status = 'rate_limited'
+                result.error = "quota de publications de la page atteint"
+            else:
+                async with semaphore:
+                    try:
+                        result.post_id, result.error = await asyncio.to_thread(publish_one, page)
+                        result.status = 'published' if result.post_id else 'failed'
+                    except CircuitOpenError as e:
+                        result.status = 'deferred'
+                        result.error = str(e)
+                    except DeadlineExceeded as e:
+                        # Résultat incertain : l'envoi a pu aboutir après l'échéance
+                        result.status = 'timeout'
+                        result.error = str(e)
+                    except Exception as e:
+                        result.error = str(e)
+            FANOUT_PAGES_TOTAL.inc(outcome=result.status)
+            return result
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(run(page) for page in pages))
+        FANOUT_SECONDS.observe(time.perf_counter() - started)
+        published = sum(1 for result in results if result.status == 'published')
+        logger.info(f"Publication multi-pages: {published}/{len(results)} page(s) en {time.perf_counter() - started:.2f}s")
+        return list(results)
@@ -0,0 +1,379 @@
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+from circuit_breaker import CircuitBreaker
+from deadline import DeadlineExceeded, call_timeout, count_timeout, current_deadline
+from message_templates import DEFAULT_FRAGMENTS, compose_random
+from message_validator import StreamValidator, validate_message
+
+logger = logging.getLogger(__name__)
+
+GENERATION_SECONDS = metrics.REGISTRY.histogram('waribiz_generation_seconds', "Durée d'une génération de message par fournisseur")
+GENERATION_TOTAL = metrics.REGISTRY.counter('waribiz_generation_total', "Générations de messages par fournisseur et par résultat")
+GENERATION_HEDGES_TOTAL = metrics.REGISTRY.counter('waribiz_generation_hedges_total', "Requêtes de couverture (hedging) envoyées et requête gagnante")
+
+DEFAULT_MODEL = 'gpt-4o-mini'
+DEFAULT_PROVIDERS = ('openai', 'local', 'templates')
+# Délai d'un appel de génération hors échéance (secondes)
+DEFAULT_TIMEOUT = 45.0
+
+
+# Consignes de ton propres à chaque variante du prompt (bot_v1.py : « v1 », bot_v2.py et bot_v3.py : « v2 »)
+PROMPT_VARIANTS = {
+    'v1': "- Attirer immédiatement l'attention (ex : promesse de gains, exclusivité, simplicité)",
+    'v2': "-éviter de commencer par le mot <<prêt>>"
+          "- Utiliser un ton amical et engageant",
+}
+DEFAULT_PROMPT = 'v2'
+
+
+def generation_messages(theme, variant=DEFAULT_PROMPT):
+    """Prompt de génération d'un message complet"""
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Tu es un expert en copywriting et en marketing digital. Génère un message court, percutant et ultra engageant pour une publication Facebook qui promeut un bot Telegram de pronostics football. Le bot donne des coupons avec une forte probabilité de reuissite. "
+                "Le message doit obligatoirement :"
+                " - Commencer par un emoji ⚽, 🔥, 💰 ou 🎯"
+                " - Préciser que c'est gratuit"
+                f"{PROMPT_VARIANTS.get(variant, PROMPT_VARIANTS[DEFAULT_PROMPT])}"
+                "- Intégrer un appel à l'action clair et motivant : « Rejoins », « Clique ici », « Active ton accès », etc."
+                f"- Terminer par le lien du bot ➡️ https://t.me/Hcfa_bot"
+                "- Longueur idéale : entre 150 et 300 caractères"
+                "- PAS d'explications ni de commentaires, juste le message à publier"
+                f"- Thème spécifique à intégrer: {theme}"
+                "Génère uniquement le message prêt à publier."
+            )
+        }
+    ]
+
+
+def _is_timeout(error):
+    # Le SDK est forcément chargé si un appel a échoué
+    from openai import APITimeoutError
+    return isinstance(error, APITimeoutError)
+
+
+class OpenAIProvider:
+    """Génération via l'API OpenAI ou tout serveur compatible (base_url)"""
+
+    def __init__(self, name, api_key, base_url=None, model=DEFAULT_MODEL, streaming=True, max_retries=1,
+                 timeout=DEFAULT_TIMEOUT, prompt=DEFAULT_PROMPT):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url or None
+        self.model = model
+        self.streaming = streaming
+        # Peu de nouvelles tentatives dans le SDK : la couverture et le disjoncteur s'en chargent
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.prompt = prompt
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Import différé : le SDK OpenAI est lourd à charger et inutile tant qu'on ne génère rien
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=self.max_retries, timeout=self.timeout)
+        return self._client
+
+    def complete(self, messages, **options):
+        """Réponse complète (non validée) à <messages>"""
+        timeout = call_timeout('generation', self.timeout)
+        try:
+            with metrics.OPENAI_LATENCY.time():
+                response = self.client.chat.completions.create(model=self.model, messages=messages, timeout=timeout, **options)
+        except Exception as e:
+            if _is_timeout(e):
+                count_timeout('generation')
+            raise
+        return response.choices[0].message.content.strip()
+
+    def generate(self, theme, cancel=None):
+        """Message brut (non validé) ; None si <cancel> a été déclenché pendant la lecture du flux.
+
+        Le délai du SDK borne chaque lecture ; la durée totale du flux est
+        bornée par l'échéance courante, vérifiée à chaque fragment.
+        """
+        if not self.streaming:
+            message = self.complete(generation_messages(theme, self.prompt), max_tokens=300, temperature=0.7)
+            logger.info(f"Message généré ({self.name}): {message}")
+            return message
+
+        validator = StreamValidator()
+        chunks = 0
+        deadline = current_deadline()
+        timeout = call_timeout('generation', self.timeout)
+        with metrics.OPENAI_LATENCY.time():
+            try:
+                stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=generation_messages(theme, self.prompt),
+                    max_tokens=300,
+                    temperature=0.7,
+                    stream=True,
+                    timeout=timeout
+                )
+            except Exception as e:
+                if _is_timeout(e):
+                    count_timeout('generation')
+                raise
+            try:
+                for chunk in stream:
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    if deadline is not None and deadline.remaining() <= 0:
+                        count_timeout('generation')
+                        raise DeadlineExceeded('generation')
+                    chunks += 1
+                    if chunk.choices and validator.feed(chunk.choices[0].delta.content):
+                        break
+            finally:
+                # Fermer la connexion interrompt la génération côté serveur
+                stream.close()
+        message = validator.finish().strip()
+        metrics.OPENAI_STREAM_TOTAL.inc(reason=validator.reason)
+        metrics.OPENAI_STREAM_CHUNKS.observe(chunks)
+        logger.info(f"Message généré en flux ({self.name}, {validator.reason}, {chunks} fragments): {message}")
+        return message
+
+
+class TemplateProvider:
+    """Secours hors ligne : messages composés depuis la banque de fragments, ou les fragments intégrés"""
+
+    name = 'templates'
+
+    def __init__(self, bank=None, rng=None):
+        self.bank = bank
+        self.rng = rng or random.Random()
+
+    def generate(self, theme, cancel=None):
+        message = self.bank.compose(theme) if self.bank is not None else None
+        return message or compose_random(DEFAULT_FRAGMENTS, self.rng)
+
+
+class GenerationRouter:
+    """Génération à travers plusieurs fournisseurs, dans l'ordre de préférence.
+
+    Chaque fournisseur a son disjoncteur : un fournisseur en panne est sauté
+    jusqu'à l'appel d'essai suivant. Couverture (hedging) : si une requête
+    dépasse le p95 des durées récentes de son fournisseur, une seconde
+    requête identique part ; la première réponse l'emporte et l'autre est
+    interrompue. Les couvertures sont limitées à <max_hedge_ratio> des
+    requêtes pour ne pas doubler la charge en cas de lenteur généralisée.
+    Sous une échéance (deadline.py), l'attente est bornée par le temps
+    restant : au-delà, les requêtes en cours sont interrompues et
+    DeadlineExceeded est levée sans essayer les fournisseurs suivants.
+    """
+
+    def __init__(self, providers, hedging=True, hedge_quantile=0.95, min_samples=20, max_hedge_ratio=0.1,
+                 failure_threshold=5, reset_timeout=60, max_workers=16):
+        self.providers = list(providers)
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.breakers = {
+            provider.name: CircuitBreaker(f"generation:{provider.name}", failure_threshold, reset_timeout)
+            for provider in self.providers
+        }
+        self._latencies = {provider.name: deque(maxlen=500) for provider in self.providers}
+        self._requests = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='generation')
+
+    def hedge_delay(self, name):
+        """Seuil de couverture d'un fournisseur (p95 récent), None tant qu'il y a trop peu de mesures"""
+        with self._lock:
+            latencies = sorted(self._latencies[name])
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(self.hedge_quantile * len(latencies)))]
+
+    def _attempt(self, provider, theme, cancel):
+        started = time.perf_counter()
+        message = provider.generate(theme, cancel)
+        if message is not None:
+            elapsed = time.perf_counter() - started
+            GENERATION_SECONDS.observe(elapsed, provider=provider.name)
+            with self._lock:
+                self._latencies[provider.name].append(elapsed)
+        return message
+
+    def _may_hedge(self, provider):
+        if not self.hedging or isinstance(provider, TemplateProvider):
+            return False
+        with self._lock:
+            if self._hedges >= self.max_hedge_ratio * self._requests:
+                return False
+        return self.breakers[provider.name].allow()
+
+    def _submit(self, provider, theme, cancel):
+        # Chaque requête hérite du contexte (échéance courante) de l'appelant
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._attempt, provider, theme, cancel)
+
+    def _generate_with(self, provider, theme):
+        """Génère avec un fournisseur (et sa couverture éventuelle) ; lève l'exception si tout échoue"""
+        deadline = current_deadline()
+        cancels = [threading.Event()]
+        futures = {self._submit(provider, theme, cancels[0]): 'primary'}
+        hedge_delay = self.hedge_delay(provider.name) if self.hedging else None
+        # Sans seuil de couverture, la première attente est bornée par la seule échéance
+        delay = hedge_delay
+        if deadline is not None:
+            delay = deadline.remaining() if delay is None else min(delay, deadline.remaining())
+        done, pending = wait(futures, timeout=delay)
+        if not done and hedge_delay is not None and (deadline is None or deadline.remaining() > 0) and self._may_hedge(provider):
+            with self._lock:
+                self._hedges += 1
+            cancels.append(threading.Event())
+            futures[self._submit(provider, theme, cancels[1])] = 'hedge'
+            GENERATION_HEDGES_TOTAL.inc(provider=provider.name, request='sent')
+
+        error = None
+        pending = set(futures)
+        while pending:
+            timeout = deadline.remaining() if deadline is not None else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Échéance atteinte : les requêtes restantes s'arrêtent au prochain fragment
+                for cancel in cancels:
+                    cancel.set()
+                # L'appel d'essai de la couverture n'a pas abouti : le rendre (celui de la requête principale l'est par generate)
+                for future in pending:
+                    if futures[future] == 'hedge':
+                        self.breakers[provider.name].release()
+                count_timeout('generation')
+                raise DeadlineExceeded('generation')
+            for future in done:
+                try:
+                    message = future.result()
+                except DeadlineExceeded as e:
+                    if futures[future] == 'hedge':
+                        self.breakers[provider.name].release()
+                    error = e
+                    continue
+                except Exception as e:
+                    self.breakers[provider.name].record_failure()
+                    error = e
+                    continue
+                self.breakers[provider.name].record_success()
+                if message:
+                    for cancel in cancels:
+                        cancel.set()
+                    if len(futures) > 1:
+                        GENERATION_HEDGES_TOTAL.inc(provider=provider.name, request=f"won_{futures[future]}")
+                    return message
+        if error is not None:
+            raise error
+        return None
+
+    def generate(self, theme):
+        """Message brut du premier fournisseur disponible : (message, nom du fournisseur), ou (None, None)"""
+        with self._lock:
+            self._requests += 1
+        for provider in self.providers:
+            if not self.breakers[provider.name].allow():
+                GENERATION_TOTAL.inc(provider=provider.name, outcome='circuit_open')
+                continue
+            try:
+                message = self._generate_with(provider, theme)
+            except DeadlineExceeded:
+                # Le budget est épuisé, pas le fournisseur : rendre l'appel d'essai éventuel
+                self.breakers[provider.name].release()
+                GENERATION_TOTAL.inc(provider=provider.name, outcome='timeout')
+                raise
+            except Exception as e:
+                logger.error(f"Erreur de génération ({provider.name}): {e}")
+                GENERATION_TOTAL.inc(provider=provider.name, outcome='error')
+                continue
+            if message:
+                GENERATION_TOTAL.inc(provider=provider.name, outcome='success')
+                return message, provider.name
+            GENERATION_TOTAL.inc(provider=provider.name, outcome='empty')
+        return None, None
+
+    def complete(self, messages, **options):
+        """Réponse complète du premier modèle disponible (sans couverture) ; None si aucun ne répond"""
+        for provider in self.providers:
+            if not hasattr(provider, 'complete'):
+                continue
+            breaker = self.breakers[provider.name]
+            if not breaker.allow():
+                continue
+            try:
+                content = provider.complete(messages, **options)
+            except DeadlineExceeded:
+                breaker.release()
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                logger.error(f"Erreur de génération ({provider.name}): {e}")
+                continue
+            breaker.record_success()
+            return content
+        return None
+
+    def retry_after(self):
+        """Secondes avant qu'un fournisseur soit de nouveau joignable (0 si l'un d'eux l'est déjà)"""
+        waits = [self.breakers[provider.name].retry_after() for provider in self.providers]
+        return min(waits) if waits else 0.0
+
+    def describe(self):
+        """État des fournisseurs pour /metrics : [(nom, état du disjoncteur, seuil de couverture)]"""
+        return [(provider.name, self.breakers[provider.name].state, self.hedge_delay(provider.name)) for provider in self.providers]
+
+
+def generate_valid_message(router, theme, attempts=2):
+    """Génère un message valide : réparé localement si possible, régénéré seulement sinon"""
+    for attempt in range(1, attempts + 1):
+        message, provider = router.generate(theme)
+        if not message:
+            return None
+        validation = validate_message(message)
+        if not validation.problems:
+            return validation.message
+        logger.warning(f"Message généré invalide ({provider}: {', '.join(validation.problems)}), tentative {attempt}/{attempts}")
+    return None
+
+
+def build_router(config, bank=None):
+    """Fournisseurs de génération configurés, dans l'ordre de GENERATION_PROVIDERS"""
+    available = {}
+    if config.get('OPENAI_API_KEY'):
+        available['openai'] = OpenAIProvider(
+            'openai', config['OPENAI_API_KEY'], config.get('OPENAI_BASE_URL'),
+            config.get('OPENAI_MODEL') or DEFAULT_MODEL, config.get('GENERATION_STREAMING', True),
+            timeout=config.get('GENERATION_TIMEOUT_SECONDS') or DEFAULT_TIMEOUT,
+            prompt=config.get('GENERATION_PROMPT') or DEFAULT_PROMPT
+        )
+    if config.get('LOCAL_LLM_BASE_URL'):
+        # Serveur local compatible OpenAI (vLLM, llama.cpp, Ollama...) : la clé est souvent ignorée
+        available['local'] = OpenAIProvider(
+            'local', config.get('LOCAL_LLM_API_KEY') or 'local', config['LOCAL_LLM_BASE_URL'],
+            config.get('LOCAL_LLM_MODEL') or DEFAULT_MODEL, config.get('GENERATION_STREAMING', True),
+            timeout=config.get('GENERATION_TIMEOUT_SECONDS') or DEFAULT_TIMEOUT,
+            prompt=config.get('GENERATION_PROMPT') or DEFAULT_PROMPT
+        )
+    if config.get('GENERATION_TEMPLATE_FALLBACK', True):
+        available['templates'] = TemplateProvider(bank)
+    order = config.get('GENERATION_PROVIDERS') or DEFAULT_PROVIDERS
+    providers = [available[name] for name in order if name in available]
+    if not providers:
+        logger.error("Aucun fournisseur de génération configuré.")
+    return GenerationRouter(
+        providers,
+        hedging=config.get('GENERATION_HEDGING', True),
+        failure_threshold=config.get('GENERATION_BREAKER_FAILURES', 5),
+        reset_timeout=config.get('GENERATION_BREAKER_RESET_SECONDS', 60)
+    )
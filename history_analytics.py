@@ -0,0 +1,280 @@
+import os
+import csv
+import time
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Lignes converties en tableaux NumPy à la fois lors de la lecture du journal
+DEFAULT_CHUNK_ROWS = 200_000
+# Statuts comptés comme des échecs de publication
+FAILED_STATUSES = ('failed', 'rate_limited')
+LENGTH_BINS = (0, 100, 150, 200, 250, 300, 400, 600, 1000)
+
+
+def opener(message, words=2):
+    """Début d'un message (ses <words> premiers mots), ex. « 🔥 Prêts »"""
+    return ' '.join(message.split(None, words)[:words])
+
+
+class LedgerAnalytics:
+    """Statistiques de l'historique des publications, calculées sur des colonnes NumPy.
+
+    Le journal est lu une fois par blocs de <chunk_rows> lignes, chaque bloc
+    étant converti en tableaux (utilisateur et début de message encodés par
+    dictionnaire, jour en entier, longueur, échec). Les lectures suivantes ne
+    traitent que les lignes ajoutées depuis (le journal est en ajout seul) ;
+    le fichier est relu entièrement s'il a été remplacé (migration d'en-tête,
+    compaction). Les segments de l'<archive> éventuelle sont chargés d'abord,
+    directement depuis leurs colonnes encodées.
+    Les rapports sont des agrégations vectorisées sur ces colonnes.
+    """
+
+    def __init__(self, path, chunk_rows=DEFAULT_CHUNK_ROWS, archive=None):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.archive = archive
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.users = []
+        self._user_codes = {}
+        self.openers = []
+        self._opener_codes = {}
+        self._chunks = []
+        self._columns = None
+        self._offset = 0
+        self._inode = None
+        self._fieldnames = None
+
+    # --- Chargement ---
+
+    @staticmethod
+    def _code(value, values, codes):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def refresh(self):
+        """Lit les lignes ajoutées au journal depuis le dernier appel ; retourne leur nombre"""
+        with self._lock:
+            if not os.path.exists(self.path):
+                self._reset()
+                return 0
+            stat = os.stat(self.path)
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._reset()
+                self._inode = stat.st_ino
+                if self.archive is not None:
+                    self._load_archive()
+            if stat.st_size == self._offset:
+                return 0
+            with open(self.path, 'rb') as ledger_file:
+                if self._fieldnames is None:
+                    header = ledger_file.readline()
+                    self._fieldnames = next(csv.reader([header.decode('utf-8')]), [])
+                    self._offset = len(header)
+                ledger_file.seek(self._offset)
+                added = self._read_chunks(ledger_file)
+            if added:
+                self._columns = None
+            return added
+
+    def _load_archive(self):
+        """Charge les segments d'archive : colonnes dictionnaire et dates sans repasser par le texte"""
+        for segment in self.archive.segments():
+            if not segment.rows:
+                continue
+            user_raw, user_column = segment.raw_column('user_id')
+            if user_column is not None and user_column['kind'] == 'dict':
+                mapping = np.array([self._code(value, self.users, self._user_codes) for value in user_column['values']], dtype=np.int32)
+                users = mapping[np.frombuffer(user_raw, dtype=np.int32)]
+            else:
+                users = np.array([self._code(value, self.users, self._user_codes) for value in segment.column('user_id')], dtype=np.int32)
+
+            date_raw, date_column = segment.raw_column('date_post')
+            if date_column['kind'] == 'time':
+                days = (np.frombuffer(date_raw, dtype=np.int64) // 86400).astype(np.int32)
+            else:
+                days = np.array([value[:10] for value in segment.column('date_post')], dtype='datetime64[D]').astype(np.int32)
+
+            status_raw, status_column = segment.raw_column('status')
+            if status_column is None:
+                failed = np.zeros(segment.rows, dtype=bool)
+            elif status_column['kind'] == 'dict':
+                failed = np.array([value in FAILED_STATUSES for value in status_column['values']], dtype=bool)[np.frombuffer(status_raw, dtype=np.int32)]
+            else:
+                failed = np.array([value in FAILED_STATUSES for value in segment.column('status')], dtype=bool)
+
+            messages = segment.column('message')
+            self._chunks.append({
+                'user': users,
+                'day': days,
+                'failed': failed,
+                'length': np.fromiter((len(message) for message in messages), dtype=np.int32, count=len(messages)),
+                'opener': np.fromiter((self._code(opener(message), self.openers, self._opener_codes) for message in messages), dtype=np.int32, count=len(messages)),
+            })
+
+    def _complete_lines(self, ledger_file, position):
+        """Lignes entières du fichier ; position[0] avance avec les octets lus.
+
+        Une dernière ligne sans fin de ligne (écriture en cours) n'est pas lue.
+        """
+        for line in iter(ledger_file.readline, b''):
+            if not line.endswith(b'\n'):
+                return
+            position[0] += len(line)
+            yield line.decode('utf-8')
+
+    def _read_chunks(self, ledger_file):
+        fields = self._fieldnames
+        user_index = fields.index('user_id') if 'user_id' in fields else None
+        message_index = fields.index('message')
+        date_index = fields.index('date_post')
+        status_index = fields.index('status') if 'status' in fields else None
+        width = len(fields)
+
+        added = 0
+        users, days, failed, lengths, openers = [], [], [], [], []
+        position = [self._offset]
+        for row in csv.reader(self._complete_lines(ledger_file, position)):
+            # Position après le dernier enregistrement complet (un message peut tenir sur plusieurs lignes)
+            self._offset = position[0]
+            if len(row) < width:
+                continue
+            message = row[message_index]
+            users.append(self._code(row[user_index] if user_index is not None else '', self.users, self._user_codes))
+            days.append(row[date_index][:10])
+            failed.append(status_index is not None and row[status_index] in FAILED_STATUSES)
+            lengths.append(len(message))
+            openers.append(self._code(opener(message), self.openers, self._opener_codes))
+            if len(users) >= self.chunk_rows:
+                added += self._append_chunk(users, days, failed, lengths, openers)
+                users, days, failed, lengths, openers = [], [], [], [], []
+        if users:
+            added += self._append_chunk(users, days, failed, lengths, openers)
+        return added
+
+    def _append_chunk(self, users, days, failed, lengths, openers):
+        self._chunks.append({
+            'user': np.array(users, dtype=np.int32),
+            # Conversion vectorisée 'AAAA-MM-JJ' -> jours depuis l'époque
+            'day': np.array(days, dtype='datetime64[D]').astype(np.int32),
+            'failed': np.array(failed, dtype=bool),
+            'length': np.array(lengths, dtype=np.int32),
+            'opener': np.array(openers, dtype=np.int32),
+        })
+        return len(users)
+
+    def columns(self):
+        """Colonnes de tout l'historique (concaténées une seule fois par rafraîchissement)"""
+        with self._lock:
+            if self._columns is None:
+                if self._chunks:
+                    self._columns = {name: np.concatenate([chunk[name] for chunk in self._chunks]) for name in self._chunks[0]}
+                    self._chunks = [self._columns]
+                else:
+                    self._columns = {
+                        'user': np.empty(0, np.int32), 'day': np.empty(0, np.int32), 'failed': np.empty(0, bool),
+                        'length': np.empty(0, np.int32), 'opener': np.empty(0, np.int32)
+                    }
+            return self._columns
+
+    def __len__(self):
+        return len(self.columns()['user'])
+
+    # --- Rapports ---
+
+    def posts_per_user_per_day(self, limit=5):
+        """Moyenne des publications par utilisateur et par jour actif, et utilisateurs les plus actifs.
+
+        Retourne (moyenne globale, [(user_id, publications/jour, jours actifs), ...]).
+        """
+        columns = self.columns()
+        if not len(columns['user']):
+            return 0.0, []
+        first_day = int(columns['day'].min())
+        span = int(columns['day'].max()) - first_day + 1
+        # Une case par couple (utilisateur, jour)
+        pairs, counts = np.unique(columns['user'].astype(np.int64) * span + (columns['day'] - first_day), return_counts=True)
+        pair_users = pairs // span
+        active_days = np.bincount(pair_users, minlength=len(self.users))
+        posts = np.bincount(pair_users, weights=counts, minlength=len(self.users))
+        mask = active_days > 0
+        per_day = np.zeros(len(self.users))
+        per_day[mask] = posts[mask] / active_days[mask]
+        top = np.argsort(per_day)[::-1][:limit]
+        return float(counts.mean()), [(self.users[code], float(per_day[code]), int(active_days[code])) for code in top if mask[code]]
+
+    def failure_rates(self, limit=5, min_posts=1):
+        """Taux d'échec global et utilisateurs au taux d'échec le plus élevé : (taux, [(user_id, taux, tentatives)])"""
+        columns = self.columns()
+        if not len(columns['user']):
+            return 0.0, []
+        attempts = np.bincount(columns['user'], minlength=len(self.users))
+        failures = np.bincount(columns['user'], weights=columns['failed'], minlength=len(self.users))
+        rates = np.divide(failures, attempts, out=np.zeros(len(self.users)), where=attempts > 0)
+        rates[attempts < min_posts] = -1
+        top = np.argsort(rates)[::-1][:limit]
+        return float(columns['failed'].mean()), [
+            (self.users[code], float(rates[code]), int(attempts[code])) for code in top if rates[code] > 0
+        ]
+
+    def length_distribution(self, bins=LENGTH_BINS):
+        """Percentiles et histogramme de la longueur des messages (caractères)"""
+        lengths = self.columns()['length']
+        if not len(lengths):
+            return {'percentiles': {}, 'histogram': []}
+        p50, p90, p99 = np.percentile(lengths, [50, 90, 99])
+        edges = np.array(list(bins) + [max(int(lengths.max()) + 1, bins[-1] + 1)])
+        counts, _ = np.histogram(lengths, bins=edges)
+        return {
+            'percentiles': {'p50': float(p50), 'p90': float(p90), 'p99': float(p99), 'max': int(lengths.max())},
+            'histogram': [(int(edges[i]), int(edges[i + 1]), int(counts[i])) for i in range(len(counts))]
+        }
+
+    def top_openers(self, limit=10):
+        """Débuts de message les plus répétés : [(début, occurrences, part)]"""
+        codes = self.columns()['opener']
+        if not len(codes):
+            return []
+        counts = np.bincount(codes, minlength=len(self.openers))
+        top = np.argsort(counts)[::-1][:limit]
+        return [(self.openers[code], int(counts[code]), float(counts[code] / len(codes))) for code in top if counts[code]]
+
+    def render_report(self):
+        """Rapport texte pour la commande /stats"""
+        started = time.perf_counter()
+        self.refresh()
+        loaded = time.perf_counter()
+        rows = len(self)
+        if not rows:
+            return "Aucune publication dans l'historique."
+
+        average, busiest = self.posts_per_user_per_day()
+        failure_rate, failing = self.failure_rates(min_posts=5)
+        lengths = self.length_distribution()
+        openers = self.top_openers(5)
+        finished = time.perf_counter()
+
+        lines = [f"📊 Historique des publications ({rows} lignes, {len(self.users)} utilisateurs)\n"]
+        lines.append(f"Publications par utilisateur et par jour actif: {average:.2f} en moyenne")
+        lines.extend(f"• {user_id or '(inconnu)'}: {per_day:.1f}/jour sur {days} jour(s)" for user_id, per_day, days in busiest)
+        lines.append(f"\nTaux d'échec global: {failure_rate:.1%}")
+        lines.extend(f"• {user_id or '(inconnu)'}: {rate:.0%} sur {attempts} tentatives" for user_id, rate, attempts in failing)
+        percentiles = lengths['percentiles']
+        lines.append(
+            f"\nLongueur des messages: p50={percentiles['p50']:.0f} p90={percentiles['p90']:.0f} "
+            f"p99={percentiles['p99']:.0f} max={percentiles['max']}"
+        )
+        lines.extend(f"• {low}-{high - 1}: {count}" for low, high, count in lengths['histogram'] if count)
+        lines.append("\nDébuts de message les plus répétés:")
+        lines.extend(f"• « {text} »: {count} ({share:.0%})" for text, count, share in openers)
+        lines.append(f"\nLecture {loaded - started:.2f}s, calcul {finished - loaded:.3f}s")
+        return '\n'.join(lines)
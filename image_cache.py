@@ -0,0 +1,108 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Image publiée quand le dossier d'images est vide ou absent
+DEFAULT_IMAGE_URL = 'https://images.unsplash.com/photo-1530631673369-bc20fdb32288?q=80&w=1760&auto=format&fit=crop'
+
+IMAGE_CACHE_TOTAL = metrics.REGISTRY.counter('waribiz_image_cache_total', "Lectures d'images via le cache mémoire (hit/miss)")
+
+
+class CachedImage:
+    """Contenu d'une image en mémoire et son empreinte SHA-256 (calculée une seule fois)"""
+
+    __slots__ = ('path', 'data', 'digest', 'size', 'mtime_ns', 'checked_at')
+
+    def __init__(self, path, data, mtime_ns, checked_at):
+        self.path = path
+        self.data = data
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.size = len(data)
+        self.mtime_ns = mtime_ns
+        self.checked_at = checked_at
+
+
+class ImageCache:
+    """Cache LRU des images, borné en octets et partagé par toutes les publications.
+
+    Un fichier n'est revalidé (os.stat) qu'au plus une fois toutes les
+    <revalidate_seconds> : pour les images fréquentes, plus aucune lecture
+    disque. Les fichiers plus gros que le budget ne sont pas mis en cache.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, revalidate_seconds=60, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.clock = clock
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # chemin -> CachedImage
+        self._listings = {}  # dossier -> (horodatage, [chemins])
+        self._lock = threading.Lock()
+
+    def list_images(self, folder):
+        """Images du dossier (liste mise en cache), vide si le dossier n'existe pas"""
+        now = self.clock()
+        with self._lock:
+            listing = self._listings.get(folder)
+            if listing and now - listing[0] < self.revalidate_seconds:
+                return listing[1]
+        if os.path.isdir(folder):
+            paths = [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.lower().endswith(IMAGE_EXTENSIONS)]
+        else:
+            paths = []
+        with self._lock:
+            self._listings[folder] = (now, paths)
+        return paths
+
+    def random_image(self, folder):
+        """Image aléatoire du dossier, ou DEFAULT_IMAGE_URL s'il n'en contient aucune"""
+        images = self.list_images(folder)
+        return random.choice(images) if images else DEFAULT_IMAGE_URL
+
+    def get(self, path):
+        """Retourne l'image en cache (chargée si nécessaire), ou None si elle est trop grosse"""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and now - entry.checked_at < self.revalidate_seconds:
+                self._entries.move_to_end(path)
+                IMAGE_CACHE_TOTAL.inc(result='hit')
+                return entry
+
+        stat = os.stat(path)
+        if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            with self._lock:
+                entry.checked_at = now
+                if path in self._entries:
+                    self._entries.move_to_end(path)
+            IMAGE_CACHE_TOTAL.inc(result='hit')
+            return entry
+
+        IMAGE_CACHE_TOTAL.inc(result='miss')
+        if stat.st_size > self.max_bytes:
+            return None
+        with open(path, 'rb') as image_file:
+            entry = CachedImage(path, image_file.read(), stat.st_mtime_ns, now)
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self.current_bytes -= previous.size
+            self._entries[path] = entry
+            self.current_bytes += entry.size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.size
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {'images': len(self._entries), 'bytes': self.current_bytes, 'max_bytes': self.max_bytes}
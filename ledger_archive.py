@@ -0,0 +1,251 @@
+import os
+import csv
+import json
+import time
+import array
+import hashlib
+import logging
+import calendar
+
+import zstandard
+
+from csv_store import file_lock, read_header, atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'WBLA1\n'
+_SEGMENT_PREFIX = 'segment-'
+_SEGMENT_SUFFIX = '.wbla'
+_TEXT_SEPARATOR = '\x00'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Colonnes à faible cardinalité, encodées par dictionnaire
+DICTIONARY_FIELDS = ('user_id', 'page_id', 'status', 'theme', 'image')
+# Colonnes de dates, stockées en secondes (heure murale, sans fuseau)
+TIME_FIELDS = ('date_post',)
+
+
+def _to_timestamp(value):
+    return calendar.timegm(time.strptime(value, DATE_FORMAT))
+
+
+def _from_timestamp(value):
+    return time.strftime(DATE_FORMAT, time.gmtime(value))
+
+
+def encode_segment(fieldnames, rows, level=19, extra_header=None):
+    """Encode des lignes en segment colonne par colonne ; retourne les octets du segment"""
+    compressor = zstandard.ZstdCompressor(level=level)
+    header = {'rows': len(rows), 'fields': list(fieldnames), 'columns': []}
+    header.update(extra_header or {})
+    blobs = []
+    for name in fieldnames:
+        values = [row.get(name) or '' for row in rows]
+        column = {'name': name}
+        if name in TIME_FIELDS:
+            try:
+                column['kind'] = 'time'
+                raw = array.array('q', (_to_timestamp(value) for value in values)).tobytes()
+            except ValueError:
+                column['kind'] = 'text'
+        elif name in DICTIONARY_FIELDS:
+            codes = {}
+            column['kind'] = 'dict'
+            column['values'] = []
+            for value in values:
+                if value not in codes:
+                    codes[value] = len(column['values'])
+                    column['values'].append(value)
+            raw = array.array('i', (codes[value] for value in values)).tobytes()
+        else:
+            column['kind'] = 'text'
+        if column['kind'] == 'text':
+            if any(_TEXT_SEPARATOR in value for value in values):
+                raise ValueError(f"Caractère nul dans la colonne {name}")
+            raw = _TEXT_SEPARATOR.join(values).encode('utf-8')
+        blob = compressor.compress(raw)
+        column['bytes'] = len(blob)
+        header['columns'].append(column)
+        blobs.append(blob)
+    return b''.join([_MAGIC, json.dumps(header, ensure_ascii=False).encode('utf-8'), b'\n'] + blobs)
+
+
+class Segment:
+    """Segment d'archive : lecture paresseuse, colonne par colonne"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as segment_file:
+            if segment_file.readline() != _MAGIC:
+                raise ValueError(f"Segment d'archive invalide: {path}")
+            self.header = json.loads(segment_file.readline())
+            self._data_offset = segment_file.tell()
+        self.rows = self.header['rows']
+        self.fields = self.header['fields']
+
+    def column(self, name):
+        """Valeurs décodées d'une colonne (liste de chaînes ; '' si la colonne est absente)"""
+        raw, column = self.raw_column(name)
+        if column is None:
+            return [''] * self.rows
+        if column['kind'] == 'text':
+            return raw.decode('utf-8').split(_TEXT_SEPARATOR) if self.rows else []
+        codes = array.array('q' if column['kind'] == 'time' else 'i')
+        codes.frombytes(raw)
+        if column['kind'] == 'time':
+            return [_from_timestamp(value) for value in codes]
+        values = column['values']
+        return [values[code] for code in codes]
+
+    def raw_column(self, name):
+        """(octets décompressés, description) d'une colonne, ou (None, None) si absente"""
+        offset = self._data_offset
+        for column in self.header['columns']:
+            if column['name'] == name:
+                with open(self.path, 'rb') as segment_file:
+                    segment_file.seek(offset)
+                    blob = segment_file.read(column['bytes'])
+                return zstandard.ZstdDecompressor().decompress(blob), column
+            offset += column['bytes']
+        return None, None
+
+    def read_rows(self, fieldnames):
+        columns = [self.column(name) for name in fieldnames]
+        return [dict(zip(fieldnames, values)) for values in zip(*columns)]
+
+
+class LedgerArchive:
+    """Archive compressée des anciennes lignes d'un journal CSV.
+
+    Les lignes anciennes sont regroupées en segments immuables, stockés par
+    colonnes : user_id (et autres colonnes répétitives) encodés par
+    dictionnaire, dates en entiers, texte compressé avec zstd. Les segments
+    sont lus dans l'ordre de leur numéro, avant le CSV.
+
+    La compaction archive un préfixe d'octets du CSV. Le segment mémorise la
+    taille et l'empreinte de ce préfixe : si le processus s'arrête entre
+    l'écriture du segment et la réécriture du CSV, recover() termine la
+    réécriture au lieu de dupliquer les lignes.
+    """
+
+    def __init__(self, ledger_path, level=19):
+        self.ledger_path = ledger_path
+        self.directory = ledger_path + '.archive'
+        self.level = level
+
+    def segment_paths(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(os.listdir(self.directory))
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX)
+        ]
+
+    def segments(self):
+        return [Segment(path) for path in self.segment_paths()]
+
+    def rows(self, fieldnames):
+        """Toutes les lignes archivées, dans l'ordre, avec les colonnes <fieldnames>"""
+        rows = []
+        for segment in self.segments():
+            rows.extend(segment.read_rows(fieldnames))
+        return rows
+
+    def row_count(self):
+        return sum(segment.rows for segment in self.segments())
+
+    def size_bytes(self):
+        return sum(os.path.getsize(path) for path in self.segment_paths())
+
+    # --- Compaction ---
+
+    def recover(self):
+        """Termine une compaction interrompue (à appeler sous le verrou du journal)"""
+        paths = self.segment_paths()
+        if not paths or not os.path.exists(self.ledger_path):
+            return False
+        header = Segment(paths[-1]).header
+        with open(self.ledger_path, 'rb') as ledger_file:
+            csv_header = ledger_file.readline()
+            prefix = ledger_file.read(header['csv_prefix_bytes'])
+        if len(prefix) != header['csv_prefix_bytes'] or hashlib.sha256(prefix).hexdigest() != header['csv_prefix_sha256']:
+            return False
+        self._rewrite_ledger(len(csv_header) + len(prefix), csv_header)
+        logger.warning(f"Compaction interrompue terminée pour {self.ledger_path}")
+        return True
+
+    def _rewrite_ledger(self, start, csv_header):
+        def chunks():
+            yield csv_header
+            with open(self.ledger_path, 'rb') as ledger_file:
+                ledger_file.seek(start)
+                for block in iter(lambda: ledger_file.read(1024 * 1024), b''):
+                    yield block
+        atomic_write_bytes(self.ledger_path, chunks())
+
+    def compact(self, before, min_rows=1):
+        """Archive les lignes du début du journal dont la date est antérieure à <before> (chaîne DATE_FORMAT).
+
+        Retourne un rapport (lignes archivées, tailles avant/après) ou None s'il n'y a rien à archiver.
+        """
+        with file_lock(self.ledger_path):
+            self.recover()
+            if not os.path.exists(self.ledger_path):
+                return None
+            fieldnames = read_header(self.ledger_path)
+            date_index = fieldnames.index('date_post')
+
+            # Lignes complètes du début du fichier, tant qu'elles sont assez anciennes
+            rows = []
+            prefix_bytes = 0
+            with open(self.ledger_path, 'rb') as ledger_file:
+                csv_header = ledger_file.readline()
+                position = [0]
+
+                def complete_lines():
+                    for line in iter(ledger_file.readline, b''):
+                        if not line.endswith(b'\n'):
+                            return
+                        position[0] += len(line)
+                        yield line.decode('utf-8')
+
+                for row in csv.reader(complete_lines()):
+                    if len(row) != len(fieldnames) or not row[date_index] or row[date_index] >= before:
+                        break
+                    rows.append(dict(zip(fieldnames, row)))
+                    # Fin de l'enregistrement (un message peut tenir sur plusieurs lignes)
+                    prefix_bytes = position[0]
+            if len(rows) < min_rows:
+                return None
+
+            with open(self.ledger_path, 'rb') as ledger_file:
+                ledger_file.seek(len(csv_header))
+                prefix = ledger_file.read(prefix_bytes)
+            ledger_bytes = os.path.getsize(self.ledger_path)
+
+            os.makedirs(self.directory, exist_ok=True)
+            paths = self.segment_paths()
+            number = int(os.path.basename(paths[-1])[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]) + 1 if paths else 1
+            segment_path = os.path.join(self.directory, f"{_SEGMENT_PREFIX}{number:06d}{_SEGMENT_SUFFIX}")
+            segment = encode_segment(fieldnames, rows, self.level, {
+                'csv_prefix_bytes': prefix_bytes,
+                'csv_prefix_sha256': hashlib.sha256(prefix).hexdigest(),
+                'created': time.strftime(DATE_FORMAT)
+            })
+            atomic_write_bytes(segment_path, [segment])
+            self._rewrite_ledger(len(csv_header) + prefix_bytes, csv_header)
+
+        report = {
+            'rows': len(rows),
+            'csv_bytes': prefix_bytes,
+            'segment_bytes': len(segment),
+            'ratio': prefix_bytes / len(segment) if segment else 0.0,
+            'ledger_bytes_before': ledger_bytes,
+            'ledger_bytes_after': ledger_bytes - prefix_bytes
+        }
+        logger.info(
+            f"Compaction de {self.ledger_path}: {len(rows)} lignes archivées, "
+            f"{prefix_bytes} -> {len(segment)} octets (x{report['ratio']:.1f})"
+        )
+        return report
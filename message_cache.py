@@ -0,0 +1,89 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def message_digest(message):
+    """Empreinte courte d'un message, utilisée pour suivre les réutilisations"""
+    return hashlib.sha1(message.encode('utf-8')).hexdigest()
+
+
+class GenerationCache:
+    """Cache LRU + TTL des messages générés, partagé entre utilisateurs.
+
+    Une clé (version du prompt, thème, langue) contient un petit lot de
+    messages. Un utilisateur ne reçoit jamais un message qu'il a déjà publié
+    pendant la fenêtre de non-réutilisation.
+    """
+
+    def __init__(self, max_keys=256, ttl_seconds=6 * 3600, pool_size=5, reuse_window_seconds=7 * 86400, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self.pool_size = pool_size
+        self.reuse_window_seconds = reuse_window_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # clé -> liste de (horodatage, message)
+        self._usage = {}  # user_id -> {empreinte: horodatage de la dernière utilisation}
+        self._lock = threading.Lock()
+
+    def _recently_used(self, user_id, digest, now):
+        used_at = self._usage.get(str(user_id), {}).get(digest)
+        return used_at is not None and now - used_at < self.reuse_window_seconds
+
+    def _mark_used(self, user_id, digest, now):
+        usage = self._usage.setdefault(str(user_id), {})
+        usage[digest] = now
+        # Oublier les utilisations sorties de la fenêtre
+        if len(usage) > self.pool_size * 4:
+            for old in [d for d, t in usage.items() if now - t >= self.reuse_window_seconds]:
+                del usage[old]
+
+    def get(self, key, user_id):
+        """Retourne un message encore valide et jamais publié par cet utilisateur, sinon None"""
+        now = self.clock()
+        with self._lock:
+            pool = self._entries.get(key)
+            if pool:
+                pool[:] = [(created, message) for created, message in pool if now - created < self.ttl_seconds]
+                for created, message in pool:
+                    digest = message_digest(message)
+                    if not self._recently_used(user_id, digest, now):
+                        self._mark_used(user_id, digest, now)
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        return message
+                if not pool:
+                    del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, message, user_id=None):
+        """Ajoute un message généré au lot de la clé (et le marque comme utilisé par user_id)"""
+        now = self.clock()
+        with self._lock:
+            pool = self._entries.setdefault(key, [])
+            pool.append((now, message))
+            del pool[:-self.pool_size]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+            if user_id is not None:
+                self._mark_used(user_id, message_digest(message), now)
+
+    def stats(self):
+        """Compteurs de succès/échecs du cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'keys': len(self._entries),
+                'messages': sum(len(pool) for pool in self._entries.values())
+            }
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from collections import deque
+
+import metrics
+from csv_store import file_lock, atomic_write_bytes
+from message_cache import message_digest
+from message_validator import BOT_LINK, LINK_ARROW, OPENER_EMOJIS, check_message
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_MESSAGES_TOTAL = metrics.REGISTRY.counter('waribiz_template_messages_total', "Messages composés localement à partir de la banque de fragments")
+
+SLOTS = ('openers', 'bodies', 'ctas')
+
+FRAGMENTS_PROMPT = (
+    "Tu es un expert en copywriting et en marketing digital. Tu prépares des fragments de publications Facebook "
+    "qui promeuvent un bot Telegram de pronostics football gratuit (coupons avec une forte probabilité de réussite). "
+    "Réponds uniquement avec un objet JSON contenant trois listes :"
+    " - \"openers\" : {count} phrases d'accroche courtes (20 à 60 caractères), chacune commençant par un emoji ⚽, 🔥, 💰 ou 🎯, "
+    "sans jamais commencer par le mot « prêt »"
+    " - \"bodies\" : {count} phrases (60 à 140 caractères) qui présentent le bot et précisent que c'est gratuit, ton amical et engageant"
+    " - \"ctas\" : {count} appels à l'action courts (10 à 40 caractères) : « Rejoins-nous », « Clique ici », « Active ton accès », etc., sans lien"
+    " Les fragments doivent pouvoir se combiner librement. Thème spécifique à intégrer : {theme}"
+)
+
+# Fragments intégrés, sans thème : messages de secours quand aucun modèle n'est joignable
+DEFAULT_FRAGMENTS = {
+    'openers': [
+        "⚽ Les pronos du jour sont arrivés !", "🔥 Envie de gagner tes paris foot ?", "💰 Tes coupons du week-end t'attendent",
+        "🎯 Des pronostics qui visent juste", "⚽ Ne rate plus aucun bon match"
+    ],
+    'bodies': [
+        "Notre bot Telegram t'envoie chaque jour des coupons gratuits avec une forte probabilité de réussite.",
+        "Reçois gratuitement nos meilleurs pronostics football, sélectionnés match après match.",
+        "C'est 100 % gratuit : des coupons fiables chaque matin, directement dans ta conversation Telegram.",
+        "Pas d'abonnement, pas de frais : nos pronos foot sont gratuits et arrivent sur Telegram."
+    ],
+    'ctas': ["Rejoins-nous", "Clique ici", "Active ton accès", "Lance le bot"]
+}
+
+
+def compose(opener, body, cta, link=BOT_LINK):
+    """Assemble un message : accroche, corps, appel à l'action puis lien du bot"""
+    return f"{opener} {body} {cta} {LINK_ARROW} {link}"
+
+
+def compose_random(fragments, rng=random, attempts=30):
+    """Message valide tiré au hasard parmi les combinaisons de <fragments> ; None si aucun essai n'aboutit"""
+    for _ in range(attempts):
+        message = compose(rng.choice(fragments['openers']), rng.choice(fragments['bodies']), rng.choice(fragments['ctas']))
+        if not check_message(message):
+            return message
+    return None
+
+
+def parse_fragments(text):
+    """Extrait les fragments d'une réponse JSON du modèle ; None si la réponse est inexploitable"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    fragments = {}
+    for slot in SLOTS:
+        values = data.get(slot) if isinstance(data, dict) else None
+        if not isinstance(values, list):
+            return None
+        cleaned = []
+        for value in values:
+            value = str(value).strip().replace(BOT_LINK, '').strip()
+            if value and value not in cleaned:
+                cleaned.append(value)
+        if not cleaned:
+            return None
+        fragments[slot] = cleaned
+    # Les accroches invalides ne sont pas réparables par combinaison : les écarter d'emblée
+    fragments['openers'] = [
+        opener for opener in fragments['openers']
+        if opener.startswith(OPENER_EMOJIS) and 'pret_opener' not in check_message(opener)
+    ]
+    return fragments if fragments['openers'] else None
+
+
+class FragmentBank:
+    """Fragments générés par le modèle, par thème, et messages composés à partir d'eux.
+
+    Un appel OpenAI produit N accroches, N corps et N appels à l'action :
+    jusqu'à N³ messages distincts, filtrés par les contraintes (150 à 300
+    caractères, lien final, gratuité, accroche). Un message déjà publié
+    n'est pas recomposé tant que la banque n'a pas été renouvelée. La banque
+    d'un thème est à renouveler quand elle est trop ancienne ou que la
+    plupart de ses combinaisons valides ont servi.
+    """
+
+    def __init__(self, path, max_age_seconds=7 * 86400, reuse_ratio=0.8, recent_size=500, rng=None, clock=time.time):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.reuse_ratio = reuse_ratio
+        self.recent_size = recent_size
+        self.rng = rng or random.Random()
+        self.clock = clock
+        self._themes = {}  # clé de thème -> {'fragments', 'refreshed_at', 'used', 'calls', 'composed'}
+        self._valid_counts = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def theme_key(theme):
+        return ' '.join(theme.lower().split())
+
+    # --- Persistance ---
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'r', encoding='utf-8') as bank_file:
+            data = json.load(bank_file)
+        with self._lock:
+            self._themes = {
+                key: dict(entry, used=deque(entry.get('used', []), maxlen=self.recent_size))
+                for key, entry in data.items()
+            }
+            self._valid_counts = {}
+        return len(self._themes)
+
+    def save(self):
+        with self._lock:
+            data = {key: dict(entry, used=list(entry['used'])) for key, entry in self._themes.items()}
+        payload = json.dumps(data, ensure_ascii=False, indent=1).encode('utf-8')
+        with file_lock(self.path):
+            atomic_write_bytes(self.path, [payload])
+
+    # --- Banque ---
+
+    def set_fragments(self, theme, fragments):
+        """Remplace les fragments d'un thème (après un appel au modèle)"""
+        key = self.theme_key(theme)
+        with self._lock:
+            previous = self._themes.get(key, {})
+            self._themes[key] = {
+                'fragments': fragments,
+                'refreshed_at': self.clock(),
+                'used': deque(maxlen=self.recent_size),
+                'calls': previous.get('calls', 0) + 1,
+                'composed': previous.get('composed', 0)
+            }
+            self._valid_counts.pop(key, None)
+
+    def _valid_count(self, key, entry):
+        count = self._valid_counts.get(key)
+        if count is None:
+            fragments = entry['fragments']
+            count = sum(
+                1
+                for opener in fragments['openers']
+                for body in fragments['bodies']
+                for cta in fragments['ctas']
+                if not check_message(compose(opener, body, cta))
+            )
+            self._valid_counts[key] = count
+        return count
+
+    def needs_refresh(self, theme):
+        """Vrai si le thème n'a pas de fragments, s'ils sont trop anciens ou presque épuisés"""
+        key = self.theme_key(theme)
+        with self._lock:
+            entry = self._themes.get(key)
+            if entry is None:
+                return True
+            if self.clock() - entry['refreshed_at'] > self.max_age_seconds:
+                return True
+            valid = self._valid_count(key, entry)
+            return valid == 0 or len(entry['used']) >= min(self.recent_size, valid * self.reuse_ratio)
+
+    def compose(self, theme, attempts=30):
+        """Compose un message valide et pas encore utilisé ; None si la banque ne le permet pas"""
+        key = self.theme_key(theme)
+        with self._lock:
+            entry = self._themes.get(key)
+            if entry is None:
+                return None
+            fragments = entry['fragments']
+            used = set(entry['used'])
+            for _ in range(attempts):
+                message = compose(
+                    self.rng.choice(fragments['openers']),
+                    self.rng.choice(fragments['bodies']),
+                    self.rng.choice(fragments['ctas'])
+                )
+                digest = message_digest(message)
+                if digest in used or check_message(message):
+                    continue
+                entry['used'].append(digest)
+                entry['composed'] = entry.get('composed', 0) + 1
+                TEMPLATE_MESSAGES_TOTAL.inc(result='composed')
+                return message
+        TEMPLATE_MESSAGES_TOTAL.inc(result='exhausted')
+        return None
+
+    def stats(self):
+        """Messages composés par appel au modèle, tous thèmes confondus"""
+        with self._lock:
+            calls = sum(entry.get('calls', 0) for entry in self._themes.values())
+            composed = sum(entry.get('composed', 0) for entry in self._themes.values())
+        return {'themes': len(self._themes), 'calls': calls, 'composed': composed,
+                'messages_per_call': composed / calls if calls else 0.0}
@@ -0,0 +1,164 @@
+import re
+import logging
+import unicodedata
+from collections import namedtuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+VALIDATION_TOTAL = metrics.REGISTRY.counter('waribiz_message_validation_total', "Messages générés vérifiés avant publication, par résultat")
+VALIDATION_PROBLEMS_TOTAL = metrics.REGISTRY.counter('waribiz_message_validation_problems_total', "Règles non respectées par les messages générés")
+
+BOT_LINK = 'https://t.me/Hcfa_bot'
+LINK_ARROW = '➡️'
+OPENER_EMOJIS = ('⚽', '🔥', '💰', '🎯')
+MIN_LENGTH = 150
+MAX_LENGTH = 300
+
+# Règles du prompt, compilées une fois
+_OPENER_RE = re.compile('^(?:' + '|'.join(map(re.escape, OPENER_EMOJIS)) + ')')
+_PRET_OPENER_RE = re.compile(r'^\W*pr[êe]t', re.IGNORECASE)
+_FREE_RE = re.compile(r'gratuit', re.IGNORECASE)
+_LINK_RE = re.compile(r'(?:\s*' + re.escape(LINK_ARROW) + r')?\s*' + re.escape(BOT_LINK) + r'/?')
+_LINK_END_RE = re.compile(re.escape(BOT_LINK) + r'\Z')
+_TRAILING_LINK_RE = re.compile(r'(?:\s*' + re.escape(LINK_ARROW) + r')?\s*' + re.escape(BOT_LINK) + r'\Z')
+_URL_CHAR_RE = re.compile(r'[\w/-]')
+# Habillage ajouté par le modèle : guillemets, « Message : », markdown
+_PREAMBLE_RE = re.compile(r'^\s*(?:voici[^:\n]*:|message\s*:)\s*', re.IGNORECASE)
+_QUOTES = '"\'«»“”'
+_MARKDOWN_RE = re.compile(r'\*\*|__|`')
+_SPACES_RE = re.compile(r'[ \t]+')
+# Fin de phrase, pour raccourcir un message trop long sans couper un mot
+_SENTENCE_END_RE = re.compile(r'[.!?…](?=\s)')
+# Caractères refusés : contrôles (hors saut de ligne), surrogates isolés, usage privé, caractère de remplacement
+_FORBIDDEN_RE = re.compile('[\x00-\x09\x0b-\x1f\x7f-\x9f\ud800-\udfff\ue000-\uf8ff\ufffd]')
+# Caractères invisibles retirés (sauf le joiner U+200D et le sélecteur U+FE0F des emojis)
+_INVISIBLE = dict.fromkeys(map(ord, '​‌⁠﻿­'))
+
+Validation = namedtuple('Validation', ['message', 'problems', 'repairs'])
+Validation.__doc__ = "Résultat de la validation : message (éventuellement réparé), règles non respectées, réparations appliquées"
+
+
+def check_message(message):
+    """Règles de publication non respectées par <message> (liste vide si le message est valide)"""
+    problems = []
+    if not MIN_LENGTH <= len(message) <= MAX_LENGTH:
+        problems.append('length')
+    if not _LINK_END_RE.search(message):
+        problems.append('link')
+    if not _OPENER_RE.match(message):
+        problems.append('opener')
+    if _PRET_OPENER_RE.match(message):
+        problems.append('pret_opener')
+    if not _FREE_RE.search(message):
+        problems.append('free')
+    if _FORBIDDEN_RE.search(message):
+        problems.append('unicode')
+    return problems
+
+
+def _normalize(message):
+    """Nettoyage sans risque : NFC, invisibles, habillage du modèle, espaces"""
+    message = unicodedata.normalize('NFC', message).translate(_INVISIBLE)
+    message = _MARKDOWN_RE.sub('', _PREAMBLE_RE.sub('', message.strip()))
+    message = message.strip()
+    if len(message) > 1 and message[0] in _QUOTES and message[-1] in _QUOTES:
+        message = message[1:-1].strip()
+    message = _FORBIDDEN_RE.sub('', message.replace('\t', ' '))
+    return '\n'.join(_SPACES_RE.sub(' ', line).strip() for line in message.split('\n')).strip()
+
+
+def _shorten(text, budget):
+    """Coupe <text> après la dernière phrase complète tenant dans <budget> caractères ; None si impossible"""
+    if len(text) <= budget:
+        return text
+    ends = [match.end() for match in _SENTENCE_END_RE.finditer(text + ' ') if match.end() <= budget]
+    return text[:ends[-1]] if ends else None
+
+
+def validate_message(message):
+    """Vérifie un message généré et répare localement les écarts bon marché.
+
+    Réparations : nettoyage (guillemets, « Message : », markdown, caractères
+    invisibles ou invalides), lien du bot ajouté en fin de message,
+    texte ajouté après le lien supprimé, emoji d'accroche ajouté, message trop long raccourci à la dernière phrase
+    complète. Un message trop court, sans mention de la gratuité ou commençant
+    par « prêt » n'est pas réparable : il faut le régénérer.
+    """
+    repairs = []
+    repaired = _normalize(message)
+    if repaired != message:
+        repairs.append('normalize')
+
+    if not _TRAILING_LINK_RE.search(repaired):
+        position = repaired.rfind(BOT_LINK)
+        if position >= 0:
+            # Texte ajouté après le lien (commentaire, hashtags) : supprimé
+            repaired = repaired[:position + len(BOT_LINK)]
+        else:
+            repaired = f"{repaired} {LINK_ARROW} {BOT_LINK}"
+        repairs.append('link')
+    trailing = _TRAILING_LINK_RE.search(repaired)
+    repaired, suffix = _LINK_RE.sub('', repaired[:trailing.start()]).rstrip(), repaired[trailing.start():]
+
+    if not _OPENER_RE.match(repaired) and not _PRET_OPENER_RE.match(repaired):
+        repaired = f"{OPENER_EMOJIS[0]} {repaired}"
+        repairs.append('opener')
+
+    if len(repaired) + len(suffix) > MAX_LENGTH:
+        shortened = _shorten(repaired, MAX_LENGTH - len(suffix))
+        if shortened is not None:
+            repaired = shortened
+            repairs.append('length')
+    repaired += suffix
+
+    problems = check_message(repaired)
+    if problems:
+        result = 'rejected'
+    else:
+        result = 'repaired' if repairs else 'valid'
+    VALIDATION_TOTAL.inc(result=result)
+    for problem in problems:
+        VALIDATION_PROBLEMS_TOTAL.inc(problem=problem)
+    if repairs and not problems:
+        logger.info(f"Message réparé localement ({', '.join(repairs)})")
+    return Validation(repaired, problems, repairs)
+
+
+class StreamValidator:
+    """Validation incrémentale d'une réponse reçue en flux.
+
+    feed() reçoit chaque fragment de texte et indique quand arrêter la
+    lecture : dès que le lien du bot est complet (le message est terminé,
+    la suite ne serait que du texte à supprimer) ou quand la réponse dépasse
+    <budget> caractères. Le texte retenu passe ensuite par validate_message()
+    (un message trop long est raccourci à la dernière phrase complète).
+    """
+
+    def __init__(self, budget=MAX_LENGTH + 100):
+        self.budget = budget
+        self.text = ''
+        self.reason = None
+
+    def feed(self, delta):
+        """Ajoute un fragment ; retourne True si la lecture du flux peut s'arrêter"""
+        if self.reason is not None:
+            return True
+        self.text += delta or ''
+        # Le lien peut être coupé entre deux fragments : chercher dans tout le texte reçu (quelques centaines de caractères)
+        position = self.text.find(BOT_LINK)
+        if position >= 0:
+            after = self.text[position + len(BOT_LINK):]
+            if after and not _URL_CHAR_RE.match(after):
+                self.text = self.text[:position + len(BOT_LINK)]
+                self.reason = 'complete'
+        if self.reason is None and len(self.text) > self.budget:
+            self.reason = 'budget'
+        return self.reason is not None
+
+    def finish(self):
+        """Fin de lecture : retourne le texte retenu, à valider avec validate_message()"""
+        if self.reason is None:
+            self.reason = 'finished'
+        return self.text
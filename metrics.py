@@ -0,0 +1,235 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Bornes par défaut des histogrammes de durée (secondes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Bornes des histogrammes de taille (octets)
+SIZE_BUCKETS = (1024, 10 * 1024, 50 * 1024, 100 * 1024, 250 * 1024, 500 * 1024, 1024 * 1024, 4 * 1024 * 1024, 10 * 1024 * 1024)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in key) + '}'
+
+
+class Counter:
+    """Compteur monotone, éventuellement ventilé par labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes (format Prometheus)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [compteurs par borne..., +Inf], somme
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Mesure la durée du bloc"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return sum(series[0]) if series else 0
+
+    def total(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return series[1] if series else 0.0
+
+    def label_sets(self):
+        """Liste des combinaisons de labels observées"""
+        with self._lock:
+            return [dict(key) for key in self._series]
+
+    def quantile(self, q, **labels):
+        """Estime un quantile par interpolation linéaire dans les bornes"""
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            if not series:
+                return None
+            counts = list(series[0])
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            if cumulative + counts[i] >= rank:
+                fraction = (rank - cumulative) / counts[i] if counts[i] else 0
+                return lower + (bound - lower) * fraction
+            cumulative += counts[i]
+            lower = bound
+        return self.buckets[-1]
+
+    def samples(self):
+        with self._lock:
+            result = []
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    result.append((self.name + '_bucket', key + (('le', repr(float(bound))),), cumulative))
+                cumulative += counts[-1]
+                result.append((self.name + '_bucket', key + (('le', '+Inf'),), cumulative))
+                result.append((self.name + '_sum', key, total))
+                result.append((self.name + '_count', key, cumulative))
+            return result
+
+
+class MetricsRegistry:
+    """Ensemble des métriques exposées par le bot"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation):
+        return self._register(Counter(name, documentation))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, buckets))
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self):
+        """Export au format texte Prometheus"""
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def render_summary(self):
+        """Résumé lisible pour la commande Telegram /metrics"""
+        lines = []
+        for metric in self.metrics():
+            if isinstance(metric, Histogram):
+                for labels in metric.label_sets():
+                    count = metric.count(**labels)
+                    if not count:
+                        continue
+                    suffix = ''.join(f" {k}={v}" for k, v in sorted(labels.items()))
+                    lines.append(
+                        f"• {metric.name}{suffix}: n={count} moy={metric.total(**labels) / count:.3f} "
+                        f"p50={metric.quantile(0.5, **labels):.3f} p95={metric.quantile(0.95, **labels):.3f}"
+                    )
+            else:
+                for _, key, value in metric.samples():
+                    suffix = ''.join(f" {k}={v}" for k, v in key)
+                    lines.append(f"• {metric.name}{suffix}: {value}")
+        return '\n'.join(lines) or "Aucune mesure pour le moment."
+
+
+REGISTRY = MetricsRegistry()
+
+# Étapes d'une publication
+OPENAI_LATENCY = REGISTRY.histogram('waribiz_openai_latency_seconds', "Durée des appels de génération OpenAI")
+OPENAI_STREAM_TOTAL = REGISTRY.counter('waribiz_openai_stream_total', "Générations en flux par motif d'arrêt (message complet, budget dépassé, fin de réponse)")
+OPENAI_STREAM_CHUNKS = REGISTRY.histogram('waribiz_openai_stream_chunks', "Fragments lus par génération en flux", (10, 25, 50, 75, 100, 150, 200, 300, 400))
+IMAGE_SELECTION = REGISTRY.histogram('waribiz_image_selection_seconds', "Durée de sélection de l'image")
+UPLOAD_BYTES = REGISTRY.histogram('waribiz_upload_bytes', "Taille des images envoyées à Facebook", SIZE_BUCKETS)
+UPLOAD_SECONDS = REGISTRY.histogram('waribiz_upload_seconds', "Durée d'envoi du corps de la publication à Facebook")
+GRAPH_RESPONSE = REGISTRY.histogram('waribiz_graph_response_seconds', "Temps de réponse de l'API Graph par endpoint")
+LEDGER_WRITE = REGISTRY.histogram('waribiz_ledger_write_seconds', "Durée d'écriture dans le journal des publications")
+TELEGRAM_NOTIFY = REGISTRY.histogram('waribiz_telegram_notify_seconds', "Durée d'envoi des notifications Telegram")
+PUBLISH_TOTAL = REGISTRY.counter('waribiz_publish_total', "Publications par résultat")
+MESSAGE_CACHE_TOTAL = REGISTRY.counter('waribiz_message_cache_total', "Consultations du cache de messages (hit/miss)")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host='127.0.0.1', registry=REGISTRY):
+    """Expose /metrics en local dans un thread d'arrière-plan"""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    logger.info(f"Métriques exposées sur http://{host}:{server.server_port}/metrics")
+    return server
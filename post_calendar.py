@@ -0,0 +1,280 @@
+import re
+import heapq
+import logging
+import datetime
+import threading
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+DAY_NAMES = {'lun': 0, 'mar': 1, 'mer': 2, 'jeu': 3, 'ven': 4, 'sam': 5, 'dim': 6}
+_WINDOW_PATTERN = re.compile(r'^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})$')
+
+
+class RulesError(ValueError):
+    """Règle de calendrier invalide (fenêtre, jour ou fuseau horaire)"""
+
+
+def parse_windows(text):
+    """'08:00-11:00,18:00-21:00' -> [(480, 660), (1080, 1260)] en minutes depuis minuit.
+
+    Chaîne vide : toute la journée. Une fenêtre qui passe minuit (22:00-02:00)
+    se termine le lendemain.
+    """
+    if not text or not text.strip():
+        return [(0, 24 * 60)]
+    windows = []
+    for part in text.replace(' ', '').split(','):
+        match = _WINDOW_PATTERN.match(part)
+        if not match:
+            raise RulesError(f"Fenêtre invalide: {part} (format attendu HH:MM-HH:MM)")
+        start_hour, start_minute, end_hour, end_minute = (int(value) for value in match.groups())
+        if start_hour > 23 or end_hour > 24 or start_minute > 59 or end_minute > 59:
+            raise RulesError(f"Heure invalide: {part}")
+        start = start_hour * 60 + start_minute
+        end = end_hour * 60 + end_minute
+        if end <= start:
+            end += 24 * 60
+        windows.append((start, end))
+    return sorted(windows)
+
+
+def parse_days(text):
+    """'0-4', '0,2,4' ou 'lun-ven' -> ensemble de jours (0 = lundi). Chaîne vide : tous les jours."""
+    if not text or not text.strip():
+        return frozenset(range(7))
+
+    def day(value):
+        value = value.strip().lower()
+        if value in DAY_NAMES:
+            return DAY_NAMES[value]
+        if value.isdigit() and int(value) < 7:
+            return int(value)
+        raise RulesError(f"Jour invalide: {value}")
+
+    days = set()
+    for part in text.split(','):
+        if '-' in part:
+            first, last = (day(value) for value in part.split('-', 1))
+            current = first
+            days.add(current)
+            while current != last:
+                current = (current + 1) % 7
+                days.add(current)
+        else:
+            days.add(day(part))
+    return frozenset(days)
+
+
+def format_days(days):
+    names = {number: name for name, number in DAY_NAMES.items()}
+    return ','.join(names[day] for day in sorted(days))
+
+
+class PostingRules:
+    """Règles de publication d'un utilisateur.
+
+    Les créneaux commencent au début de chaque fenêtre et se répètent toutes
+    les <interval_minutes>, en heure locale du fuseau : ils restent alignés
+    sur l'horloge au lieu de dériver d'une exécution à l'autre.
+    """
+
+    __slots__ = ('windows', 'days', 'timezone', 'interval_minutes', 'min_gap_minutes', '_zone')
+
+    def __init__(self, interval_minutes=60, windows='', days='', timezone='UTC', min_gap_minutes=0):
+        if interval_minutes <= 0:
+            raise RulesError("L'intervalle doit être positif")
+        try:
+            self._zone = ZoneInfo(timezone or 'UTC')
+        except (ZoneInfoNotFoundError, ValueError):
+            raise RulesError(f"Fuseau horaire inconnu: {timezone}")
+        self.windows = parse_windows(windows) if isinstance(windows, str) else list(windows)
+        self.days = parse_days(days) if isinstance(days, str) else frozenset(days)
+        self.timezone = timezone or 'UTC'
+        self.interval_minutes = interval_minutes
+        self.min_gap_minutes = min_gap_minutes
+
+    def describe(self):
+        windows = ', '.join(
+            f"{start // 60 % 24:02d}:{start % 60:02d}-{end // 60 % 24:02d}:{end % 60:02d}" for start, end in self.windows
+        )
+        return f"{windows} ({format_days(self.days)}, {self.timezone}), toutes les {self.interval_minutes} min"
+
+    def localize(self, moment):
+        """Convertit un datetime UTC dans le fuseau de l'utilisateur"""
+        return moment.astimezone(self._zone)
+
+    def slots_between(self, start, end, last_slot=None):
+        """Créneaux (datetimes UTC) dans ]start, end], en respectant l'écart minimal après <last_slot>"""
+        interval = datetime.timedelta(minutes=self.interval_minutes)
+        min_gap = datetime.timedelta(minutes=self.min_gap_minutes)
+        slots = []
+        # Commencer la veille : une fenêtre qui passe minuit peut déborder sur <start>
+        local_day = start.astimezone(self._zone).date() - datetime.timedelta(days=1)
+        last_day = end.astimezone(self._zone).date()
+        while local_day <= last_day:
+            if local_day.weekday() in self.days:
+                midnight = datetime.datetime.combine(local_day, datetime.time(), tzinfo=self._zone)
+                for window_start, window_end in self.windows:
+                    # Arithmétique en heure murale, puis conversion en UTC (changements d'heure compris)
+                    wall = midnight + datetime.timedelta(minutes=window_start)
+                    wall_end = midnight + datetime.timedelta(minutes=window_end)
+                    while wall < wall_end:
+                        slot = wall.astimezone(datetime.timezone.utc)
+                        if start < slot <= end and (last_slot is None or slot - last_slot >= min_gap):
+                            slots.append(slot)
+                            last_slot = slot
+                        wall += interval
+            local_day += datetime.timedelta(days=1)
+        slots.sort()
+        return slots
+
+
+class _UserCalendar:
+    __slots__ = ('rules', 'generation', 'horizon_end', 'last_slot', 'slots')
+
+    def __init__(self, rules, generation):
+        self.rules = rules
+        self.generation = generation
+        self.horizon_end = None
+        self.last_slot = None
+        self.slots = []
+
+
+class PostCalendar:
+    """Créneaux précalculés de tous les utilisateurs, dans un tas indexé par l'heure.
+
+    Chaque utilisateur a ses créneaux calculés sur <horizon_hours> (24 à 72 h).
+    Modifier les règles d'un utilisateur ne recalcule que ses créneaux : les
+    anciennes entrées du tas sont invalidées par un numéro de génération et
+    ignorées lorsqu'elles remontent. L'horizon est prolongé par utilisateur
+    lorsqu'il reste moins de la moitié de la fenêtre (second tas).
+    """
+
+    def __init__(self, horizon_hours=48):
+        self.horizon = datetime.timedelta(hours=horizon_hours)
+        self._users = {}
+        self._slots = []  # tas (heure UTC, génération, user_id)
+        self._refills = []  # tas (heure de prolongation, génération, user_id)
+        self._retries = []  # tas (heure de reprise, génération, user_id, créneau d'origine)
+        self._generation = 0
+        self._stale = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _now(now):
+        return now or datetime.datetime.now(datetime.timezone.utc)
+
+    def set_rules(self, user_id, rules, now=None):
+        """(Re)calcule les créneaux d'un seul utilisateur ; retourne le prochain créneau ou None"""
+        now = self._now(now)
+        user_id = str(user_id)
+        with self._lock:
+            previous = self._users.get(user_id)
+            if previous is not None:
+                self._stale += len(previous.slots)
+            self._generation += 1
+            calendar = self._users[user_id] = _UserCalendar(rules, self._generation)
+            self._extend(user_id, calendar, now)
+            self._compact()
+            return calendar.slots[0] if calendar.slots else None
+
+    def remove_user(self, user_id):
+        """Retire un utilisateur du calendrier (ses créneaux sont invalidés)"""
+        with self._lock:
+            calendar = self._users.pop(str(user_id), None)
+            if calendar is not None:
+                self._stale += len(calendar.slots)
+                self._compact()
+
+    def has_user(self, user_id):
+        return str(user_id) in self._users
+
+    def upcoming(self, user_id, limit=5):
+        """Prochains créneaux d'un utilisateur (datetimes UTC)"""
+        with self._lock:
+            calendar = self._users.get(str(user_id))
+            return list(calendar.slots[:limit]) if calendar else []
+
+    def pop_due(self, now=None):
+        """Retire et retourne les créneaux échus : liste de (user_id, heure prévue)"""
+        now = self._now(now)
+        due = []
+        with self._lock:
+            while self._refills and self._refills[0][0] <= now:
+                _, generation, user_id = heapq.heappop(self._refills)
+                calendar = self._users.get(user_id)
+                if calendar is not None and calendar.generation == generation:
+                    self._extend(user_id, calendar, now)
+            while self._retries and self._retries[0][0] <= now:
+                _, generation, user_id, slot = heapq.heappop(self._retries)
+                calendar = self._users.get(user_id)
+                if calendar is not None and calendar.generation == generation:
+                    due.append((user_id, slot))
+            while self._slots and self._slots[0][0] <= now:
+                slot, generation, user_id = heapq.heappop(self._slots)
+                calendar = self._users.get(user_id)
+                if calendar is None or calendar.generation != generation:
+                    self._stale -= 1
+                    continue
+                calendar.slots.pop(0)
+                due.append((user_id, slot))
+        return due
+
+    def defer(self, user_id, slot, until):
+        """Reporte un créneau échu à <until> (dépendance indisponible).
+
+        Le créneau est abandonné (False) si le créneau suivant de l'utilisateur
+        arrive avant : les reports ne s'accumulent pas pendant une panne.
+        """
+        user_id = str(user_id)
+        with self._lock:
+            calendar = self._users.get(user_id)
+            if calendar is None or (calendar.slots and calendar.slots[0] <= until):
+                return False
+            heapq.heappush(self._retries, (until, calendar.generation, user_id, slot))
+            return True
+
+    def next_due(self):
+        """Heure du prochain créneau (ou report) tous utilisateurs confondus, ou None"""
+        with self._lock:
+            self._drop_stale_head()
+            candidates = [entry[0] for entry in (self._slots[:1] + self._retries[:1])]
+            return min(candidates) if candidates else None
+
+    def __len__(self):
+        return len(self._slots) - self._stale
+
+    def _extend(self, user_id, calendar, now):
+        start = max(now, calendar.horizon_end) if calendar.horizon_end else now
+        end = now + self.horizon
+        if end > start:
+            for slot in calendar.rules.slots_between(start, end, calendar.last_slot):
+                heapq.heappush(self._slots, (slot, calendar.generation, user_id))
+                calendar.slots.append(slot)
+                calendar.last_slot = slot
+            calendar.horizon_end = end
+        heapq.heappush(self._refills, (calendar.horizon_end - self.horizon / 2, calendar.generation, user_id))
+
+    def _drop_stale_head(self):
+        while self._slots:
+            _, generation, user_id = self._slots[0]
+            calendar = self._users.get(user_id)
+            if calendar is not None and calendar.generation == generation:
+                return
+            heapq.heappop(self._slots)
+            self._stale -= 1
+
+    def _compact(self):
+        """Reconstruit les tas quand les entrées invalidées dominent"""
+        if self._stale <= max(64, len(self._slots) // 2):
+            return
+        self._slots = [entry for entry in self._slots if self._is_live(entry)]
+        heapq.heapify(self._slots)
+        self._refills = [entry for entry in self._refills if self._is_live(entry)]
+        heapq.heapify(self._refills)
+        self._stale = 0
+
+    def _is_live(self, entry):
+        calendar = self._users.get(entry[2])
+        return calendar is not None and calendar.generation == entry[1]
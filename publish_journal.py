@@ -0,0 +1,152 @@
+import datetime
+import logging
+import threading
+from collections import namedtuple
+
+import metrics
+from csv_store import CsvLedger, file_lock, read_rows, atomic_write_rows
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_TOTAL = metrics.REGISTRY.counter('waribiz_publish_journal_total', "Transitions du journal d'idempotence des publications, par état")
+RECONCILE_TOTAL = metrics.REGISTRY.counter('waribiz_publish_reconcile_total', "Publications incertaines vérifiées sur la page, par résultat (found, absent)")
+
+JOURNAL_FIELDS = ['key', 'user_id', 'slot', 'page_id', 'status', 'post_id', 'message', 'updated_at']
+
+# Message généré pour le créneau (ligne sans page) ; états d'une page pour un créneau
+GENERATED = 'generated'
+PENDING, PUBLISHED, FAILED, UNCERTAIN = 'pending', 'published', 'failed', 'uncertain'
+# Issue inconnue : Facebook a pu publier sans que la réponse nous parvienne
+UNSETTLED = (PENDING, UNCERTAIN)
+
+Entry = namedtuple('Entry', ['status', 'post_id', 'message', 'updated_at'])
+Entry.__doc__ = "Dernier état connu d'une page pour un créneau (updated_at : datetime UTC)"
+
+
+def slot_key(user_id, slot):
+    """Clé d'idempotence d'un créneau : utilisateur et heure prévue (UTC, à la seconde)"""
+    return f"{user_id}@{slot.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}"
+
+
+def _parse_time(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=datetime.timezone.utc)
+
+
+def _format_time(moment):
+    return moment.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class PublishJournal:
+    """Journal d'idempotence des publications programmées, par (utilisateur, créneau).
+
+    Avant chaque appel Graph, une intention (pending) est écrite et
+    synchronisée sur disque ; après, la publication est confirmée
+    (published, avec son identifiant) ou l'échec enregistré (failed :
+    Facebook a répondu, rien n'a été publié). Une intention restée sans
+    réponse (délai dépassé, arrêt du processus) est incertaine : elle doit
+    être rapprochée des publications de la page avant toute nouvelle
+    tentative. Le message généré pour le créneau est journalisé lui aussi :
+    une reprise le réutilise sans nouvel appel à OpenAI.
+
+    Journal CSV en ajout seul (la dernière ligne d'une clé l'emporte),
+    relu au démarrage et compacté par compact().
+    """
+
+    def __init__(self, path, clock=None):
+        self.ledger = CsvLedger(path, JOURNAL_FIELDS)
+        self.clock = clock or (lambda: datetime.datetime.now(datetime.timezone.utc))
+        self._slots = {}  # clé -> (user_id, créneau)
+        self._entries = {}  # (clé, page_id) -> Entry ; page_id vide : message généré
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Relit le journal (dernier état de chaque clé et page)"""
+        self.ledger.ensure()
+        slots, entries = {}, {}
+        for row in self.ledger.rows():
+            try:
+                slots[row['key']] = (row['user_id'], _parse_time(row['slot']))
+                entries[(row['key'], row['page_id'])] = Entry(row['status'], row['post_id'], row['message'], _parse_time(row['updated_at']))
+            except (KeyError, ValueError):
+                logger.warning(f"Ligne invalide ignorée dans le journal des publications: {row}")
+        with self._lock:
+            self._slots, self._entries = slots, entries
+        logger.info(f"Journal des publications chargé: {len(slots)} créneau(x)")
+
+    def open(self, user_id, slot):
+        """Clé d'idempotence du créneau <slot> de l'utilisateur"""
+        key = slot_key(user_id, slot)
+        with self._lock:
+            self._slots.setdefault(key, (str(user_id), slot))
+        return key
+
+    def _write(self, key, page_id, status, post_id='', message=''):
+        user_id, slot = self._slots[key]
+        now = self.clock()
+        self.ledger.append({
+            'key': key,
+            'user_id': user_id,
+            'slot': _format_time(slot),
+            'page_id': page_id,
+            'status': status,
+            'post_id': post_id or '',
+            'message': message,
+            'updated_at': _format_time(now)
+        })
+        with self._lock:
+            self._entries[(key, page_id)] = Entry(status, post_id or '', message, now.replace(microsecond=0))
+        JOURNAL_TOTAL.inc(status=status)
+
+    def entry(self, key, page_id):
+        with self._lock:
+            return self._entries.get((key, page_id))
+
+    def message(self, key):
+        """Message déjà généré pour le créneau, ou None"""
+        entry = self.entry(key, '')
+        return entry.message if entry is not None else None
+
+    def record_message(self, key, message):
+        self._write(key, '', GENERATED, message=message)
+
+    def begin(self, key, page_id, message):
+        """Intention de publier, durable avant l'appel Graph"""
+        self._write(key, page_id, PENDING, message=message)
+
+    def confirm(self, key, page_id, post_id, message=''):
+        self._write(key, page_id, PUBLISHED, post_id=post_id, message=message)
+
+    def fail(self, key, page_id, message=''):
+        self._write(key, page_id, FAILED, message=message)
+
+    def mark_uncertain(self, key, page_id, message=''):
+        self._write(key, page_id, UNCERTAIN, message=message)
+
+    def published(self, key, page_id):
+        entry = self.entry(key, page_id)
+        return entry is not None and entry.status == PUBLISHED
+
+    def unsettled(self, since):
+        """Créneaux postérieurs à <since> dont une page a une issue inconnue : [(clé, user_id, créneau)]"""
+        with self._lock:
+            keys = {key for (key, page_id), entry in self._entries.items() if page_id and entry.status in UNSETTLED}
+            return sorted(
+                ((key, *self._slots[key]) for key in keys if self._slots[key][1] >= since),
+                key=lambda item: item[2]
+            )
+
+    def compact(self, before):
+        """Oublie les créneaux antérieurs à <before> et réécrit le journal (une ligne par clé et page)"""
+        with file_lock(self.ledger.path):
+            latest = {}
+            for row in read_rows(self.ledger.path):
+                try:
+                    if _parse_time(row['slot']) >= before:
+                        latest[(row['key'], row['page_id'])] = row
+                except (KeyError, ValueError):
+                    continue
+            atomic_write_rows(self.ledger.path, JOURNAL_FIELDS, latest.values())
+        with self._lock:
+            self._slots = {key: value for key, value in self._slots.items() if value[1] >= before}
+            self._entries = {key: entry for key, entry in self._entries.items() if key[0] in self._slots}
+        return len(latest)
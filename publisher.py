@@ -0,0 +1,169 @@
+import os
+import logging
+
+import metrics
+from circuit_breaker import CircuitOpenError
+from deadline import DeadlineExceeded, http_timeout, count_timeout
+from streaming_upload import post_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRAPH_URL = "https://graph.facebook.com/v22.0"
+# Codes d'erreur Graph imputables à l'API elle-même (limitation, indisponibilité) et non à la page
+TRANSIENT_CODES = {1, 2, 4, 17, 32, 341, 613}
+
+
+def failure_is_transient(response):
+    """Vrai si l'échec vient de l'API Graph elle-même (5xx, limitation) plutôt que de la page (token, droits)"""
+    if response.status_code >= 500 or response.status_code == 429:
+        return True
+    try:
+        code = response.json().get('error', {}).get('code')
+    except ValueError:
+        return False
+    return code in TRANSIENT_CODES
+
+
+class GraphPublisher:
+    """Accès à l'API Graph commun aux bots mono-page et multi-utilisateurs.
+
+    Chaque appel a un délai (connexion, lecture), réduit au temps restant de
+    l'échéance courante (deadline.py). Facultatifs : <image_cache> évite de
+    relire les images fréquentes, <breakers> (BreakerRegistry) coupe la
+    dépendance « graph » ou une page en panne. requests n'est importé
+    qu'au premier appel.
+    """
+
+    def __init__(self, graph_url=DEFAULT_GRAPH_URL, image_cache=None, breakers=None,
+                 connect_timeout=5, graph_timeout=30, upload_timeout=60):
+        self.graph_url = graph_url
+        self.image_cache = image_cache
+        self.breakers = breakers
+        self.connect_timeout = connect_timeout
+        self.graph_timeout = graph_timeout
+        self.upload_timeout = upload_timeout
+
+    def get(self, endpoint, params, label=None):
+        """GET sur l'API Graph ; les délais dépassés sont comptés (<label> : nom de l'endpoint dans les métriques)"""
+        import requests
+        timeout = http_timeout('graph', (self.connect_timeout, self.graph_timeout))
+        try:
+            response = requests.get(f"{self.graph_url}/{endpoint}", params=params, timeout=timeout)
+        except requests.Timeout:
+            count_timeout('graph')
+            raise
+        metrics.GRAPH_RESPONSE.observe(response.elapsed.total_seconds(), endpoint=label or endpoint)
+        return response
+
+    def find_post(self, page_id, access_token, message, since):
+        """Publication de la page portant exactement <message> depuis <since> (datetime) ; None si absente.
+
+        Sert à lever le doute sur une publication sans réponse ; lève une
+        exception si la page ne peut pas être consultée (le doute demeure).
+        """
+        response = self.get(f"{page_id}/posts", {
+            'access_token': access_token,
+            'fields': 'id,message,created_time',
+            'since': int(since.timestamp()),
+            'limit': 100
+        }, label='posts')
+        response.raise_for_status()
+        for post in response.json().get('data', []):
+            if post.get('message', '').strip() == message.strip():
+                return post['id']
+        return None
+
+    def send_photo(self, page_id, access_token, message, image_path):
+        """Appel Graph de publication d'une photo ; retourne (post_id ou None, réponse).
+
+        Lève DeadlineExceeded si c'est l'échéance qui a expiré,
+        requests.Timeout si Facebook n'a pas répondu dans son délai.
+        """
+        import requests
+        url = f"{self.graph_url}/{page_id}/photos"
+        payload = {
+            'message': message,
+            'access_token': access_token,
+        }
+        timeout = http_timeout('upload', (self.connect_timeout, self.upload_timeout))
+
+        try:
+            if image_path.startswith("http"):
+                payload['url'] = image_path
+                with metrics.UPLOAD_SECONDS.time():
+                    response = requests.post(url, data=payload, timeout=timeout)
+                metrics.GRAPH_RESPONSE.observe(response.elapsed.total_seconds(), endpoint='photos')
+            else:
+                # Image depuis le cache mémoire, sinon envoi en flux depuis le disque
+                cached_image = self.image_cache.get(image_path) if self.image_cache is not None else None
+                content = cached_image.data if cached_image else None
+                metrics.UPLOAD_BYTES.observe(cached_image.size if cached_image else os.path.getsize(image_path))
+                response, upload_seconds, response_seconds = post_file(url, payload, 'source', image_path, timeout=timeout, content=content)
+                metrics.UPLOAD_SECONDS.observe(upload_seconds)
+                metrics.GRAPH_RESPONSE.observe(response_seconds, endpoint='photos')
+        except requests.Timeout:
+            count_timeout('upload')
+            if timeout[1] < self.upload_timeout:
+                # Délai raccourci par l'échéance : c'est le budget qui est épuisé
+                raise DeadlineExceeded('upload') from None
+            raise
+
+        if response.status_code == 200:
+            # post_id désigne la publication du fil (statistiques d'engagement), id la photo
+            data = response.json()
+            return data.get('post_id') or data.get('id'), response
+        return None, response
+
+    def reserve(self, page_id):
+        """Réserve un appel Graph pour une page ; lève CircuitOpenError si la dépendance ou la page est coupée"""
+        dependency = self.breakers.get('graph')
+        page = self.breakers.get(f"graph:page:{page_id}")
+        if not dependency.available():
+            raise CircuitOpenError(dependency.name, dependency.retry_after())
+        page.check()
+        if not dependency.allow():
+            page.release()
+            raise CircuitOpenError(dependency.name, dependency.retry_after())
+        return dependency, page
+
+    def retry_after(self, page_ids):
+        """Secondes avant qu'au moins une des pages soit de nouveau joignable (0 si l'une l'est déjà)"""
+        if self.breakers is None:
+            return 0.0
+        dependency_wait = self.breakers.retry_after('graph')
+        waits = [max(dependency_wait, self.breakers.retry_after(f"graph:page:{page_id}")) for page_id in page_ids]
+        return min(waits) if waits else dependency_wait
+
+    def publish_photo(self, page_id, access_token, message, image_path):
+        """Publie une photo et son message sur une page ; retourne (post_id, erreur).
+
+        Avec des disjoncteurs : lève CircuitOpenError sans appeler l'API si
+        la dépendance ou la page est coupée. Un budget de publication épuisé
+        (DeadlineExceeded) n'est pas imputé à Facebook.
+        """
+        if self.breakers is None:
+            post_id, response = self.send_photo(page_id, access_token, message, image_path)
+            return (post_id, None) if post_id else (None, response.text)
+
+        dependency, page = self.reserve(page_id)
+        try:
+            post_id, response = self.send_photo(page_id, access_token, message, image_path)
+        except DeadlineExceeded:
+            dependency.release()
+            page.release()
+            raise
+        except Exception:
+            dependency.record_failure()
+            page.record_failure()
+            raise
+        if post_id:
+            dependency.record_success()
+            page.record_success()
+            return post_id, None
+        if failure_is_transient(response):
+            dependency.record_failure()
+            page.release()
+        else:
+            dependency.record_success()
+            page.record_failure()
+        return None, response.text
@@ -0,0 +1,38 @@
+import time
+
+
+class TokenBucket:
+    """Seau à jetons : <rate> jetons par seconde, au plus <capacity> en réserve"""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Secondes à attendre avant qu'un jeton soit disponible"""
+        now = self.clock()
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill(self.clock())
+        self.tokens -= 1
+
+    def full(self):
+        """Vrai si le seau est plein : il peut être oublié sans changer la limite"""
+        self._refill(self.clock())
+        return self.tokens >= self.capacity
+
+    def try_take(self):
+        """Prend un jeton s'il y en a un ; retourne False sinon"""
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
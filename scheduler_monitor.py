@@ -0,0 +1,100 @@
+import time
+import logging
+import threading
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LATENESS_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+
+JOB_LATENESS = metrics.REGISTRY.histogram(
+    'waribiz_job_lateness_seconds', "Retard des publications automatiques par rapport à l'heure prévue", LATENESS_BUCKETS
+)
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LatenessMonitor:
+    """Suit le retard (heure effective - heure prévue) des publications automatiques.
+
+    L'heure effective est le début réel de la publication (place obtenue dans
+    la file de travail), pas le moment où le créneau quitte le calendrier.
+    """
+
+    def __init__(self, window=2000, per_user_window=50, alert_threshold_seconds=60, alert_cooldown_seconds=3600, clock=time.monotonic):
+        self.alert_threshold_seconds = alert_threshold_seconds
+        self.alert_cooldown_seconds = alert_cooldown_seconds
+        self.clock = clock
+        self.per_user_window = per_user_window
+        self._recent = deque(maxlen=window)
+        self._by_user = {}
+        self._last_alert = None
+        self._lock = threading.Lock()
+
+    def record(self, user_id, planned, actual):
+        """Enregistre une exécution (datetimes avec fuseau) et retourne le retard en secondes"""
+        lateness = max(0.0, (actual - planned).total_seconds())
+        user_id = str(user_id)
+        with self._lock:
+            self._recent.append(lateness)
+            samples = self._by_user.get(user_id)
+            if samples is None:
+                samples = self._by_user[user_id] = deque(maxlen=self.per_user_window)
+            samples.append(lateness)
+        JOB_LATENESS.observe(lateness)
+        if lateness >= self.alert_threshold_seconds:
+            logger.warning(f"Publication automatique en retard de {lateness:.1f}s pour l'utilisateur {user_id}")
+        return lateness
+
+    def samples(self):
+        """Retards (secondes) de la fenêtre glissante"""
+        with self._lock:
+            return list(self._recent)
+
+    def p99(self):
+        """p99 du retard sur la fenêtre glissante (None si aucune mesure)"""
+        with self._lock:
+            if not self._recent:
+                return None
+            return _quantile(self._recent, 0.99)
+
+    def slowest_users(self, limit=10):
+        """Utilisateurs triés par retard p95 décroissant : (user_id, p95, max, nombre de mesures)"""
+        with self._lock:
+            stats = [
+                (user_id, _quantile(samples, 0.95), max(samples), len(samples))
+                for user_id, samples in self._by_user.items() if samples
+            ]
+        stats.sort(key=lambda item: item[1], reverse=True)
+        return stats[:limit]
+
+    def alert_message(self):
+        """Texte d'alerte si le p99 dépasse le seuil (au plus une fois par période de silence)"""
+        p99 = self.p99()
+        if p99 is None or p99 < self.alert_threshold_seconds:
+            return None
+        now = self.clock()
+        with self._lock:
+            if self._last_alert is not None and now - self._last_alert < self.alert_cooldown_seconds:
+                return None
+            self._last_alert = now
+        slowest = ', '.join(f"{user_id} ({p95:.0f}s)" for user_id, p95, _, _ in self.slowest_users(5))
+        return (
+            f"⚠️ ALERTE: retard p99 des publications automatiques = {p99:.0f}s "
+            f"(seuil {self.alert_threshold_seconds:.0f}s).\nUtilisateurs les plus en retard: {slowest}"
+        )
+
+    def render_report(self, limit=10):
+        """Rapport lisible pour la commande /lateness"""
+        p99 = self.p99()
+        if p99 is None:
+            return "Aucune publication automatique mesurée pour le moment."
+        lines = [f"⏱️ Retard des publications automatiques\n\np99 global: {p99:.1f}s\n\nUtilisateurs les plus en retard:"]
+        for user_id, p95, worst, count in self.slowest_users(limit):
+            lines.append(f"• {user_id}: p95={p95:.1f}s max={worst:.1f}s (n={count})")
+        return '\n'.join(lines)
@@ -0,0 +1,55 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = metrics.REGISTRY.histogram('waribiz_startup_seconds', "Durée des phases de démarrage (imports, chargements, connexion Telegram)")
+
+
+class StartupProfile:
+    """Durées des phases de démarrage, pour /startup et --profile-startup.
+
+    Les phases peuvent se chevaucher (chargements dans des threads pendant
+    la connexion à Telegram) : le rapport donne chaque phase avec son début
+    relatif, et la durée totale mesurée de bout en bout.
+    """
+
+    def __init__(self, started_at=None, clock=time.perf_counter):
+        self.clock = clock
+        self.started_at = started_at if started_at is not None else clock()
+        self.ready_at = None
+        self.phases = []  # (nom, début relatif, durée, thread)
+        self._lock = threading.Lock()
+
+    def record(self, name, started, seconds):
+        with self._lock:
+            self.phases.append((name, started - self.started_at, seconds, threading.current_thread().name))
+        STARTUP_SECONDS.observe(seconds, phase=name)
+
+    @contextmanager
+    def phase(self, name):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, started, self.clock() - started)
+
+    def ready(self):
+        """Marque la fin du démarrage (le bot peut traiter les mises à jour)"""
+        self.ready_at = self.clock()
+        STARTUP_SECONDS.observe(self.ready_at - self.started_at, phase='total')
+        logger.info(f"Démarrage terminé en {(self.ready_at - self.started_at) * 1000:.0f} ms")
+
+    def report(self):
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+        lines = ["⏱️ Profil de démarrage\n"]
+        for name, offset, seconds, thread in phases:
+            lines.append(f"• {name}: {seconds * 1000:.0f} ms (à +{offset * 1000:.0f} ms, {thread})")
+        if self.ready_at is not None:
+            lines.append(f"\nPrêt en {(self.ready_at - self.started_at) * 1000:.0f} ms")
+        return '\n'.join(lines)
@@ -0,0 +1,136 @@
+import os
+import time
+import uuid
+import mimetypes
+
+# Taille des blocs lus sur disque : la mémoire par envoi en cours reste de cet ordre
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def _escape_quotes(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class MultipartFileStream:
+    """Corps multipart/form-data produit à la demande.
+
+    Les champs texte sont encodés d'avance (quelques centaines d'octets) ;
+    le fichier est lu par blocs au moment de l'envoi et fermé dès la fin de
+    la lecture ou à la fermeture du flux. Si <content> est fourni (image déjà
+    en mémoire), il est découpé en vues sans copie du tampon d'origine.
+    La longueur totale est connue, requests envoie donc un Content-Length
+    et non un corps « chunked ».
+    """
+
+    def __init__(self, fields, file_field, file_path, filename=None, content_type=None, chunk_size=DEFAULT_CHUNK_SIZE, content=None):
+        self.boundary = uuid.uuid4().hex
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self._content = memoryview(content) if content is not None else None
+        self._content_offset = 0
+        self.file_size = len(self._content) if content is not None else os.path.getsize(file_path)
+        self.started_at = None
+        self.finished_at = None
+        filename = filename or os.path.basename(file_path)
+        content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        head = []
+        for name, value in fields.items():
+            head.append(
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{_escape_quotes(name)}"\r\n\r\n'
+                f"{value}\r\n"
+            )
+        head.append(
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{_escape_quotes(file_field)}"; filename="{_escape_quotes(filename)}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        )
+        self._head = ''.join(head).encode('utf-8')
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode('utf-8')
+        self._length = len(self._head) + self.file_size + len(self._tail)
+        self._sections = [self._head, None, self._tail]  # None : contenu du fichier
+        self._file = None
+        self._buffer = memoryview(b'')
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._length
+
+    def _next_chunk(self):
+        """Bloc suivant du corps, ou b'' à la fin"""
+        if self.started_at is None:
+            self.started_at = time.perf_counter()
+        while self._sections:
+            section = self._sections[0]
+            if section is not None:
+                self._sections.pop(0)
+                return section
+            if self._content is not None:
+                chunk = self._content[self._content_offset:self._content_offset + self.chunk_size]
+                self._content_offset += len(chunk)
+            else:
+                if self._file is None:
+                    self._file = open(self.file_path, 'rb')
+                chunk = self._file.read(self.chunk_size)
+            if chunk:
+                return chunk
+            self._close_file()
+            self._sections.pop(0)
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+        return b''
+
+    def read(self, size=-1):
+        """Interface fichier utilisée par http.client pour envoyer le corps"""
+        if not self._buffer:
+            self._buffer = memoryview(self._next_chunk())
+        if size is None or size < 0 or size >= len(self._buffer):
+            data, self._buffer = self._buffer, memoryview(b'')
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data.tobytes()
+
+    def __iter__(self):
+        while True:
+            chunk = self.read()
+            if not chunk:
+                return
+            yield chunk
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        self._close_file()
+        self._sections = []
+        self._buffer = memoryview(b'')
+        self._content = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def post_file(url, fields, file_field, file_path, session=None, timeout=None, chunk_size=DEFAULT_CHUNK_SIZE, content=None):
+    """Envoie un fichier en multipart sans le charger en mémoire (ou depuis <content> s'il est déjà en cache).
+
+    Retourne (réponse, durée d'envoi du corps, durée d'attente de la réponse).
+    """
+    if session is None:
+        import requests as session
+    with MultipartFileStream(fields, file_field, file_path, chunk_size=chunk_size, content=content) as body:
+        response = session.post(
+            url, data=body, headers={'Content-Type': body.content_type}, timeout=timeout
+        )
+        received_at = time.perf_counter()
+        started_at = body.started_at or received_at
+        finished_at = body.finished_at or received_at
+        return response, finished_at - started_at, received_at - finished_at
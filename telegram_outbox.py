@@ -0,0 +1,244 @@
+import time
+import heapq
+import asyncio
+import logging
+import datetime
+import itertools
+from collections import deque
+
+from telegram.error import RetryAfter, BadRequest, NetworkError, TelegramError
+
+import metrics
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Intervalle minimal entre deux nettoyages des seaux par chat inactifs (secondes)
+BUCKET_SWEEP_SECONDS = 60
+
+OUTBOX_TOTAL = metrics.REGISTRY.counter('waribiz_telegram_outbox_total', "Messages sortants Telegram par résultat")
+
+
+class OutboundMessage:
+    __slots__ = ('chat_id', 'text', 'kwargs', 'attempts')
+
+    def __init__(self, chat_id, text, kwargs):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.attempts = 0
+
+
+class TelegramOutbox:
+    """File d'envoi des notifications Telegram.
+
+    Respecte une limite globale et une limite par chat (seaux à jetons),
+    attend le retry_after indiqué par Telegram en cas de 429, et peut
+    regrouper les confirmations d'auto-publication en un résumé périodique.
+    """
+
+    def __init__(self, global_rate=25, per_chat_rate=1, per_chat_burst=3, concurrency=8, max_retries=3, digest_interval_seconds=0):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.digest_interval_seconds = digest_interval_seconds
+        self.bot = None
+        self._concurrency = concurrency
+        self._semaphore = None
+        self._pending = {}  # chat_id -> deque de messages
+        self._chat_buckets = {}
+        self._next_sweep = 0.0
+        self._schedule = []  # tas (pas avant, séquence, chat_id) ; un chat n'y figure qu'une fois
+        self._scheduled = set()
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._tasks = []
+        self._inflight = set()
+        self._digests = {}  # chat_id -> (début, [(texte, résumé)])
+
+    # --- API publique ---
+
+    def send(self, bot, chat_id, text, **kwargs):
+        """Met un message en file d'envoi (le worker démarre au premier appel)"""
+        self._ensure_started(bot)
+        chat_id = str(chat_id)
+        self._pending.setdefault(chat_id, deque()).append(OutboundMessage(chat_id, text, kwargs))
+        self._schedule_chat(chat_id, time.monotonic())
+        OUTBOX_TOTAL.inc(result='queued')
+
+    def send_confirmation(self, bot, chat_id, text, summary=None):
+        """Confirmation d'auto-publication : regroupée dans le résumé si le mode digest est actif.
+
+        <summary> est la ligne affichée pour cette publication dans le résumé
+        (première ligne non vide du texte par défaut).
+        """
+        if not self.digest_interval_seconds:
+            self.send(bot, chat_id, text)
+            return
+        self._ensure_started(bot)
+        if summary is None:
+            summary = next((line.strip() for line in text.splitlines() if line.strip()), '')
+        started, entries = self._digests.setdefault(str(chat_id), (datetime.datetime.now(), []))
+        entries.append((text, summary))
+
+    def queue_size(self):
+        return sum(len(queue) for queue in self._pending.values())
+
+    async def stop(self, drain_timeout=5):
+        """Tente d'envoyer les messages en attente (résumés compris), puis arrête les workers"""
+        if self.bot is not None:
+            self.flush_digests()
+        deadline = time.monotonic() + drain_timeout
+        while (self._pending or self._inflight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        if self._pending:
+            logger.warning(f"{self.queue_size()} notification(s) Telegram non envoyée(s) à l'arrêt")
+
+    # --- Résumés ---
+
+    def flush_digests(self):
+        """Transforme les confirmations accumulées en un message de résumé par chat"""
+        digests, self._digests = self._digests, {}
+        for chat_id, (started, entries) in digests.items():
+            if len(entries) == 1:
+                self.send(self.bot, chat_id, entries[0][0])
+                continue
+            extracts = '\n'.join(f"• {summary[:80]}" for _, summary in entries[-5:])
+            self.send(
+                self.bot,
+                chat_id,
+                f"📬 Résumé: {len(entries)} publications automatiques réussies depuis {started.strftime('%H:%M')}.\n\n"
+                f"Dernières publications:\n{extracts}"
+            )
+
+    async def _digest_loop(self):
+        while True:
+            await asyncio.sleep(self.digest_interval_seconds)
+            self.flush_digests()
+
+    # --- Ordonnancement ---
+
+    def _ensure_started(self, bot):
+        if self.bot is None:
+            self.bot = bot
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+        loop = asyncio.get_running_loop()
+        self._tasks.append(loop.create_task(self._dispatch_loop()))
+        if self.digest_interval_seconds:
+            self._tasks.append(loop.create_task(self._digest_loop()))
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return bucket
+
+    def _evict_idle_buckets(self, now):
+        # Un seau plein d'un chat sans message en attente est recréé à l'identique au besoin
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + BUCKET_SWEEP_SECONDS
+        idle = [chat_id for chat_id, bucket in self._chat_buckets.items()
+                if chat_id not in self._pending and chat_id not in self._scheduled and bucket.full()]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+
+    def _schedule_chat(self, chat_id, not_before):
+        if chat_id in self._scheduled:
+            return
+        self._scheduled.add(chat_id)
+        heapq.heappush(self._schedule, (not_before, next(self._sequence), chat_id))
+        self._wakeup.set()
+
+    async def _sleep(self, seconds):
+        """Attend <seconds> ou un nouveau message, selon ce qui arrive en premier"""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch_loop(self):
+        while True:
+            if not self._schedule:
+                await self._sleep(None)
+                continue
+            now = time.monotonic()
+            self._evict_idle_buckets(now)
+            not_before, _, chat_id = self._schedule[0]
+            wait = max(not_before - now, self._paused_until - now, self.global_bucket.delay())
+            if wait > 0:
+                await self._sleep(wait)
+                continue
+
+            heapq.heappop(self._schedule)
+            self._scheduled.discard(chat_id)
+            queue = self._pending.get(chat_id)
+            if not queue:
+                self._pending.pop(chat_id, None)
+                continue
+            chat_bucket = self._chat_bucket(chat_id)
+            chat_wait = chat_bucket.delay()
+            if chat_wait > 0:
+                self._schedule_chat(chat_id, now + chat_wait)
+                continue
+
+            self.global_bucket.take()
+            chat_bucket.take()
+            message = queue.popleft()
+            if queue:
+                self._schedule_chat(chat_id, now + chat_bucket.delay())
+            else:
+                del self._pending[chat_id]
+            await self._semaphore.acquire()
+            task = asyncio.get_running_loop().create_task(self._deliver(message))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    def _requeue(self, message, delay):
+        self._pending.setdefault(message.chat_id, deque()).appendleft(message)
+        self._schedule_chat(message.chat_id, time.monotonic() + delay)
+
+    async def _deliver(self, message):
+        try:
+            with metrics.TELEGRAM_NOTIFY.time():
+                await self.bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+            OUTBOX_TOTAL.inc(result='sent')
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, datetime.timedelta):
+                retry_after = retry_after.total_seconds()
+            # Telegram demande de patienter : suspendre tous les envois
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            logger.warning(f"Limite Telegram atteinte, envois suspendus {retry_after}s")
+            self._retry(message, retry_after)
+        except BadRequest as e:
+            logger.error(f"Message Telegram refusé pour {message.chat_id}: {e}")
+            OUTBOX_TOTAL.inc(result='dropped')
+        except NetworkError as e:
+            logger.warning(f"Erreur réseau lors de l'envoi Telegram à {message.chat_id}: {e}")
+            self._retry(message, 2 ** message.attempts)
+        except TelegramError as e:
+            logger.error(f"Message Telegram abandonné pour {message.chat_id}: {e}")
+            OUTBOX_TOTAL.inc(result='dropped')
+        finally:
+            self._semaphore.release()
+
+    def _retry(self, message, delay):
+        message.attempts += 1
+        if message.attempts > self.max_retries:
+            logger.error(f"Message Telegram abandonné pour {message.chat_id} après {message.attempts} tentatives")
+            OUTBOX_TOTAL.inc(result='dropped')
+            return
+        OUTBOX_TOTAL.inc(result='retried')
+        self._requeue(message, delay)
@@ -0,0 +1,210 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Voies de la file : demandes des utilisateurs (« Publier maintenant ») et publications automatiques
+INTERACTIVE, BACKGROUND = 'interactive', 'background'
+
+QUEUE_WAIT = metrics.REGISTRY.histogram('waribiz_work_queue_wait_seconds', "Attente d'une place dans la file de travail, par voie")
+QUEUE_GRANTED_TOTAL = metrics.REGISTRY.counter('waribiz_work_granted_total', "Travail attribué par la file (en unités de coût), par voie")
+
+# Quota par défaut d'un utilisateur : (poids, tâches simultanées au plus)
+DEFAULT_QUOTA = (1.0, 2)
+# Poids plancher : un poids nul bloquerait l'utilisateur (et le tourniquet)
+MIN_WEIGHT = 0.01
+# Parts de fond oubliées : en dessous de ce travail attribué (décru), l'utilisateur sort de shares()
+MIN_GRANTED = 0.01
+# Nettoyage des parts oubliées toutes les PRUNE_EVERY attributions
+PRUNE_EVERY = 1024
+
+
+class _Tenant:
+    """Tâches de fond en attente d'un utilisateur et son crédit (deficit round robin)"""
+
+    def __init__(self):
+        self.waiting = deque()  # (future, coût)
+        self.deficit = 0.0
+        self.credited = False
+
+
+class WorkQueue:
+    """File de travail à deux voies pour la génération et la publication.
+
+    Au plus <capacity> tâches s'exécutent à la fois. Dès qu'une place se
+    libère, elle revient à la plus ancienne demande interactive ; la voie de
+    fond n'est servie qu'ensuite, et jamais sur les <reserved> dernières
+    places : une demande interactive n'attend pas la fin d'une vague de
+    publications automatiques qui occuperait tout.
+
+    La voie de fond partage les places entre utilisateurs par deficit round
+    robin : à son tour, un utilisateur reçoit un crédit de <quantum> × son
+    poids et passe ses tâches tant que le crédit couvre leur coût (pages
+    visées), puis cède la main. Un utilisateur qui publie souvent sur de
+    nombreuses pages n'obtient ainsi que sa part, et jamais plus de ses
+    tâches simultanées autorisées. <quotas>(user_id) retourne (poids,
+    tâches simultanées) ; DEFAULT_QUOTA sinon.
+
+    Les parts affichées par shares() décroissent avec une demi-vie de
+    <share_half_life> secondes : elles reflètent l'activité récente et les
+    utilisateurs inactifs en sortent.
+
+    Une tâche commencée n'est pas interrompue : la priorité s'applique à
+    l'attribution des places. capacity=0 : pas de limite (ni file ni priorité).
+    Toutes les méthodes s'exécutent dans la boucle asyncio.
+    """
+
+    def __init__(self, capacity, reserved=1, quantum=1.0, quotas=None, share_half_life=3600.0, clock=time.perf_counter):
+        self.capacity = capacity
+        # Au moins une place reste ouverte à la voie de fond
+        self.reserved = max(0, min(reserved, capacity - 1))
+        self.quantum = quantum
+        self.quotas = quotas or (lambda user_id: DEFAULT_QUOTA)
+        self.share_half_life = share_half_life
+        self.clock = clock
+        self._interactive = deque()
+        self._background = OrderedDict()  # user_id -> _Tenant, dans l'ordre de passage
+        self._running = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._tenant_running = {}  # user_id -> tâches de fond en cours
+        self._granted = {}  # user_id -> [coût attribué dans la voie de fond (décru), instant]
+        self._grants = 0
+
+    def running(self, lane=None):
+        return self._running[lane] if lane else sum(self._running.values())
+
+    def waiting(self, lane):
+        if lane == INTERACTIVE:
+            return sum(1 for waiter in self._interactive if not waiter.done())
+        return sum(1 for tenant in self._background.values() for waiter, _ in tenant.waiting if not waiter.done())
+
+    def shares(self):
+        """Part récente de la voie de fond attribuée à chaque utilisateur (voir share_half_life).
+
+        Retourne [(user_id, part, poids, en cours, en attente)], les plus
+        grosses parts d'abord.
+        """
+        now = self.clock()
+        self._prune(now)
+        granted = {user_id: self._decayed(entry, now) for user_id, entry in self._granted.items()}
+        total = sum(granted.values()) or 1.0
+        users = set(granted) | set(self._background)
+        rows = []
+        for user_id in users:
+            tenant = self._background.get(user_id)
+            waiting = sum(1 for waiter, _ in tenant.waiting if not waiter.done()) if tenant else 0
+            rows.append((user_id, granted.get(user_id, 0.0) / total, self.quotas(user_id)[0],
+                         self._tenant_running.get(user_id, 0), waiting))
+        return sorted(rows, key=lambda row: row[1], reverse=True)
+
+    def _decayed(self, entry, now):
+        granted, stamp = entry
+        return granted * 0.5 ** ((now - stamp) / self.share_half_life)
+
+    def _grant(self, user_id, cost):
+        now = self.clock()
+        entry = self._granted.get(user_id)
+        self._granted[user_id] = [(self._decayed(entry, now) if entry else 0.0) + cost, now]
+        self._grants += 1
+        if self._grants % PRUNE_EVERY == 0:
+            self._prune(now)
+
+    def _prune(self, now):
+        # Oublie les utilisateurs inactifs dont la part a décru sous MIN_GRANTED
+        for user_id in [user_id for user_id, entry in self._granted.items()
+                        if self._decayed(entry, now) < MIN_GRANTED and user_id not in self._tenant_running]:
+            del self._granted[user_id]
+
+    @asynccontextmanager
+    async def slot(self, lane, user_id, cost=1):
+        """Attend une place dans la voie <lane> et la garde pendant le bloc (<cost> : pages visées)"""
+        if not self.capacity:
+            yield
+            return
+        user_id = str(user_id)
+        waiter = asyncio.get_running_loop().create_future()
+        enqueued = self.clock()
+        if lane == INTERACTIVE:
+            self._interactive.append(waiter)
+        else:
+            self._background.setdefault(user_id, _Tenant()).waiting.append((waiter, max(cost, 1)))
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Place attribuée mais jamais utilisée : la rendre (une attente annulée est ignorée au dépilement)
+            if waiter.done() and not waiter.cancelled():
+                self._release(lane, user_id)
+            raise
+        QUEUE_WAIT.observe(self.clock() - enqueued, lane=lane)
+        QUEUE_GRANTED_TOTAL.inc(max(cost, 1), lane=lane)
+        try:
+            yield
+        finally:
+            self._release(lane, user_id)
+
+    def _release(self, lane, user_id):
+        self._running[lane] -= 1
+        if lane == BACKGROUND:
+            self._tenant_running[user_id] -= 1
+            if not self._tenant_running[user_id]:
+                del self._tenant_running[user_id]
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.running() < self.capacity:
+            lane, waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self._running[lane] += 1
+            waiter.set_result(None)
+
+    def _next_waiter(self):
+        while self._interactive:
+            waiter = self._interactive.popleft()
+            if not waiter.done():
+                return INTERACTIVE, waiter
+        if self._running[BACKGROUND] >= self.capacity - self.reserved:
+            return None, None
+        waiter = self._next_background()
+        return (BACKGROUND, waiter) if waiter is not None else (None, None)
+
+    def _next_background(self):
+        # Utilisateurs passés sans résultat parce qu'ils ont atteint leur quota de tâches simultanées
+        blocked = 0
+        while self._background and blocked < len(self._background):
+            user_id, tenant = next(iter(self._background.items()))
+            while tenant.waiting and tenant.waiting[0][0].done():
+                tenant.waiting.popleft()
+            if not tenant.waiting:
+                del self._background[user_id]
+                continue
+            weight, max_running = self.quotas(user_id)
+            if self._tenant_running.get(user_id, 0) >= max(1, max_running):
+                tenant.credited = False
+                self._background.move_to_end(user_id)
+                blocked += 1
+                continue
+            if not tenant.credited:
+                tenant.deficit += self.quantum * max(weight, MIN_WEIGHT)
+                tenant.credited = True
+            waiter, cost = tenant.waiting[0]
+            if cost > tenant.deficit:
+                # Crédit insuffisant : il s'accumule jusqu'au prochain tour
+                tenant.credited = False
+                self._background.move_to_end(user_id)
+                blocked = 0
+                continue
+            tenant.waiting.popleft()
+            tenant.deficit -= cost
+            if not tenant.waiting:
+                # File vide : le crédit non utilisé est perdu
+                del self._background[user_id]
+            self._tenant_running[user_id] = self._tenant_running.get(user_id, 0) + 1
+            self._grant(user_id, cost)
+            return waiter
+        return None